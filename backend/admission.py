@@ -0,0 +1,119 @@
+import asyncio
+import math
+import os
+import threading
+import time
+
+from scheduler import DeadlineExceeded
+
+# Per-expert admission control. Each expert's bulkhead reports how many
+# requests are waiting and running, and the gate keeps a moving average of the
+# expert's service time, so a request that cannot finish within the SLO (or its
+# own deadline) is turned away before it joins the queue. One whose deadline
+# passes while queued is dropped by the scheduler before any compute is spent.
+ADMISSION_SLO_SECONDS = float(os.environ.get("CCRAS_ADMISSION_SLO", "15"))
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("CCRAS_REQUEST_DEADLINE", "15"))  # frontend aborts at 15s
+INITIAL_SERVICE_SECONDS = 1.0
+EWMA_ALPHA = 0.2
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, reason, retry_after):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def deadline_from_headers(headers, default=DEFAULT_DEADLINE_SECONDS):
+    """Absolute deadline (epoch seconds) from the X-Request-Timeout header, in seconds."""
+    timeout = default
+    raw = headers.get(DEADLINE_HEADER)
+    if raw:
+        try:
+            timeout = max(0.0, float(raw))
+        except ValueError:
+            pass
+    return time.time() + timeout
+
+
+class ExpertAdmission:
+    def __init__(self, name, pool, slo=ADMISSION_SLO_SECONDS):
+        self.name = name
+        self.pool = pool
+        self.slo = slo
+        self.service_time = INITIAL_SERVICE_SECONDS
+        self.counters = {"admitted": 0, "rejected_queue_full": 0, "rejected_slo": 0,
+                         "expired": 0, "completed": 0}
+        self._lock = threading.Lock()
+
+    def estimated_wait(self):
+        return (self.pool.depth() + self.pool.busy) * self.service_time / self.pool.workers
+
+    def admit(self, deadline):
+        """Check the expert can take one more request, or raise AdmissionRejected
+        with a Retry-After hint."""
+        with self._lock:
+            wait = self.estimated_wait()
+            retry_after = max(1, math.ceil(wait))
+            if not self.pool.has_capacity():
+                self.counters["rejected_queue_full"] += 1
+                raise AdmissionRejected(429, f"{self.name} queue is full ({self.pool.depth()} waiting)", retry_after)
+
+            budget = min(self.slo, deadline - time.time())
+            if wait + self.service_time > budget:
+                self.counters["rejected_slo"] += 1
+                raise AdmissionRejected(
+                    503, f"{self.name} estimated wait {wait:.1f}s exceeds budget {budget:.1f}s", retry_after)
+
+            self.counters["admitted"] += 1
+
+    async def run(self, deadline, priority, fn, *args, tenant=None, weight=1.0):
+        """Queue fn on the expert's bulkhead in the given priority lane and await
+        it. If the caller goes away (client disconnect) before the work starts,
+        the queued item is cancelled so no compute is spent on it."""
+        def execute():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.counters["completed"] += 1
+                    self.service_time += EWMA_ALPHA * (elapsed - self.service_time)
+
+        future = self.pool.submit(priority, deadline, execute, tenant=tenant, weight=weight)
+        try:
+            return await asyncio.wrap_future(future)
+        except DeadlineExceeded:
+            with self._lock:
+                self.counters["expired"] += 1
+            raise
+        finally:
+            future.cancel()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "queued": self.pool.depth(),
+                "running": self.pool.busy,
+                "workers": self.pool.workers,
+                "maxQueue": self.pool.max_queue,
+                "sloSeconds": self.slo,
+                "serviceTimeSeconds": round(self.service_time, 4),
+                "estimatedWaitSeconds": round(self.estimated_wait(), 4),
+                **self.counters,
+            }
+
+
+class AdmissionController:
+    def __init__(self, bulkheads):
+        self.experts = {name: ExpertAdmission(name, pool) for name, pool in bulkheads.pools.items()}
+
+    def __getitem__(self, name):
+        return self.experts[name]
+
+    def snapshot(self):
+        return {name: gate.snapshot() for name, gate in self.experts.items()}
@@ -0,0 +1,276 @@
+"""
+Per-stage micro-benchmarks for the inference path.
+
+Times every stage a scan goes through for each expert (upload read, decode,
+_preprocess_image, the forward pass at several batch sizes, coding lookup,
+format_response, render_response and save_upload_file), reports p50/p95/p99
+latency, throughput and memory, and writes the results as JSON so runs can
+be compared. Memory per stage is the peak Python heap (tracemalloc), the
+peak tensor bytes (torch.profiler allocation events) and the change in
+process RSS over one run; tracemalloc cannot see tensor storage, so only
+the tensor figure is meaningful for preprocess and forward.
+
+    python benchmark.py --experts knee,ct --iterations 50
+    python benchmark.py --output bench_results/baseline.json
+    python benchmark.py --baseline bench_results/baseline.json --fail-on-regression
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+import main
+import memory_diag
+from model_factory import models, orchestrator, TORCH_AVAILABLE
+
+if TORCH_AVAILABLE:
+    import torch
+
+BATCH_SIZES = [1, 2, 4, 8, 16]
+DEFAULT_RESULTS_DIR = "bench_results"
+REGRESSION_THRESHOLD = 0.10
+MIN_COMPARABLE_MS = 0.05  # sub-50us stages are timer noise, not regressions
+
+
+class BenchUpload:
+    """UploadFile stand-in backed by a spooled temp file, as Starlette uses."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        self.file.write(data)
+        self.file.seek(0)
+
+
+def sample_image(size=1024):
+    """In-memory grayscale JPEG used when no --image is given."""
+    buffer = io.BytesIO()
+    img = Image.new("L", (size, size))
+    img.putdata([(x * y) % 256 for y in range(size) for x in range(size)])
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentile(sorted_values, q):
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def max_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def measure(fn, iterations, warmup, items=1):
+    """Times fn over `iterations` runs, then measures memory on extra runs
+    (tracemalloc, then the torch profiler) so tracing does not skew the
+    timings."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss_before = memory_diag.process_memory()["rssBytes"]
+    if TORCH_AVAILABLE:
+        tensor_peak = memory_diag.profiled_peak(fn)
+    else:
+        fn()
+        tensor_peak = None
+    rss_after = memory_diag.process_memory()["rssBytes"]
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "items": items,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 4),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 4),
+        "throughput_per_s": round(iterations * items / total, 2) if total else None,
+        "peak_py_alloc_bytes": peak,
+        "peak_tensor_bytes": tensor_peak,
+        "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+    }
+
+
+def forward_stage(expert, upload, data, batch_size):
+    """The forward pass alone: real model on a pre-built batch tensor when one
+    is loaded, otherwise whichever simulated backend the expert would use."""
+    if TORCH_AVAILABLE and expert.model is not None:
+        batch = expert._preprocess_image(upload).repeat(batch_size, 1, 1, 1)
+
+        def run():
+            with torch.no_grad():
+                expert.model(batch)
+        return run
+
+    backend = expert.synthetic or expert.mock
+    payloads = [data] * batch_size
+    return lambda: backend.predict(payloads)
+
+
+def bench_expert(key, data, args):
+    expert = models[key]
+    upload = BenchUpload("bench.jpg", data)
+    stages = {}
+
+    def read():
+        upload.file.seek(0)
+        upload.file.read()
+        upload.file.seek(0)
+
+    stages["upload_read"] = measure(read, args.iterations, args.warmup)
+    if PIL_AVAILABLE:
+        stages["decode"] = measure(lambda: Image.open(io.BytesIO(data)).convert("RGB"),
+                                   args.iterations, args.warmup)
+    if TORCH_AVAILABLE:
+        stages["preprocess"] = measure(lambda: expert._preprocess_image(upload), args.iterations, args.warmup)
+
+    for n in args.batch_sizes:
+        iterations = max(3, args.iterations // n)
+        stages[f"forward_b{n}"] = measure(forward_stage(expert, upload, data, n), iterations,
+                                          min(args.warmup, 2), items=n)
+
+    stages["coding"] = measure(lambda: expert._build_result(0, 0.95), args.iterations, args.warmup)
+
+    result = orchestrator.run_inference(upload, main.SCAN_TYPES[key])
+    stages["format_response"] = measure(lambda: main.format_response(result, "/static/bench.jpg"),
+                                        args.iterations, args.warmup)
+    stages["render_response"] = measure(lambda: main.prediction_renderer.render(result, "/static/bench.jpg"),
+                                        args.iterations, args.warmup)
+
+    def save():
+        upload.file.seek(0)
+        main.store_upload_file(upload)
+    stages["save_upload_file"] = measure(save, args.iterations, args.warmup)
+
+    backend = "synthetic" if expert.synthetic else ("torch" if expert.model is not None else "mock")
+    return {"architecture": expert.architecture, "backend": backend, "stages": stages}
+
+
+def compare(results, baseline, threshold):
+    """Prints p50 deltas against a baseline run; returns the regressed stages."""
+    regressions = []
+    print(f"\n{'expert':<8}{'stage':<20}{'base p50':>12}{'p50':>12}{'delta':>10}")
+    for key, expert in results["experts"].items():
+        base_expert = baseline.get("experts", {}).get(key)
+        if not base_expert:
+            continue
+        for stage, stats in expert["stages"].items():
+            base = base_expert["stages"].get(stage)
+            if not base or base["p50_ms"] < MIN_COMPARABLE_MS:
+                continue
+            delta = (stats["p50_ms"] - base["p50_ms"]) / base["p50_ms"]
+            flag = "  REGRESSION" if delta > threshold else ""
+            print(f"{key:<8}{stage:<20}{base['p50_ms']:>12.3f}{stats['p50_ms']:>12.3f}{delta:>+9.1%}{flag}")
+            if flag:
+                regressions.append(f"{key}/{stage}")
+    return regressions
+
+
+def print_report(results):
+    for key, expert in results["experts"].items():
+        print(f"\n== {key} ({expert['architecture']}, {expert['backend']} backend) ==")
+        print(f"{'stage':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>12}"
+              f"{'py peak':>14}{'tensor peak':>14}{'rss delta':>14}")
+        for stage, s in expert["stages"].items():
+            print(f"{stage:<20}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}"
+                  f"{s['throughput_per_s'] or 0:>12.1f}{s['peak_py_alloc_bytes']:>14,}"
+                  f"{_bytes(s.get('peak_tensor_bytes')):>14}{_bytes(s.get('rss_delta_bytes')):>14}")
+    print(f"\nProcess peak RSS over the whole run: {_bytes(results.get('max_rss_bytes'))}")
+
+
+def _bytes(value):
+    return "-" if value is None else f"{value:,}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CCRAS per-stage inference benchmarks")
+    parser.add_argument("--experts", default=",".join(models.keys()),
+                        help="comma-separated expert keys (default: all)")
+    parser.add_argument("--image", help="image file to benchmark with (default: generated 1024px JPEG)")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--output", help="where to write JSON results (default: bench_results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="p50 slowdown counted as a regression (default 0.10)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+    args.batch_sizes = [int(n) for n in args.batch_sizes.split(",") if n]
+    return args
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.image:
+        with open(args.image, "rb") as f:
+            data = f.read()
+    elif PIL_AVAILABLE:
+        data = sample_image()
+    else:
+        print("[!] Pillow is not installed; pass --image.")
+        return 2
+
+    with tempfile.TemporaryDirectory() as static_dir:
+        main.STATIC_DIR = static_dir  # keep benchmark uploads out of backend/static
+        results = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__ if TORCH_AVAILABLE else None,
+            "cpu_count": os.cpu_count(),
+            "image_bytes": len(data),
+            "experts": {key: bench_expert(key, data, args)
+                        for key in args.experts.split(",") if key in models},
+        }
+        results["max_rss_bytes"] = max_rss_bytes()  # lifetime peak of this process, not per stage
+
+    print_report(results)
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n[+] Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"[!] {len(regressions)} stage(s) regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            if args.fail_on_regression:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
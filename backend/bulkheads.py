@@ -0,0 +1,108 @@
+import json
+import os
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+from log_config import get_logger
+from scheduler import PriorityScheduler
+
+# Per-expert bulkheads: every expert gets its own worker threads, its own
+# priority queue and its own share of the node's cores, so a burst of Swin-B
+# CT scans saturates the CT pool only and cheap knee requests keep flowing.
+#
+# torch's intra-op thread count is process-wide (set_num_threads from any
+# thread applies to all of them), so it is set once and a core budget is
+# enforced through concurrency instead: an expert with cpu_share s runs at
+# most s * cores // intra-op threads forward passes at a time. By default the
+# intra-op count is the smallest expert's budget, so that expert gets one
+# full-width worker and larger shares get proportionally more workers.
+# CCRAS_INTRA_OP_THREADS overrides it, an explicit "workers" overrides the
+# derived count, and any field can be set with CCRAS_BULKHEADS, e.g.
+# '{"ct": {"cpu_share": 0.4, "max_queue": 4}}'.
+BULKHEAD_CONFIG = {
+    "knee": {"cpu_share": 0.3, "max_queue": 16},
+    "chest": {"cpu_share": 0.3, "max_queue": 16},
+    "mri": {"cpu_share": 0.15, "max_queue": 16},
+    "ct": {"cpu_share": 0.25, "max_queue": 8},
+}
+DEFAULT_BULKHEAD = {"cpu_share": 0.25, "max_queue": 16}
+INTRA_OP_THREADS = int(os.environ.get("CCRAS_INTRA_OP_THREADS", "0"))  # 0 = smallest expert budget
+
+log = get_logger("bulkheads")
+
+
+def load_bulkhead_config():
+    config = {name: dict(values) for name, values in BULKHEAD_CONFIG.items()}
+    raw = os.environ.get("CCRAS_BULKHEADS")
+    if raw:
+        try:
+            for name, values in json.loads(raw).items():
+                config.setdefault(name, dict(DEFAULT_BULKHEAD)).update(values)
+        except (ValueError, AttributeError) as e:
+            log.warning("Ignoring invalid CCRAS_BULKHEADS: %s", e)
+    return config
+
+
+def intra_op_threads(shares, cores=None):
+    """Intra-op threads per forward pass: the smallest expert's core budget,
+    unless CCRAS_INTRA_OP_THREADS sets it."""
+    if INTRA_OP_THREADS > 0:
+        return INTRA_OP_THREADS
+    cores = cores or os.cpu_count() or 1
+    return max(1, int(cores * min(shares, default=1.0)))
+
+
+def share_workers(cpu_share, threads, cores=None):
+    """Concurrent forward passes that fit in an expert's core budget."""
+    cores = cores or os.cpu_count() or 1
+    return max(1, int(cores * cpu_share) // threads)
+
+
+class Bulkheads:
+    def __init__(self, experts, config=None):
+        config = config or load_bulkhead_config()
+        self.config = {name: {**DEFAULT_BULKHEAD, **config.get(name, {})} for name in experts}
+        for name, settings in self.config.items():
+            if not 0 < settings["cpu_share"] <= 1:
+                raise ValueError(f"cpu_share for {name} must be in (0, 1], got {settings['cpu_share']}")
+        shares = [cfg["cpu_share"] for cfg in self.config.values()]
+        if sum(shares) > 1.0 + 1e-9:
+            log.warning("Bulkhead cpu_share values add up to more than the node",
+                        extra={"total": round(sum(shares), 3)})
+        self.threads = intra_op_threads(shares)
+        self.pools = {}
+        for name, settings in self.config.items():
+            settings.setdefault("workers", share_workers(settings["cpu_share"], self.threads))
+            self.pools[name] = PriorityScheduler(
+                workers=settings["workers"],
+                name=name,
+                max_queue=settings["max_queue"],
+            )
+
+    def __getitem__(self, name):
+        return self.pools[name]
+
+    def submit(self, expert, priority, deadline, fn, *args, **kwargs):
+        return self.pools[expert].submit(priority, deadline, fn, *args, **kwargs)
+
+    def start(self):
+        if TORCH_AVAILABLE:
+            torch.set_num_threads(self.threads)
+        log.info("Torch intra-op threads set", extra={"threads": self.threads})
+        for name, pool in self.pools.items():
+            pool.start()
+            cfg = self.config[name]
+            log.info("Bulkhead started", extra={"expert": name, "cpuShare": cfg["cpu_share"], "workers": cfg["workers"],
+                                                "maxQueue": cfg["max_queue"]})
+
+    def stop(self):
+        for pool in self.pools.values():
+            pool.stop()
+
+    def snapshot(self):
+        return {name: {**pool.snapshot(), "cpuShare": self.config[name]["cpu_share"],
+                       "intraOpThreads": self.threads} for name, pool in self.pools.items()}
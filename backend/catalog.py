@@ -0,0 +1,534 @@
+"""
+On-disk clinical catalog.
+
+Complete ICD-10/ICD-11/AYUSH code sets are too large to keep as a Python
+literal in every worker, so they are compiled into a read-only SQLite file:
+one zlib-compressed JSON row per record (with a preset dictionary sampled
+from the set, so even small records compress several-fold) plus an
+(index, key) -> record table for every terminology index. Workers open it
+lazily, read-only, and share it through the OS page cache. Versions live
+side by side in CATALOG_DIR and are never rewritten; the CURRENT pointer
+file names the active one and is replaced atomically, so publishing a new
+version never disturbs readers (which reopen within CATALOG_CHECK_SECONDS).
+
+    python catalog.py build --source icd_ayush.json --version 2026.10
+    python catalog.py build --synthetic 50000       # capacity testing
+    python catalog.py info
+"""
+import argparse
+import collections
+import contextlib
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+
+from log_config import get_logger
+from metrics import CACHE_REQUESTS
+
+CATALOG_DIR = os.getenv("CCRAS_CATALOG_DIR", "catalog")
+CURRENT_POINTER = "CURRENT"
+CATALOG_CHECK_SECONDS = float(os.getenv("CCRAS_CATALOG_CHECK_SECONDS", "2"))
+CATALOG_CACHE_SIZE = int(os.getenv("CCRAS_CATALOG_CACHE", "4096"))
+KEEP_VERSIONS = 3
+LOOKUP_BATCH = 500           # keys per IN (...) query in lookup_many
+SCHEMA_VERSION = 1
+DICTIONARY_SAMPLE = 200      # records sampled into the shared zlib dictionary
+DICTIONARY_BYTES = 16 * 1024
+
+log = get_logger("catalog")
+
+
+class FrozenDict(dict):
+    """A dict that refuses mutation, so records can be shared across
+    requests and threads. Still a dict, so it JSON-serializes as one."""
+    __slots__ = ("derived",)  # per-record values cached by the terminology store
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("terminology records are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def normalize_term(value):
+    """Case-folded, NFC-normalized, whitespace-collapsed lookup key."""
+    return " ".join(unicodedata.normalize("NFC", str(value)).casefold().split())
+
+
+def normalize_code(value):
+    return str(value).strip().upper()
+
+
+# index name -> (key normalizer, paths into a record whose values are indexed)
+TERMINOLOGY_INDEXES = {
+    "name": (normalize_term, [("nameEnglish",)]),
+    "icd10": (normalize_code, [("who_icd10", "code")]),
+    "icd11": (normalize_code, [("who_icd11", "code"), ("who_icd11", "entityId")]),
+    "institutional": (normalize_code, [("institutionalEntry", "code")]),
+    "ayurveda": (normalize_term, [("ayurveda", "term"), ("institutionalEntry", "nameTerm"),
+                                  ("institutionalEntry", "nameDevnagari")]),
+    "siddha": (normalize_term, [("siddha", "term"), ("siddha", "word"), ("siddha", "code")]),
+    "unani": (normalize_term, [("unani", "word"), ("unani", "arabicTerm"), ("unani", "code")]),
+}
+
+
+def field(record, path):
+    value = record
+    for part in path:
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def index_keys(record):
+    """Yields the distinct (index, normalized key) pairs a record is found under."""
+    seen = set()
+    for name, (normalize, paths) in TERMINOLOGY_INDEXES.items():
+        for path in paths:
+            value = field(record, path)
+            if value in (None, ""):
+                continue
+            pair = (name, normalize(value))
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+
+
+INDEX_IDS = {name: i for i, name in enumerate(TERMINOLOGY_INDEXES)}
+
+
+def _encode(entry):
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# --- BUILD & PUBLISH ---
+
+def build_catalog(entries, version=None, catalog_dir=CATALOG_DIR):
+    """Compiles entries into a new versioned SQLite file and publishes it as
+    CURRENT. Returns the path of the new version. Readers keep immutable
+    connections and only reopen when the version changes, so an existing
+    version is never rebuilt in place."""
+    os.makedirs(catalog_dir, exist_ok=True)
+    if version is None:
+        version = stamp = time.strftime("%Y%m%d-%H%M%S")
+        for n in itertools.count(2):
+            if not os.path.exists(os.path.join(catalog_dir, f"clinical-{version}.sqlite")):
+                break
+            version = f"{stamp}-{n}"
+    filename = f"clinical-{version}.sqlite"
+    path = os.path.join(catalog_dir, filename)
+    if os.path.exists(path):
+        raise FileExistsError(f"Catalog version {version} already exists in {catalog_dir}; "
+                              "publish the change under a new version")
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE dictionary (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE records (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE keys (idx INTEGER NOT NULL, key TEXT NOT NULL, record_id INTEGER NOT NULL,
+                               PRIMARY KEY (idx, key, record_id)) WITHOUT ROWID;
+        """)
+        entries = iter(entries)
+        sample = list(itertools.islice(entries, DICTIONARY_SAMPLE))
+        zdict = b"".join(_encode(entry) for entry in sample)[-DICTIONARY_BYTES:]
+        conn.execute("INSERT INTO dictionary VALUES (1, ?)", (zdict,))
+        count = 0
+        for record_id, entry in enumerate(itertools.chain(sample, entries), start=1):
+            packer = zlib.compressobj(9, zdict=zdict)
+            conn.execute("INSERT INTO records VALUES (?, ?)",
+                         (record_id, packer.compress(_encode(entry)) + packer.flush()))
+            conn.executemany("INSERT INTO keys VALUES (?, ?, ?)",
+                             [(INDEX_IDS[name], key, record_id) for name, key in index_keys(entry)])
+            count = record_id
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", version), ("schema", str(SCHEMA_VERSION)), ("records", str(count)),
+            ("created", time.strftime("%Y-%m-%dT%H:%M:%S")),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    publish(filename, catalog_dir)
+    prune(catalog_dir)
+    return path
+
+
+def publish(filename, catalog_dir=CATALOG_DIR):
+    """Atomically points CURRENT at a catalog file in catalog_dir."""
+    pointer = os.path.join(catalog_dir, CURRENT_POINTER)
+    tmp = pointer + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(filename + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+
+
+def current_catalog(catalog_dir=CATALOG_DIR):
+    """Path of the published catalog, or None when none has been built."""
+    try:
+        with open(os.path.join(catalog_dir, CURRENT_POINTER), "r", encoding="utf-8") as f:
+            filename = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(catalog_dir, filename)
+    return path if filename and os.path.exists(path) else None
+
+
+def prune(catalog_dir=CATALOG_DIR, keep=KEEP_VERSIONS):
+    """Deletes all but the newest `keep` versions, never the published one."""
+    active = current_catalog(catalog_dir)
+    versions = sorted((os.path.join(catalog_dir, f) for f in os.listdir(catalog_dir)
+                       if f.startswith("clinical-") and f.endswith(".sqlite")), key=os.path.getmtime)
+    for path in versions[:-keep]:
+        if path != active:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # still open on Windows; removed on a later build
+
+
+def read_version(version, catalog_dir=CATALOG_DIR):
+    """Records of a retained catalog version (published or not) as plain
+    dicts, or None when that version has been pruned or never existed."""
+    if not version or "/" in version or "\\" in version or ".." in version:
+        return None
+    path = os.path.join(catalog_dir, f"clinical-{version}.sqlite")
+    if not os.path.exists(path):
+        return None
+    return _read_file(path)
+
+
+def _read_file(path):
+    with contextlib.closing(sqlite3.connect(ClinicalCatalog._uri(path), uri=True)) as conn:
+        zdict = conn.execute("SELECT data FROM dictionary WHERE id = 1").fetchone()[0]
+        for (data,) in conn.execute("SELECT data FROM records ORDER BY id"):
+            unpacker = zlib.decompressobj(zdict=zdict)
+            yield json.loads(unpacker.decompress(data) + unpacker.flush())
+
+
+# --- READ SIDE ---
+
+class ClinicalCatalog:
+    """Lazily opened, read-only view of the published catalog. Each thread
+    gets its own SQLite connection; lookups go through a bounded LRU of
+    frozen records that is dropped whenever a new version is published."""
+
+    def __init__(self, catalog_dir=CATALOG_DIR, cache_size=CATALOG_CACHE_SIZE):
+        self.catalog_dir = catalog_dir
+        self.cache_size = cache_size
+        self.path = None
+        self.generation = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        self._pointer_mtime = None
+        self._current = None  # (path, generation, zdict), replaced as one on a version swap
+        self._version = None
+        self._checked_at = 0.0
+        self._hits = CACHE_REQUESTS.labels("catalog", "hit")
+        self._misses = CACHE_REQUESTS.labels("catalog", "miss")
+
+    @staticmethod
+    def available(catalog_dir=CATALOG_DIR):
+        return current_catalog(catalog_dir) is not None
+
+    def _check(self):
+        """Reopens on a newly published version, at most every CATALOG_CHECK_SECONDS."""
+        now = time.monotonic()
+        if self.path is not None and now - self._checked_at < CATALOG_CHECK_SECONDS:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(os.path.join(self.catalog_dir, CURRENT_POINTER)).st_mtime_ns
+            except OSError:
+                mtime = None
+            if self.path is not None and mtime == self._pointer_mtime:
+                return
+            path = current_catalog(self.catalog_dir)
+            if path is None:
+                raise FileNotFoundError(f"No clinical catalog published in {self.catalog_dir}")
+            self._pointer_mtime = mtime
+            if path != self.path:
+                with contextlib.closing(sqlite3.connect(self._uri(path), uri=True)) as conn:
+                    zdict = conn.execute("SELECT data FROM dictionary WHERE id = 1").fetchone()[0]
+                    self._version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+                self.path = path
+                self.generation += 1
+                self._current = (path, self.generation, zdict)
+                self._cache.clear()
+
+    @property
+    def version(self):
+        self._check()
+        return self._version
+
+    def _conn(self):
+        """(connection, generation, zdict) of one catalog version. A query and
+        the decoding of its rows must use the same handle, since a new version
+        can be published between them."""
+        self._check()
+        path, generation, zdict = self._current
+        local = self._local
+        if getattr(local, "generation", None) != generation:
+            if getattr(local, "conn", None) is not None:
+                local.conn.close()
+            local.conn = sqlite3.connect(self._uri(path), uri=True, check_same_thread=False)
+            local.generation = generation
+        return local.conn, generation, zdict
+
+    @staticmethod
+    def _uri(path):
+        return "file:" + os.path.abspath(path).replace("\\", "/") + "?mode=ro&immutable=1"
+
+    @staticmethod
+    def _decode(data, zdict):
+        unpacker = zlib.decompressobj(zdict=zdict)
+        return freeze(json.loads(unpacker.decompress(data) + unpacker.flush()))
+
+    def lookup(self, index, key):
+        """Records under an already-normalized key, as a tuple of frozen dicts."""
+        conn, generation, zdict = self._conn()
+        cache_key = (index, key)
+        with self._lock:
+            found = self._cache.get(cache_key)
+            if found is not None:
+                self._cache.move_to_end(cache_key)
+        if found is not None:
+            self._hits.inc()
+            return found
+        self._misses.inc()
+        rows = conn.execute(
+            "SELECT r.data FROM keys k JOIN records r ON r.id = k.record_id "
+            "WHERE k.idx = ? AND k.key = ? ORDER BY r.id", (INDEX_IDS[index], key)).fetchall()
+        found = tuple(self._decode(data, zdict) for (data,) in rows)
+        with self._lock:
+            # A version published mid-query has already cleared the cache;
+            # these records belong to the old one and must not be added to it
+            if generation == self.generation:
+                self._cache[cache_key] = found
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return found
+
+    def lookup_many(self, index, keys):
+        """{key: records} for many normalized keys, one query per LOOKUP_BATCH
+        keys, as frozen records like lookup(). Bypasses the LRU so bulk jobs
+        do not evict the inference path's hot keys; keys with no records are
+        left out."""
+        conn, _, zdict = self._conn()
+        keys = list(keys)
+        found, decoded = {}, {}
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            chunk = keys[start:start + LOOKUP_BATCH]
+            rows = conn.execute(
+                "SELECT k.key, r.id, r.data FROM keys k JOIN records r ON r.id = k.record_id "
+                f"WHERE k.idx = ? AND k.key IN ({','.join('?' * len(chunk))}) ORDER BY r.id",
+                (INDEX_IDS[index], *chunk))
+            for key, record_id, data in rows:
+                record = decoded.get(record_id)
+                if record is None:
+                    record = decoded[record_id] = self._decode(data, zdict)
+                found[key] = found.get(key, ()) + (record,)
+        return found
+
+    def iter_records(self, batch=1000):
+        """Streams every record in id order without loading the whole set.
+        Uses its own connection, so the scan stays on one version even if a
+        new one is published (and this thread reconnects) meanwhile."""
+        self._check()
+        path, _, zdict = self._current
+        with contextlib.closing(sqlite3.connect(self._uri(path), uri=True, check_same_thread=False)) as conn:
+            cursor = conn.execute("SELECT data FROM records ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    return
+                for (data,) in rows:
+                    yield self._decode(data, zdict)
+
+    def info(self):
+        conn, _, _ = self._conn()
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "version": meta.get("version"),
+            "records": int(meta.get("records", 0)),
+            "created": meta.get("created"),
+            "sizeBytes": os.path.getsize(self.path),
+            "cachedKeys": len(self._cache),
+        }
+
+
+class VersionedBuild:
+    """A structure derived from the served terminology (search index, range
+    index, snapshot, ...) and rebuilt when a new catalog version is published.
+    Only the first build makes callers wait. After a swap the previous build
+    keeps being served while the new one is built on a background thread,
+    then the reference is replaced in one assignment."""
+
+    def __init__(self, terminology, build, name):
+        self.terminology = terminology
+        self.build = build  # version -> object with a .version attribute
+        self.name = name
+        self._current = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = self.terminology.version
+        current = self._current
+        if current is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self.build(version)
+                return self._current
+        if current.version != version:
+            self._rebuild()
+        return current
+
+    def _rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _run(self):
+        try:
+            version = self.terminology.version
+            if self._current.version != version:
+                self._current = self.build(version)
+        except Exception:
+            # The previous build stays in service; the next call retries
+            log.error("Rebuild after a catalog swap failed", extra={"build": self.name}, exc_info=True)
+        finally:
+            self._rebuilding = False
+
+    def warm(self):
+        threading.Thread(target=self.get, name=self.name, daemon=True).start()
+
+
+# --- SYNTHETIC CATALOG (capacity testing) ---
+
+def synthetic_entries(count, seed=0):
+    """Catalog-shaped records with plausible code and multilingual term
+    distributions, for sizing the catalog and search at full-set scale."""
+    rng = random.Random(seed)
+    chapters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    syllables = ["vata", "pitta", "kapha", "roga", "shula", "jvara", "granthi", "sandhi", "rakta", "shotha"]
+    devanagari = "कखगघचछजझटठडढतथदधनपफबभमयरलवशसह"
+    tamil = "கஙசஞடணதநபமயரலவழளறன"
+    arabic = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+    words = ["acute", "chronic", "primary", "secondary", "disorder", "syndrome", "lesion", "infection",
+             "degeneration", "neoplasm", "of", "knee", "lung", "brain", "spine", "liver", "heart", "skin"]
+    for n in range(1, count + 1):
+        chapter = chapters[n % len(chapters)]
+        block_start = (n // 50) % 90
+        code = f"{chapter}{block_start:02d}.{n % 10}"
+        name = " ".join(rng.choice(words) for _ in range(rng.randint(2, 4))).capitalize() + f" {n}"
+        term = "-".join(rng.choice(syllables) for _ in range(2)).capitalize()
+        yield {
+            "srNo": n,
+            "nameEnglish": name,
+            "severity": rng.choice(["Normal", "Mild", "Moderate", "Severe"]),
+            "institutionalEntry": {
+                "code": 1000 + n // 3,
+                "nameDevnagari": "".join(rng.choice(devanagari) for _ in range(rng.randint(3, 7))),
+                "nameTerm": term,
+                "description": f"{name}. Institutional entry {n}.",
+            },
+            "ayurveda": {"term": term, "description": f"{term} pattern described for {name.lower()}."},
+            "siddha": {"code": f"S{n}", "term": term.replace("-", " "),
+                       "word": "".join(rng.choice(tamil) for _ in range(rng.randint(3, 7))),
+                       "translation": name},
+            "unani": {"code": f"U{n}", "word": term.replace("-", ""),
+                      "arabicTerm": "".join(rng.choice(arabic) for _ in range(rng.randint(3, 7))),
+                      "translation": name, "description": name},
+            "who_icd10": {"chapter": chapter, "block": f"{chapter}{block_start:02d}-{chapter}{block_start + 9:02d}",
+                          "code": code, "word": name},
+            "who_icd11": {"entityId": str(100000000 + n), "code": f"{rng.randint(1, 9)}{chapter}{n % 100:02d}.{n % 10}",
+                          "term": name, "description": f"{name} (ICD-11)"},
+        }
+
+
+def load_entries(source):
+    """Reads a JSON array or JSON-lines file of catalog records."""
+    with open(source, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        f.seek(0)
+        if head == "[":
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the CCRAS clinical catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="compile and publish a new catalog version")
+    build.add_argument("--source", help="JSON array or JSON-lines file of records "
+                                        "(default: the built-in clinicalDatabase)")
+    build.add_argument("--synthetic", type=int, metavar="N", help="generate N synthetic records instead")
+    build.add_argument("--seed", type=int, default=0)
+    build.add_argument("--version")
+    build.add_argument("--dir", default=CATALOG_DIR)
+    info = sub.add_parser("info", help="show the published catalog")
+    info.add_argument("--dir", default=CATALOG_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        if not ClinicalCatalog.available(args.dir):
+            print(f"[!] No catalog published in {args.dir}")
+            return 1
+        print(json.dumps(ClinicalCatalog(args.dir).info(), indent=2))
+        return 0
+
+    if args.synthetic:
+        entries = synthetic_entries(args.synthetic, args.seed)
+    elif args.source:
+        entries = load_entries(args.source)
+    else:
+        from gemini_service import clinicalDatabase
+        entries = clinicalDatabase
+    started = time.perf_counter()
+    try:
+        path = build_catalog(entries, args.version, args.dir)
+    except FileExistsError as e:
+        print(f"[!] {e}")
+        return 1
+    print(f"[+] Published {path} ({os.path.getsize(path):,} bytes) in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
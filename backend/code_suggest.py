@@ -0,0 +1,242 @@
+"""
+Free-text report -> ICD/AYUSH code suggestions.
+
+Legacy radiology reports carry no structured label, so they are matched
+against the catalog's own descriptions: the English name, ICD-10/ICD-11
+terms, institutionalEntry.description and ayurveda.description of every
+record are vectorised into a TF-IDF matrix once per catalog version. Reports
+are scored in batches by sparse matrix products against that matrix and the
+top-k records per report are returned with their codes. Everything runs
+locally on numpy; nothing leaves the node.
+
+    python code_suggest.py reports.txt -k 5 > suggestions.ndjson
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from catalog import VersionedBuild, field
+from log_config import get_logger
+from terminology_mapping import mapping
+
+DOCUMENT_FIELDS = [
+    ("nameEnglish",),
+    ("who_icd10", "word"),
+    ("who_icd11", "term"),
+    ("who_icd11", "description"),
+    ("institutionalEntry", "description"),
+    ("ayurveda", "description"),
+]
+MAX_DF = 0.5           # terms in more than half the catalog carry no signal
+# Terms in more than this share of the catalog are left out of candidate
+# generation (their postings dominate the product) but still count when the
+# candidates are rescored exactly.
+CANDIDATE_MAX_DF = float(os.getenv("CCRAS_SUGGEST_CANDIDATE_MAX_DF", "0.01"))
+CANDIDATE_MAX_DF_FLOOR = 200   # small catalogs use every term for candidates
+CANDIDATES = 50        # candidates per report rescored exactly
+BLOCK_REPORTS = 32     # reports scored per matrix product
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 50
+MIN_SCORE = 0.05
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the there this to was were which with
+""".split())
+_TOKEN = re.compile(r"[a-z][a-z0-9]+")
+
+log = get_logger("code_suggest")
+
+
+def terms(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _weights(tokens):
+    """Sublinear term frequencies {term: 1 + log(tf)}."""
+    counts = {}
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    return {token: 1.0 + math.log(n) for token, n in counts.items()}
+
+
+class SuggestionIndex:
+    """TF-IDF matrix of the catalog. Candidates come from a product over the
+    postings of the selective terms a report contains; the candidates are
+    then rescored exactly over every term, so common words still weigh in
+    without their long postings being scanned."""
+
+    def __init__(self, records, version=None):
+        started = time.perf_counter()
+        self.version = version
+        self.records = []
+        documents = []
+        for record in records:
+            text = " ".join(str(v) for v in (field(record, path) for path in DOCUMENT_FIELDS) if v)
+            self.records.append(mapping(record))
+            documents.append(_weights(terms(text)))
+
+        n_docs = len(documents)
+        df = {}
+        for doc in documents:
+            for token in doc:
+                df[token] = df.get(token, 0) + 1
+        max_df = max(1, int(MAX_DF * n_docs))
+        self.vocabulary = {t: i for i, t in enumerate(sorted(t for t, n in df.items() if n <= max_df))}
+        self.idf = np.array([math.log((1 + n_docs) / (1 + df[t])) + 1.0 for t in self.vocabulary],
+                            dtype=np.float32)
+
+        # Row-wise (document -> terms) CSR of the full matrix, and column-wise
+        # (term -> documents) postings of the selective terms only
+        doc_ptr, doc_terms, doc_weights = [0], [], []
+        for doc in documents:
+            entries = [(self.vocabulary[t], w) for t, w in doc.items() if t in self.vocabulary]
+            weights = [w * float(self.idf[j]) for j, w in entries]
+            norm = math.sqrt(sum(w * w for w in weights)) or 1.0
+            doc_terms.extend(j for j, _ in entries)
+            doc_weights.extend(w / norm for w in weights)
+            doc_ptr.append(len(doc_terms))
+        self.doc_ptr = np.array(doc_ptr, dtype=np.int64)
+        self.doc_terms = np.array(doc_terms, dtype=np.int32)
+        self.doc_weights = np.array(doc_weights, dtype=np.float32)
+
+        doc_ids = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(self.doc_ptr))
+        term_df = np.bincount(self.doc_terms, minlength=len(self.vocabulary))
+        selective = term_df[self.doc_terms] <= max(CANDIDATE_MAX_DF_FLOOR, int(CANDIDATE_MAX_DF * n_docs))
+        order = np.argsort(self.doc_terms[selective], kind="stable")
+        self.docs = doc_ids[selective][order]
+        self.weights = self.doc_weights[selective][order]
+        self.ptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.doc_terms[selective], minlength=len(self.vocabulary)), out=self.ptr[1:])
+        self.n_docs = n_docs
+        self.build_seconds = time.perf_counter() - started
+
+    def _vectorise(self, reports):
+        """Query CSR (row, column, weight) arrays for a block of reports."""
+        rows, cols, vals = [], [], []
+        for i, report in enumerate(reports):
+            entries = [(self.vocabulary[t], w) for t, w in _weights(terms(report)).items() if t in self.vocabulary]
+            if not entries:
+                continue
+            weights = [w * float(self.idf[j]) for j, w in entries]
+            norm = math.sqrt(sum(w * w for w in weights))
+            for (j, _), w in zip(entries, weights):
+                rows.append(i)
+                cols.append(j)
+                vals.append(w / norm)
+        return (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64),
+                np.array(vals, dtype=np.float32))
+
+    @staticmethod
+    def _expand(ptr, ids):
+        """Concatenated ranges ptr[i]:ptr[i + 1] for every i in ids, plus
+        their lengths, as flat index arrays."""
+        starts = ptr[ids]
+        lengths = ptr[ids + 1] - starts
+        total = int(lengths.sum())
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return offsets + np.arange(total), lengths
+
+    def _candidates(self, rows, cols, vals, n_reports, count):
+        """Top `count` documents per report by the product over selective
+        terms: every (report, term) pair is expanded over the term's postings
+        and summed per (report, document) with one bincount."""
+        postings, lengths = self._expand(self.ptr, cols)
+        keys = np.repeat(rows, lengths) * self.n_docs + self.docs[postings]
+        products = np.repeat(vals, lengths) * self.weights[postings]
+        scores = np.bincount(keys, weights=products, minlength=n_reports * self.n_docs)
+        scores = scores.reshape(n_reports, self.n_docs)
+        return np.argpartition(-scores, count - 1, axis=1)[:, :count]
+
+    def _rescore(self, rows, cols, vals, n_reports, candidates):
+        """Exact cosine of each candidate: its full row dotted with the
+        report's dense query vector."""
+        query = np.zeros((n_reports, len(self.vocabulary)), dtype=np.float32)
+        query[rows, cols] = vals
+        flat = candidates.ravel()
+        postings, lengths = self._expand(self.doc_ptr, flat)
+        owners = np.repeat(np.arange(flat.size), lengths)
+        report_of = owners // candidates.shape[1]
+        products = self.doc_weights[postings] * query[report_of, self.doc_terms[postings]]
+        return np.bincount(owners, weights=products, minlength=flat.size).reshape(candidates.shape)
+
+    def suggest(self, reports, k=DEFAULT_TOP_K, min_score=MIN_SCORE):
+        if self.n_docs == 0:
+            return [[] for _ in reports]
+        k = max(1, min(k, MAX_TOP_K, self.n_docs))
+        count = min(max(k, CANDIDATES), self.n_docs)
+        results = []
+        for start in range(0, len(reports), BLOCK_REPORTS):
+            block = reports[start:start + BLOCK_REPORTS]
+            rows, cols, vals = self._vectorise(block)
+            candidates = self._candidates(rows, cols, vals, len(block), count)
+            scores = self._rescore(rows, cols, vals, len(block), candidates)
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            top = np.take_along_axis(candidates, order, axis=1)
+            top_scores = np.take_along_axis(scores, order, axis=1)
+            for doc_ids, row_scores in zip(top.tolist(), top_scores.tolist()):
+                results.append([{"score": round(score, 4), **self.records[doc]}
+                                for doc, score in zip(doc_ids, row_scores) if score >= min_score])
+        return results
+
+
+class CodeSuggester:
+    """Holds the suggestion index for the terminology version currently
+    served, rebuilding it in the background when a new catalog version is
+    published."""
+
+    def __init__(self, terminology):
+        self.terminology = terminology
+        self._index = VersionedBuild(terminology, self._build, "ccras-suggest-index")
+
+    def _build(self, version):
+        index = SuggestionIndex(self.terminology.iter_records(), version)
+        log.info("Code suggestion index built", extra={
+            "version": version, "records": index.n_docs, "terms": len(index.vocabulary),
+            "nonzeros": len(index.doc_terms), "buildSeconds": round(index.build_seconds, 3)})
+        return index
+
+    def index(self):
+        return self._index.get()
+
+    def warm(self):
+        self._index.warm()
+
+    def suggest(self, reports, k=DEFAULT_TOP_K):
+        started = time.perf_counter()
+        index = self.index()
+        suggestions = index.suggest(reports, k)
+        return {
+            "version": index.version,
+            "tookMs": round((time.perf_counter() - started) * 1000, 3),
+            "suggestions": suggestions,
+        }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Suggest ICD/AYUSH codes for free-text reports")
+    parser.add_argument("reports", help="text file with one report per line ('-' for stdin)")
+    parser.add_argument("-k", type=int, default=DEFAULT_TOP_K, help="suggestions per report")
+    args = parser.parse_args(argv)
+
+    from gemini_service import terminology
+    source = sys.stdin if args.reports == "-" else open(args.reports, "r", encoding="utf-8")
+    with source:
+        reports = [line.strip() for line in source if line.strip()]
+    index = CodeSuggester(terminology).index()
+    started = time.perf_counter()
+    for start in range(0, len(reports), 1000):
+        chunk = reports[start:start + 1000]
+        for report, suggestions in zip(chunk, index.suggest(chunk, args.k)):
+            print(json.dumps({"report": report, "suggestions": suggestions}, ensure_ascii=False))
+    elapsed = time.perf_counter() - started
+    print(f"{len(reports)} reports in {elapsed:.2f}s ({len(reports) / max(elapsed, 1e-9):.0f}/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
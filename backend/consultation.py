@@ -0,0 +1,236 @@
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+
+import httpx
+
+from log_config import get_logger
+from metrics import LLM_CONSULTATIONS
+
+# Server-side proxy for the LLM second opinions shown next to the local
+# prediction. The browser used to send every scan to Gemini twice (the
+# institutional and the MedGemma prompt) with the API key in the bundle and
+# no rate control; here the key stays on the node and each answer is cached
+# by (image hash, prompt, model). A consultation already in flight is shared
+# by every identical caller, upstream calls are capped at LLM_CONCURRENCY
+# and retried with jittered exponential backoff on 429, 5xx and transport
+# errors. LLM_ENDPOINT is any service speaking the Gemini generateContent
+# REST shape; llm_stub_server.py is one for local runs.
+LLM_ENDPOINT = os.environ.get("CCRAS_LLM_ENDPOINT", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+LLM_API_KEY = os.environ.get("CCRAS_LLM_API_KEY", "")
+LLM_MODEL = os.environ.get("CCRAS_LLM_MODEL", "gemini-3-pro-preview")
+LLM_CONCURRENCY = int(os.environ.get("CCRAS_LLM_CONCURRENCY", "4"))
+LLM_RETRIES = int(os.environ.get("CCRAS_LLM_RETRIES", "3"))
+LLM_BACKOFF_SECONDS = float(os.environ.get("CCRAS_LLM_BACKOFF", "0.5"))
+LLM_MAX_BACKOFF_SECONDS = 8.0
+LLM_TIMEOUT_SECONDS = float(os.environ.get("CCRAS_LLM_TIMEOUT", "60"))
+LLM_CACHE_SIZE = int(os.environ.get("CCRAS_LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("CCRAS_LLM_CACHE_TTL", "86400"))
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+SCAN_TYPES = ("chest-xray", "knee-xray", "mri-brain", "ct-scan")
+PROMPTS = {
+    # Evidence-based medicine and clinical guidelines
+    "medgemma": (
+        "Analyze as MedGemma Expert (Medical-Gemma fine-tuned model).\n"
+        "Scan Type: {scan_type}.\n"
+        "Focus: Clinical signs, differential diagnosis, and medical necessity.\n"
+        "Structure: JSON with {{ prediction, confidence, reasoning }}."
+    ),
+    # Institutional standards and AYUSH integration
+    "gemini": (
+        "Analyze as CCRAS Institutional Consultant.\n"
+        "Scan Type: {scan_type}.\n"
+        "Focus: Radiological findings, ICD-10 codes, and AYUSH (Ayurveda) mapping.\n"
+        "Structure: JSON with {{ prediction, confidence, icdCode, ayurCode, reasoning, clinical_info }}."
+    ),
+}
+
+log = get_logger("consultation")
+
+
+class UnknownConsultation(ValueError):
+    pass
+
+
+class ConsultationFailed(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_prompts(value):
+    """Prompt names from a comma list; every prompt when empty."""
+    if not value:
+        return list(PROMPTS)
+    names = list(dict.fromkeys(p.strip() for p in value.split(",") if p.strip()))
+    unknown = [p for p in names if p not in PROMPTS]
+    if unknown:
+        raise UnknownConsultation(f"Unknown prompts: {', '.join(unknown)}")
+    return names
+
+
+def _retry_after(response):
+    try:
+        return min(float(response.headers.get("retry-after", "")), LLM_MAX_BACKOFF_SECONDS)
+    except ValueError:
+        return None
+
+
+def _answer(response):
+    """The JSON object the model returned, or {"raw": text} when it is not JSON."""
+    try:
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        text = "".join(part.get("text", "") for part in parts)
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        raise ConsultationFailed("LLM response carried no candidate text")
+    try:
+        answer = json.loads(text)
+    except ValueError:
+        return {"raw": text}
+    return answer if isinstance(answer, dict) else {"raw": answer}
+
+
+class ConsultationService:
+    def __init__(self, endpoint=LLM_ENDPOINT, model=LLM_MODEL, api_key=LLM_API_KEY,
+                 concurrency=LLM_CONCURRENCY, retries=LLM_RETRIES, cache_size=LLM_CACHE_SIZE,
+                 cache_ttl=LLM_CACHE_TTL_SECONDS, transport=None):
+        self.endpoint = endpoint.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.retries = retries
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._transport = transport
+        self._client = None
+        self._semaphore = None
+        self._cache = OrderedDict()   # key -> (expires at, answer)
+        self._inflight = {}           # key -> asyncio.Task
+        self._counters = {result: {name: LLM_CONSULTATIONS.labels(name, result) for name in PROMPTS}
+                          for result in ("hit", "shared", "upstream", "retry", "error")}
+
+    def _http(self):
+        # Created on first use so the client and semaphore bind to the serving loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=LLM_TIMEOUT_SECONDS, transport=self._transport)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, answer = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return answer
+
+    def _store(self, key, answer):
+        self._cache[key] = (time.monotonic() + self.cache_ttl, answer)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _generate(self, name, prompt, image_b64, mime_type):
+        """One generateContent call, retried on throttling and transient failures."""
+        client = self._http()
+        url = f"{self.endpoint}/models/{self.model}:generateContent"
+        headers = {"x-goog-api-key": self.api_key} if self.api_key else {}
+        payload = {
+            "contents": [{"parts": [{"inlineData": {"data": image_b64, "mimeType": mime_type}},
+                                    {"text": prompt}]}],
+            "generationConfig": {"responseMimeType": "application/json"},
+        }
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                async with self._semaphore:
+                    response = await client.post(url, json=payload, headers=headers)
+                if response.status_code < 400:
+                    return _answer(response)
+                if response.status_code not in RETRY_STATUSES:
+                    raise ConsultationFailed(f"LLM endpoint returned {response.status_code}", response.status_code)
+                error = ConsultationFailed(f"LLM endpoint returned {response.status_code}", response.status_code)
+                delay = _retry_after(response)
+            except httpx.TransportError as e:
+                error = ConsultationFailed(f"LLM endpoint unreachable: {e.__class__.__name__}")
+            except httpx.HTTPError as e:
+                # Not transient (bad URL, redirect loop, ...); every sharing caller gets a clean failure
+                raise ConsultationFailed(f"LLM request failed: {e.__class__.__name__}: {e}")
+            if attempt == self.retries:
+                raise error
+            if delay is None:
+                delay = min(LLM_BACKOFF_SECONDS * 2 ** attempt, LLM_MAX_BACKOFF_SECONDS) * random.uniform(0.5, 1.5)
+            self._counters["retry"][name].inc()
+            log.warning("Retrying LLM consultation", extra={
+                "prompt": name, "attempt": attempt + 1, "status": error.status, "delaySeconds": round(delay, 3)})
+            await asyncio.sleep(delay)
+
+    async def _consult_one(self, name, scan_type, image_hash, mime_type, encoded):
+        prompt = PROMPTS[name].format(scan_type=scan_type)
+        key = (image_hash, hashlib.sha256(prompt.encode("utf-8")).hexdigest(), self.model)
+        answer = self._cached(key)
+        if answer is not None:
+            self._counters["hit"][name].inc()
+            return {"answer": answer, "cached": True}
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._generate(name, prompt, encoded(), mime_type))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self._counters["upstream"][name].inc()
+            started = time.perf_counter()
+            shared = False
+        else:
+            self._counters["shared"][name].inc()
+            shared = True
+        try:
+            # Shielded so one caller hanging up does not cancel the shared call
+            answer = await asyncio.shield(task)
+        except ConsultationFailed as e:
+            self._counters["error"][name].inc()
+            return {"error": str(e)}
+        if not shared:
+            log.info("LLM consultation complete", extra={
+                "prompt": name, "model": self.model, "scanType": scan_type,
+                "seconds": round(time.perf_counter() - started, 3)})
+        return {"answer": answer, "cached": False, "shared": shared}
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self._store(key, task.result())
+
+    async def consult(self, image, scan_type, prompts=None, mime_type="image/jpeg"):
+        """Answers for each prompt about one image, run concurrently. A
+        failed prompt carries an "error" instead of an "answer"."""
+        if scan_type not in SCAN_TYPES:
+            raise UnknownConsultation(f"Unknown scan type '{scan_type}'")
+        names = prompts or list(PROMPTS)
+        image_hash = hashlib.sha256(image).hexdigest()
+        # Encoded at most once, and only if some prompt has to go upstream
+        encoded = functools.lru_cache(maxsize=1)(lambda: base64.b64encode(image).decode("ascii"))
+        results = await asyncio.gather(*(self._consult_one(name, scan_type, image_hash, mime_type, encoded)
+                                         for name in names))
+        return {"model": self.model, "imageSha256": image_hash, "scanType": scan_type,
+                "consultations": dict(zip(names, results))}
+
+    def info(self):
+        return {"endpoint": self.endpoint, "model": self.model, "concurrency": self.concurrency,
+                "retries": self.retries, "cached": len(self._cache), "cacheSize": self.cache_size,
+                "inflight": len(self._inflight)}
@@ -0,0 +1,143 @@
+import bisect
+import time
+
+from catalog import VersionedBuild, field, normalize_code
+from log_config import get_logger
+
+# ICD-10 <-> ICD-11 <-> AYUSH crosswalk.
+#
+# Every code system is already a terminology index, so a point query from any
+# system is a hash probe (or one indexed catalog lookup) followed by a
+# projection of the matching records onto the requested systems; the same
+# records serve both directions. ICD-10 ranges are answered from a sorted
+# array of the distinct codes (bisect, O(log n + k)), and blocks and chapters
+# from hash maps to their codes. Only the code strings are held here, so the
+# full catalog stays on disk.
+SYSTEMS = {
+    # system -> (terminology index, path of the code in a record)
+    "icd10": ("icd10", ("who_icd10", "code")),
+    "icd11": ("icd11", ("who_icd11", "code")),
+    "institutional": ("institutional", ("institutionalEntry", "code")),
+    "ayurveda": ("ayurveda", ("ayurveda", "term")),
+    "siddha": ("siddha", ("siddha", "code")),
+    "unani": ("unani", ("unani", "code")),
+}
+MAX_RANGE_CODES = 1000
+
+log = get_logger("crosswalk")
+
+
+class UnknownCodeSystem(Exception):
+    pass
+
+
+def parse_systems(value):
+    """Target systems from a comma list; all systems when empty."""
+    if not value:
+        return list(SYSTEMS)
+    systems = [s for s in value.split(",") if s]
+    unknown = [s for s in systems if s not in SYSTEMS]
+    if unknown:
+        raise UnknownCodeSystem(f"Unknown code systems: {', '.join(unknown)}")
+    return systems
+
+
+class Icd10Ranges:
+    """Sorted ICD-10 codes plus block and chapter maps for one catalog version."""
+
+    def __init__(self, records, version=None):
+        started = time.perf_counter()
+        self.version = version
+        codes, blocks, chapters = set(), {}, {}
+        for record in records:
+            icd10 = record.get("who_icd10") or {}
+            code = icd10.get("code")
+            if not code:
+                continue
+            code = normalize_code(code)
+            codes.add(code)
+            if icd10.get("block"):
+                blocks.setdefault(normalize_code(icd10["block"]), set()).add(code)
+            if icd10.get("chapter"):
+                chapters.setdefault(normalize_code(icd10["chapter"]), set()).add(code)
+        self.codes = sorted(codes)
+        self.blocks = {k: tuple(sorted(v)) for k, v in blocks.items()}
+        self.chapters = {k: tuple(sorted(v)) for k, v in chapters.items()}
+        self.build_seconds = time.perf_counter() - started
+
+    def between(self, start=None, end=None):
+        """Codes from start to end inclusive; an end of 'M19' includes 'M19.9'."""
+        lo = bisect.bisect_left(self.codes, normalize_code(start)) if start else 0
+        hi = (bisect.bisect_left(self.codes, normalize_code(end) + "\U0010ffff")
+              if end else len(self.codes))
+        return self.codes[lo:hi]
+
+    def block(self, block):
+        """Codes in a block such as 'M15-M19'; blocks the catalog does not
+        name are read as a start-end range."""
+        key = normalize_code(block)
+        if key in self.blocks:
+            return list(self.blocks[key])
+        start, _, end = key.partition("-")
+        return self.between(start, end or start) if start else []
+
+    def chapter(self, chapter):
+        return list(self.chapters.get(normalize_code(chapter), ()))
+
+
+class Crosswalk:
+    def __init__(self, terminology):
+        self.terminology = terminology
+        self._ranges = VersionedBuild(terminology, self._build, "ccras-crosswalk-index")
+
+    def _build(self, version):
+        ranges = Icd10Ranges(self.terminology.iter_records(), version)
+        log.info("ICD-10 range index built", extra={
+            "version": version, "codes": len(ranges.codes), "blocks": len(ranges.blocks),
+            "chapters": len(ranges.chapters), "buildSeconds": round(ranges.build_seconds, 3)})
+        return ranges
+
+    def ranges(self):
+        return self._ranges.get()
+
+    def warm(self):
+        self._ranges.warm()
+
+    @staticmethod
+    def _project(records, targets):
+        """Per-record codes in every target system, plus the distinct codes
+        per system (one-to-many mappings keep every target)."""
+        matches, distinct = [], {system: {} for system in targets}
+        for record in records:
+            codes = {}
+            for system in targets:
+                code = field(record, SYSTEMS[system][1])
+                codes[system] = code
+                if code not in (None, ""):
+                    distinct[system][code] = None
+            matches.append({"srNo": record.get("srNo"), "nameEnglish": record.get("nameEnglish"),
+                            "icd10Block": field(record, ("who_icd10", "block")),
+                            "icd10Chapter": field(record, ("who_icd10", "chapter")), "codes": codes})
+        return {"matches": matches, "targets": {system: list(codes) for system, codes in distinct.items()}}
+
+    def translate(self, system, code, targets):
+        if system not in SYSTEMS:
+            raise UnknownCodeSystem(f"Unknown code system '{system}'")
+        records = self.terminology.lookup(SYSTEMS[system][0], code)
+        return {"system": system, "code": code, "version": self.terminology.version,
+                **self._project(records, targets)}
+
+    def icd10_range(self, targets, start=None, end=None, block=None, chapter=None, limit=MAX_RANGE_CODES):
+        ranges = self.ranges()
+        if chapter:
+            codes = ranges.chapter(chapter)
+        elif block:
+            codes = ranges.block(block)
+        else:
+            codes = ranges.between(start, end)
+        limit = max(1, min(limit, MAX_RANGE_CODES))
+        selected = codes[:limit]
+        found = self.terminology.lookup_many("icd10", selected)
+        records = [record for code in selected for record in found.get(code, ())]
+        return {"codes": selected, "totalCodes": len(codes), "truncated": len(codes) > limit,
+                "version": ranges.version, **self._project(records, targets)}
@@ -1,6 +1,9 @@
 import os
 import json
 
+from metrics import CACHE_REQUESTS
+from catalog import ClinicalCatalog, TERMINOLOGY_INDEXES, index_keys, freeze, read_version
+
 # Clinical Database with Severity Levels
 clinicalDatabase = [
     {
@@ -245,41 +248,94 @@ clinicalDatabase = [
     }
 ]
 
-def get_clinical_entry(diagnosis: str):
-    """Find diagnosis in clinical database"""
-    for entry in clinicalDatabase:
-        if diagnosis.lower() == entry["nameEnglish"].lower():
-            return entry
-    return None
+ICD_FALLBACK = freeze({
+    "icd_code": "R50.9",
+    "description": "Unable to classify",
+    "confidence": 0.0,
+    "severity": "Unknown",
+    "source": "fallback"
+})
 
-def get_icd_codes_from_gemini(diagnosis: str, scan_type: str):
-    """Return ICD codes from hardcoded database"""
-    entry = get_clinical_entry(diagnosis)
-    
-    if entry:
+AYURVEDA_FALLBACK = freeze({
+    "ayurveda_code": "Unknown",
+    "ayurveda_description": "Unable to classify",
+    "severity": "Unknown",
+    "siddha": {},
+    "unani": {},
+    "who_icd10": {},
+    "who_icd11": {},
+    "full_entry": {}
+})
+
+
+# Stands in for the query string in a shared ICD payload; see icd_codes()
+_QUERY = object()
+
+
+class TerminologyStore:
+    """Hash indexes over the clinical database. Every index maps a normalized
+    key to a tuple of frozen records (institutional codes, for one, are shared
+    by several grades), so lookups are a normalization plus one dict probe and
+    callers receive shared, read-only records. The ICD and AYUSH payloads
+    returned to the inference path are derived once per record."""
+
+    def __init__(self, entries):
+        self.records = tuple(freeze(entry) for entry in entries)
+        self.indexes = {name: {} for name in TERMINOLOGY_INDEXES}
+        for record in self.records:
+            for name, key in index_keys(record):
+                self.indexes[name][key] = self.indexes[name].get(key, ()) + (record,)
+        self._hits = CACHE_REQUESTS.labels("terminology", "hit")
+        self._misses = CACHE_REQUESTS.labels("terminology", "miss")
+
+    def _find(self, index, key):
+        return self.indexes[index].get(key, ())
+
+    def lookup(self, index, value):
+        """All records whose `index` field matches value; () when none do."""
+        normalize, _ = TERMINOLOGY_INDEXES[index]
+        found = self._find(index, normalize(value))
+        (self._hits if found else self._misses).inc()
+        return found
+
+    def lookup_many(self, index, values):
+        """{value: records} for the values that match, for bulk callers."""
+        normalize, _ = TERMINOLOGY_INDEXES[index]
+        keys = {value: normalize(value) for value in values}
+        found = self._find_many(index, set(keys.values()))
+        result = {value: found[key] for value, key in keys.items() if key in found}
+        self._hits.inc(len(result))
+        self._misses.inc(len(keys) - len(result))
+        return result
+
+    def _find_many(self, index, keys):
+        entries = self.indexes[index]
+        return {key: entries[key] for key in keys if key in entries}
+
+    def first(self, index, value):
+        found = self.lookup(index, value)
+        return found[0] if found else None
+
+    def _derived(self, entry):
+        derived = getattr(entry, "derived", None)
+        if derived is None:
+            derived = entry.derived = (self._icd_payload(entry), self._ayurveda_payload(entry))
+        return derived
+
+    @staticmethod
+    def _icd_payload(entry):
         icd10 = entry.get("who_icd10", {})
-        return {
+        return freeze({
             "icd_code": icd10.get("code", "R50.9"),
-            "description": icd10.get("word", diagnosis),
+            "description": icd10.get("word", _QUERY),
             "confidence": 0.95,
             "severity": entry.get("severity", "Unknown"),
             "source": "clinical-database"
-        }
-    
-    return {
-        "icd_code": "R50.9",
-        "description": "Unable to classify",
-        "confidence": 0.0,
-        "severity": "Unknown",
-        "source": "fallback"
-    }
+        })
 
-def get_ayurveda_mapping_from_gemini(diagnosis: str, icd_code: str):
-    """Return AYUSH classification from hardcoded database"""
-    entry = get_clinical_entry(diagnosis)
-    
-    if entry:
-        return {
+    @staticmethod
+    def _ayurveda_payload(entry):
+        return freeze({
             "ayurveda_code": entry["ayurveda"].get("term", ""),
             "ayurveda_description": entry["ayurveda"].get("description", ""),
             "severity": entry.get("severity", "Unknown"),
@@ -288,15 +344,86 @@ def get_ayurveda_mapping_from_gemini(diagnosis: str, icd_code: str):
             "who_icd10": entry.get("who_icd10", {}),
             "who_icd11": entry.get("who_icd11", {}),
             "full_entry": entry
-        }
-    
-    return {
-        "ayurveda_code": "Unknown",
-        "ayurveda_description": "Unable to classify",
-        "severity": "Unknown",
-        "siddha": {},
-        "unani": {},
-        "who_icd10": {},
-        "who_icd11": {},
-        "full_entry": {}
-    }
\ No newline at end of file
+        })
+
+    def icd_codes(self, entry, query=None):
+        """ICD payload for an entry; one without an ICD-10 word is described
+        by the query that found it."""
+        if entry is None:
+            return ICD_FALLBACK
+        payload = self._derived(entry)[0]
+        if payload["description"] is _QUERY:
+            return freeze({**payload, "description": query})
+        return payload
+
+    def ayurveda_mapping(self, entry):
+        return self._derived(entry)[1] if entry is not None else AYURVEDA_FALLBACK
+
+    @property
+    def version(self):
+        return "built-in"
+
+    def iter_records(self):
+        return iter(self.records)
+
+    def version_records(self, version):
+        """Records of an earlier version, or None when it is not retained."""
+        return self.iter_records() if version == self.version else None
+
+    def info(self):
+        return {"backend": "memory", "version": self.version, "records": len(self.records)}
+
+
+class CatalogTerminology(TerminologyStore):
+    """Same interface, backed by the on-disk catalog (see catalog.py) so full
+    ICD/AYUSH sets are not held in every worker."""
+
+    def __init__(self, catalog):
+        super().__init__(())
+        self.catalog = catalog
+
+    def _find(self, index, key):
+        return self.catalog.lookup(index, key)
+
+    def _find_many(self, index, keys):
+        return self.catalog.lookup_many(index, keys)
+
+    @property
+    def version(self):
+        return self.catalog.version
+
+    def iter_records(self):
+        return self.catalog.iter_records()
+
+    def version_records(self, version):
+        return read_version(version, self.catalog.catalog_dir)
+
+    def info(self):
+        return self.catalog.info()
+
+
+def load_terminology():
+    """The published on-disk catalog when there is one, else the built-in list."""
+    if ClinicalCatalog.available():
+        return CatalogTerminology(ClinicalCatalog())
+    return TerminologyStore(clinicalDatabase)
+
+
+terminology = load_terminology()
+
+def get_clinical_entry(diagnosis: str):
+    """Find diagnosis in clinical database"""
+    return terminology.first("name", diagnosis)
+
+def get_icd_codes_from_gemini(diagnosis: str, scan_type: str):
+    """Return ICD codes from hardcoded database"""
+    return terminology.icd_codes(get_clinical_entry(diagnosis), diagnosis)
+
+def get_ayurveda_mapping_from_gemini(diagnosis: str, icd_code: str):
+    """Return AYUSH classification from hardcoded database"""
+    return terminology.ayurveda_mapping(get_clinical_entry(diagnosis))
+
+def get_clinical_codes(diagnosis: str, scan_type: str):
+    """ICD and AYUSH mappings for a diagnosis from a single index lookup."""
+    entry = get_clinical_entry(diagnosis)
+    return terminology.icd_codes(entry, diagnosis), terminology.ayurveda_mapping(entry)
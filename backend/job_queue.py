@@ -0,0 +1,253 @@
+import io
+import json
+import os
+import threading
+import time
+import uuid
+
+from log_config import get_logger
+from scheduler import DeadlineExceeded
+
+# Asynchronous inference jobs: submit returns immediately, at most
+# JOB_QUEUE_SIZE jobs wait in the inference scheduler at once, and every state
+# change is written to JOBS_DIR so accepted work survives a restart.
+JOBS_DIR = os.environ.get("CCRAS_JOBS_DIR", "jobs")
+JOB_QUEUE_SIZE = int(os.environ.get("CCRAS_JOB_QUEUE_SIZE", "64"))
+JOB_RESULT_TTL = float(os.environ.get("CCRAS_JOB_RESULT_TTL", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+log = get_logger("job_queue")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobNotFound(Exception):
+    pass
+
+
+class StoredUpload:
+    """Minimal stand-in for FastAPI's UploadFile backed by bytes kept on disk."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.file = io.BytesIO(data)
+
+
+class JobQueue:
+    def __init__(self, handler, dispatch, jobs_dir=JOBS_DIR, max_size=JOB_QUEUE_SIZE,
+                 result_ttl=JOB_RESULT_TTL):
+        self.handler = handler  # handler(scan_type, upload) -> JSON-serialisable result
+        self.dispatch = dispatch  # dispatch(job, fn) -> concurrent Future running fn()
+        self.jobs_dir = jobs_dir
+        self.max_size = max_size
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._futures = {}
+        self._lock = threading.RLock()
+        self._started = False
+
+    # --- lifecycle ---
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            recovered = self._recover()
+            self._started = True
+        log.info("Job queue started", extra={"capacity": self.max_size, "recovered": len(recovered)})
+        for job in recovered:
+            self._dispatch(job)
+
+    def stop(self):
+        with self._lock:
+            self._started = False
+
+    # --- public API ---
+
+    def submit(self, scan_type, filename, data, priority, deadline=None, tenant=None, weight=1.0):
+        with self._lock:
+            self._purge_expired()
+            if self.depth() >= self.max_size:
+                raise JobQueueFull(f"Job queue is full ({self.max_size} pending)")
+
+            job_id = uuid.uuid4().hex
+            job = {
+                "id": job_id,
+                "scan_type": scan_type,
+                "filename": filename,
+                "priority": priority,
+                "tenant": tenant,
+                "weight": weight,
+                "status": QUEUED,
+                "submitted_at": time.time(),
+                "deadline": deadline,
+                "started_at": None,
+                "finished_at": None,
+                "expires_at": None,
+                "cancel_requested": False,
+                "error": None,
+                "result": None,
+            }
+            with open(self._upload_path(job_id), "wb") as f:
+                f.write(data)
+            self._persist(job)
+            self._jobs[job_id] = job
+        self._dispatch(job)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_expired()
+            return self._public(self._lookup(job_id))
+
+    def result(self, job_id):
+        with self._lock:
+            job = self._lookup(job_id)
+            return self._public(job), job["result"]
+
+    def cancel(self, job_id):
+        """Cancel a job. Queued jobs are dropped at once; running jobs are
+        flagged and their result is discarded when the forward pass returns."""
+        with self._lock:
+            job = self._lookup(job_id)
+            if job["status"] in (QUEUED, RUNNING):
+                job["cancel_requested"] = True
+                self._persist(job)
+                future = self._futures.get(job_id)
+                if future is not None:
+                    future.cancel()
+            return self._public(job)
+
+    def depth(self):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j["status"] == QUEUED)
+
+    # --- internals ---
+
+    def _dispatch(self, job):
+        future = self.dispatch(job, lambda: self._run(job))
+        with self._lock:
+            self._futures[job["id"]] = future
+        future.add_done_callback(lambda f: self._complete(job, f))
+
+    def _run(self, job):
+        """Executes on a scheduler worker."""
+        with self._lock:
+            if job["cancel_requested"]:
+                return None
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            self._persist(job)
+        with open(self._upload_path(job["id"]), "rb") as f:
+            upload = StoredUpload(job["filename"], f.read())
+        return self.handler(job["scan_type"], upload)
+
+    def _complete(self, job, future):
+        with self._lock:
+            self._futures.pop(job["id"], None)
+            if job["status"] in FINISHED_STATES:
+                return
+            if future.cancelled() or job["cancel_requested"]:
+                self._finish(job, CANCELLED)
+                return
+            error = future.exception()
+            if isinstance(error, DeadlineExceeded):
+                job["error"] = str(error)
+                self._finish(job, CANCELLED)
+            elif error is not None:
+                job["error"] = str(error)
+                log.warning("Job failed: %s", error, extra={"jobId": job["id"]})
+                self._finish(job, FAILED)
+            else:
+                job["result"] = future.result()
+                self._finish(job, COMPLETED)
+
+    def _finish(self, job, status):
+        job["status"] = status
+        job["finished_at"] = time.time()
+        job["expires_at"] = job["finished_at"] + self.result_ttl
+        self._persist(job)
+        self._remove_file(self._upload_path(job["id"]))
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [j for j in self._jobs.values()
+                   if j["status"] in FINISHED_STATES and j["expires_at"] <= now]
+        for job in expired:
+            del self._jobs[job["id"]]
+            self._remove_file(self._state_path(job["id"]))
+
+    def _recover(self):
+        """Reload persisted jobs. Anything queued or interrupted mid-run is queued again."""
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError) as e:
+                log.warning("Skipping unreadable job state: %s", e, extra={"file": name})
+
+        recovered = []
+        for job in sorted(jobs, key=lambda j: j["submitted_at"]):
+            self._jobs[job["id"]] = job
+            if job["status"] in (QUEUED, RUNNING):
+                if job["cancel_requested"] or not os.path.exists(self._upload_path(job["id"])):
+                    self._finish(job, CANCELLED)
+                    continue
+                job["status"] = QUEUED
+                job["started_at"] = None
+                self._persist(job)
+                recovered.append(job)
+        self._purge_expired()
+        return recovered
+
+    def _lookup(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFound(job_id)
+        return job
+
+    def _persist(self, job):
+        path = self._state_path(job["id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp, path)
+
+    def _state_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _upload_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.upload")
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _public(job):
+        return {
+            "jobId": job["id"],
+            "status": job["status"],
+            "scanType": job["scan_type"],
+            "priority": job.get("priority"),
+            "submittedAt": job["submitted_at"],
+            "startedAt": job["started_at"],
+            "finishedAt": job["finished_at"],
+            "expiresAt": job["expires_at"],
+            "error": job["error"],
+        }
@@ -0,0 +1,98 @@
+"""
+Local stand-in for the Gemini generateContent API, for exercising the
+consultation proxy without a key or network access.
+
+Answers every prompt with a canned JSON consultation after a configurable
+latency, can fail a share of calls with 503 or 429 to drive the retry path,
+and counts the calls it received (GET /stats) so caching and de-duplication
+are visible from outside.
+
+    python llm_stub_server.py --port 8090 --latency 0.5 --fail-rate 0.2
+    CCRAS_LLM_ENDPOINT=http://127.0.0.1:8090/v1beta python main.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from collections import deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="CCRAS LLM stub")
+config = {"latency": 0.0, "fail_rate": 0.0, "throttle_rate": 0.0}
+stats = {"calls": 0, "failed": 0, "throttled": 0, "inflight": 0, "maxInflight": 0, "byModel": {}}
+scripted = deque()  # statuses (429/5xx) returned by the next calls, before any random failure
+
+
+def reset():
+    config.update(latency=0.0, fail_rate=0.0, throttle_rate=0.0)
+    stats.update(calls=0, failed=0, throttled=0, inflight=0, maxInflight=0, byModel={})
+    scripted.clear()
+
+
+def _consultation(prompt, image_b64):
+    """A deterministic answer for the prompt and image."""
+    digest = hashlib.sha256((prompt + image_b64).encode("utf-8")).hexdigest()
+    answer = {
+        "prediction": "Normal",
+        "confidence": round(0.5 + int(digest[:4], 16) / 0x20000, 4),
+        "reasoning": f"Stub consultation {digest[:12]}.",
+    }
+    if "AYUSH" in prompt:
+        answer.update({"icdCode": "Z00.0", "ayurCode": "Swastha", "clinical_info": "Stub response."})
+    return answer
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def generate_content(model: str, request: Request):
+    body = await request.json()
+    stats["calls"] += 1
+    stats["byModel"][model] = stats["byModel"].get(model, 0) + 1
+    stats["inflight"] += 1
+    stats["maxInflight"] = max(stats["maxInflight"], stats["inflight"])
+    try:
+        await asyncio.sleep(config["latency"])
+        status = scripted.popleft() if scripted else None
+        roll = random.random()
+        if status is not None and status != 429:
+            stats["failed"] += 1
+            return JSONResponse({"error": {"code": status, "status": "UNAVAILABLE"}}, status_code=status)
+        if status == 429 or roll < config["throttle_rate"]:
+            stats["throttled"] += 1
+            return JSONResponse({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, status_code=429,
+                                headers={"Retry-After": "0.1"})
+        if roll < config["throttle_rate"] + config["fail_rate"]:
+            stats["failed"] += 1
+            return JSONResponse({"error": {"code": 503, "status": "UNAVAILABLE"}}, status_code=503)
+    finally:
+        stats["inflight"] -= 1
+
+    parts = body["contents"][0]["parts"]
+    prompt = "".join(p.get("text", "") for p in parts)
+    image = "".join((p.get("inlineData") or {}).get("data", "") for p in parts)
+    text = json.dumps(_consultation(prompt, image))
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub Gemini generateContent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before each answer")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of calls answered with 429")
+    args = parser.parse_args(argv)
+    config.update(latency=args.latency, fail_rate=args.fail_rate, throttle_rate=args.throttle_rate)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+End-to-end HTTP load generator and capacity report for the FastAPI app.
+
+Drives the real `main.app` either in-process (ASGI transport, no sockets) or a
+running server over HTTP, at a fixed request rate (open loop) or a fixed
+number of concurrent clients (closed loop), sweeping through several load
+levels. Each request picks a modality from the configured mix and an image
+from the corpus. For every level the report gives throughput, latency
+percentiles, error and shed rates, and per-expert queue depths sampled from
+/admission.
+
+Per-client rate limits apply to the generator too; raise CCRAS_RATE_LIMIT and
+CCRAS_RATE_BURST on the server when sizing beyond them.
+
+    CCRAS_SYNTHETIC_EXPERTS=all python load_test.py --rates 2,4,8,16 --duration 20
+    python load_test.py --url http://127.0.0.1:8000 --concurrency 1,4,16
+    python load_test.py --corpus corpus/ --mix chest=0.5,knee=0.3,ct=0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import httpx
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+ENDPOINTS = {
+    "chest": "/predict-xray/chest",
+    "knee": "/predict-xray/knee",
+    "mri": "/predict-mri",
+    "ct": "/predict-ct",
+}
+DEFAULT_MIX = {"chest": 0.4, "knee": 0.3, "mri": 0.2, "ct": 0.1}
+SHED_STATUSES = (429, 503, 504)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+QUEUE_SAMPLE_SECONDS = 0.5
+
+
+def parse_mix(raw):
+    mix = {}
+    for part in raw.split(","):
+        key, _, weight = part.partition("=")
+        if key.strip() not in ENDPOINTS:
+            raise ValueError(f"Unknown modality '{key}'. Expected one of {list(ENDPOINTS)}")
+        mix[key.strip()] = float(weight or 1)
+    return mix
+
+
+def load_corpus(path):
+    """Images per modality. A corpus directory may hold one sub-directory per
+    modality (chest/, knee/, mri/, ct/), as written by `setup_models.py
+    --corpus`; loose files are used for all of them."""
+    corpus = {key: [] for key in ENDPOINTS}
+    shared = []
+    for root, _, files in os.walk(path):
+        modality = os.path.relpath(root, path).split(os.sep)[0]
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(root, name), "rb") as f:
+                item = (name, f.read())
+            (corpus[modality] if modality in corpus else shared).append(item)
+    for key in corpus:
+        corpus[key] = corpus[key] or shared
+    return corpus
+
+
+def generated_corpus(sizes=(256, 512, 1024, 2048), seed=0):
+    """Fallback corpus of grayscale JPEGs of varying size so decode cost varies."""
+    rng = random.Random(seed)
+    images = []
+    for size in sizes:
+        img = Image.effect_noise((size, size), 64).point(lambda v: (v + rng.randrange(64)) % 256)
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append((f"generated_{size}.jpg", buffer.getvalue()))
+    return {key: images for key in ENDPOINTS}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[idx] * 1000, 2)
+
+
+class LevelRecorder:
+    def __init__(self):
+        self.samples = []  # (modality, status, latency seconds)
+        self.queue_depths = {}
+
+    def record(self, modality, status, latency):
+        self.samples.append((modality, status, latency))
+
+    def record_queues(self, admission):
+        for expert, stats in admission.items():
+            self.queue_depths.setdefault(expert, []).append(stats.get("queued", 0))
+
+    def summary(self, elapsed):
+        ok = sorted(lat for _, status, lat in self.samples if status == 200)
+        total = len(self.samples)
+        shed = sum(1 for _, status, _ in self.samples if status in SHED_STATUSES)
+        errors = sum(1 for _, status, _ in self.samples if status != 200 and status not in SHED_STATUSES)
+        per_expert = {}
+        for key in ENDPOINTS:
+            lat = sorted(l for m, status, l in self.samples if m == key and status == 200)
+            depths = self.queue_depths.get(key, [0])
+            per_expert[key] = {
+                "requests": sum(1 for m, _, _ in self.samples if m == key),
+                "ok": len(lat),
+                "shed": sum(1 for m, status, _ in self.samples if m == key and status in SHED_STATUSES),
+                "p50_ms": percentile(lat, 0.50),
+                "p95_ms": percentile(lat, 0.95),
+                "queue_depth_mean": round(statistics.fmean(depths), 2),
+                "queue_depth_max": max(depths),
+            }
+        return {
+            "requests": total,
+            "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+            "p50_ms": percentile(ok, 0.50),
+            "p95_ms": percentile(ok, 0.95),
+            "p99_ms": percentile(ok, 0.99),
+            "shed_rate": round(shed / total, 4) if total else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "experts": per_expert,
+        }
+
+
+class LoadGenerator:
+    def __init__(self, client, corpus, mix, seed=0, timeout=None):
+        self.client = client
+        self.corpus = corpus
+        self.modalities = list(mix)
+        self.weights = [mix[k] for k in self.modalities]
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+
+    async def one_request(self, recorder):
+        modality = self.rng.choices(self.modalities, self.weights)[0]
+        name, data = self.rng.choice(self.corpus[modality])
+        headers = {"X-Request-Timeout": str(self.timeout)} if self.timeout else {}
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(ENDPOINTS[modality], files={"file": (name, data, "image/jpeg")},
+                                              headers=headers)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        recorder.record(modality, status, time.perf_counter() - started)
+
+    async def sample_queues(self, recorder, stop):
+        while not stop.is_set():
+            try:
+                response = await self.client.get("/admission")
+                if response.status_code == 200:
+                    recorder.record_queues(response.json())
+            except httpx.HTTPError:
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=QUEUE_SAMPLE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def open_loop(self, rate, duration):
+        """Fires requests on a Poisson schedule at `rate` per second regardless of
+        how fast the server answers, as independent clients would."""
+        recorder, stop = LevelRecorder(), asyncio.Event()
+        sampler = asyncio.create_task(self.sample_queues(recorder, stop))
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(self.one_request(recorder)))
+            next_at += self.rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+        return recorder.summary(elapsed)
+
+    async def closed_loop(self, concurrency, duration):
+        """`concurrency` clients each sending their next request as soon as the
+        previous one returns."""
+        recorder, stop = LevelRecorder(), asyncio.Event()
+        sampler = asyncio.create_task(self.sample_queues(recorder, stop))
+        started = time.perf_counter()
+
+        async def client_loop():
+            while time.perf_counter() - started < duration:
+                await self.one_request(recorder)
+
+        await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+        return recorder.summary(elapsed)
+
+
+def print_report(report):
+    unit = "rate" if report["mode"] == "open" else "clients"
+    print(f"\n== Capacity report ({report['target']}, {report['mode']} loop) ==")
+    print(f"{unit:>8}{'req':>7}{'ok/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'shed':>8}{'errors':>8}")
+    for level in report["levels"]:
+        s = level["summary"]
+        print(f"{level['load']:>8}{s['requests']:>7}{s['throughput_rps'] or 0:>9.2f}"
+              f"{s['p50_ms'] or 0:>10.1f}{s['p95_ms'] or 0:>10.1f}{s['p99_ms'] or 0:>10.1f}"
+              f"{s['shed_rate']:>8.1%}{s['error_rate']:>8.1%}")
+    print("\nPer-expert p95 latency (ms) / max queue depth:")
+    print(f"{unit:>8}" + "".join(f"{key:>16}" for key in ENDPOINTS))
+    for level in report["levels"]:
+        cells = "".join(f"{(e['p95_ms'] or 0):>10.0f} / {e['queue_depth_max']:<3}"
+                        for e in level["summary"]["experts"].values())
+        print(f"{level['load']:>8}{cells}")
+
+
+async def run(args):
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    elif PIL_AVAILABLE:
+        corpus = generated_corpus()
+    else:
+        raise SystemExit("[!] Pillow is not installed; pass --corpus.")
+    missing = [key for key in mix if not corpus.get(key)]
+    if missing:
+        raise SystemExit(f"[!] No corpus images for: {', '.join(missing)}")
+
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.client_timeout)
+        target = args.url
+    else:
+        import main
+        app = main.app
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(args.client_ip, 50000)),
+                                   base_url="http://ccras.local", timeout=args.client_timeout)
+        target = "in-process"
+
+    mode = "closed" if args.concurrency else "open"
+    levels = [float(v) for v in (args.concurrency or args.rates).split(",") if v]
+    generator = LoadGenerator(client, corpus, mix, seed=args.seed, timeout=args.deadline)
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "target": target, "mode": mode,
+              "mix": mix, "duration_s": args.duration, "levels": []}
+    try:
+        for load in levels:
+            print(f"[*] {mode} loop at {load:g} {'req/s' if mode == 'open' else 'clients'} for {args.duration}s")
+            if mode == "open":
+                summary = await generator.open_loop(load, args.duration)
+            else:
+                summary = await generator.closed_loop(int(load), args.duration)
+            report["levels"].append({"load": load, "summary": summary})
+            if args.cooldown:
+                await asyncio.sleep(args.cooldown)
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CCRAS end-to-end load generator")
+    parser.add_argument("--url", help="server to drive over HTTP (default: run main.app in-process)")
+    parser.add_argument("--rates", default="1,2,4,8", help="open-loop request rates to sweep, req/s")
+    parser.add_argument("--concurrency", help="closed-loop client counts to sweep instead of --rates")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per load level")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="pause between levels")
+    parser.add_argument("--mix", help="modality weights, e.g. chest=0.4,knee=0.3,mri=0.2,ct=0.1")
+    parser.add_argument("--corpus", help="directory of images (optionally per-modality sub-directories)")
+    parser.add_argument("--deadline", type=float, help="X-Request-Timeout to send with each request")
+    parser.add_argument("--client-timeout", type=float, default=60.0)
+    parser.add_argument("--client-ip", default="127.0.0.1",
+                        help="remote address reported in-process (rate limits are per client)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="report JSON path (default: bench_results/load-<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print_report(report)
+    output = args.output or os.path.join("bench_results", time.strftime("load-%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[+] Report written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,137 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import zlib
+
+import tracing
+
+# Structured JSON logging for the inference path. Callers only enqueue the
+# record (StructuredQueueHandler); formatting and the write to stderr happen
+# on a QueueListener thread. Records flagged per_request are sampled by trace ID,
+# so a sampled request keeps all of its lines and the rest are dropped
+# before they are queued. Errors are never sampled out.
+LOG_LEVEL = os.getenv("CCRAS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("CCRAS_LOG_FORMAT", "json")  # json | text
+LOG_SAMPLE_RATE = float(os.getenv("CCRAS_LOG_SAMPLE_RATE", "0.1"))
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "per_request", "exc"}
+_configured = False
+_lock = threading.Lock()
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    """Runs in the logging thread's caller: attaches the current trace and
+    applies per-request sampling."""
+
+    def filter(self, record):
+        trace = tracing.current()
+        record.trace_id = trace.trace_id if trace is not None else None
+        record.request = trace.name if trace is not None else None
+        if getattr(record, "per_request", False) and record.levelno < logging.ERROR:
+            return sampled(record.trace_id)
+        return True
+
+
+def sampled(trace_id):
+    if LOG_SAMPLE_RATE >= 1.0:
+        return True
+    if trace_id is None:
+        # No trace to keep a request's lines together (e.g. CCRAS_TRACING=0)
+        return random.random() < LOG_SAMPLE_RATE
+    return (zlib.crc32(trace_id.encode()) % 10000) < LOG_SAMPLE_RATE * 10000
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler.prepare folds the traceback into msg and drops exc_info,
+    since a traceback cannot be queued. Formats it into its own `exc`
+    attribute instead, so the listener can emit it as a separate field."""
+
+    def prepare(self, record):
+        exc = record.exc_text
+        if record.exc_info:
+            exc = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = record.exc_text = None
+        record.exc = exc
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.trace_id:
+            entry["traceId"] = record.trace_id
+            entry["request"] = record.request
+        entry.update({k: v for k, v in vars(record).items()
+                      if k not in _RESERVED and k not in ("trace_id", "request")})
+        exc = getattr(record, "exc", None) or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exc:
+            entry["exc"] = exc
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extras = {k: v for k, v in vars(record).items()
+                  if k not in _RESERVED and k not in ("trace_id", "request")}
+        if record.trace_id:
+            extras["trace"] = record.trace_id
+        line += "  " + " ".join(f"{k}={v}" for k, v in extras.items()) if extras else ""
+        exc = getattr(record, "exc", None)
+        return line + "\n" + exc if exc else line
+
+
+def configure():
+    global _configured, _listener
+    with _lock:
+        if _configured:
+            return
+        records = queue.SimpleQueue()
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=False)
+        _listener.start()
+
+        handler = StructuredQueueHandler(records)
+        handler.addFilter(ContextFilter())
+        root = logging.getLogger("ccras")
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        atexit.register(shutdown)
+        _configured = True
+
+
+def shutdown():
+    """Flushes queued records; safe to call more than once."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name):
+    configure()
+    return logging.getLogger(f"ccras.{name}")
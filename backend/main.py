@@ -1,13 +1,38 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+from typing import List
+from pydantic import BaseModel, Field
+import asyncio
 import random
 import os
 import shutil
-from model_factory import orchestrator
+import time
+from model_factory import orchestrator, models
+from scheduler import DEFAULT_PRIORITY, UnknownPriority, normalize_priority
+from bulkheads import Bulkheads
+from rate_limit import RateLimiter, RateLimited
+from admission import AdmissionController, AdmissionRejected, DeadlineExceeded, deadline_from_headers, DEADLINE_HEADER
+from job_queue import JobQueue, JobQueueFull, JobNotFound, COMPLETED, FAILED, CANCELLED
+from metrics import REGISTRY, STAGE_SECONDS, MetricsMiddleware
+import tracing
+from profiling import ProfileSession, ProfilerUnavailable, artifact_path
+import memory_diag
+from log_config import get_logger
+from gemini_service import terminology
+from terminology_search import TerminologySearch, SEARCH_FIELDS, DEFAULT_LIMIT
+from terminology_mapping import TerminologyMapper, DuplexStreamingResponse
+from catalog import TERMINOLOGY_INDEXES
+from crosswalk import Crosswalk, UnknownCodeSystem, parse_systems, MAX_RANGE_CODES
+from code_suggest import CodeSuggester, DEFAULT_TOP_K, MAX_TOP_K
+from terminology_snapshot import SnapshotService, etag_matches
+from consultation import ConsultationService, UnknownConsultation, parse_prompts
+from responses import (FastJSONResponse, PredictionRenderer, UnknownFields, format_response, parse_fields,
+                       select_fields)
 
-app = FastAPI(title="CCRAS Institutional AI Node")
+app = FastAPI(title="CCRAS Institutional AI Node", default_response_class=FastJSONResponse)
 
 # Enable CORS for frontend communication
 app.add_middleware(
@@ -16,86 +41,443 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", tracing.TRACE_HEADER, "ETag", "X-Terminology-Version", "X-Snapshot-Kind"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 # Serve static files for uploads
-if not os.path.exists("static"):
-    os.makedirs("static")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+STATIC_DIR = "static"
+if not os.path.exists(STATIC_DIR):
+    os.makedirs(STATIC_DIR)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+TRACE_VIEWER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trace_viewer.html")
+
+bulkheads = Bulkheads(models.keys())
+admission = AdmissionController(bulkheads)
+rate_limiter = RateLimiter()
+terminology_search = TerminologySearch(terminology)
+terminology_mapper = TerminologyMapper(terminology)
+crosswalk = Crosswalk(terminology)
+code_suggester = CodeSuggester(terminology)
+prediction_renderer = PredictionRenderer()
+snapshots = SnapshotService(terminology)
+consultations = ConsultationService()
+expert_memory = {key: memory_diag.ExpertMemory(model) for key, model in models.items()}
+log = get_logger("main")
 
 @app.post("/predict-xray/chest")
-async def predict_chest(file: UploadFile = File(...)):
+async def predict_chest(request: Request, file: UploadFile = File(...), priority: str = Form(DEFAULT_PRIORITY),
+                        fields: str = None):
     """Expert Node for Thoracic/Chest Analysis."""
-    try:
-        result = orchestrator.run_inference(file, "Chest X-ray")
-        image_url = await save_upload_file(file)
-        return format_response(result, image_url)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await run_prediction(request, file, "Chest X-ray", priority, fields)
 
 @app.post("/predict-xray/knee")
-async def predict_knee(file: UploadFile = File(...)):
+async def predict_knee(request: Request, file: UploadFile = File(...), priority: str = Form(DEFAULT_PRIORITY),
+                       fields: str = None):
     """Expert Node for Knee Osteoarthritis grading."""
+    return await run_prediction(request, file, "Knee X-ray", priority, fields)
+
+@app.post("/predict-mri")
+async def predict_mri(request: Request, file: UploadFile = File(...), priority: str = Form(DEFAULT_PRIORITY),
+                      fields: str = None):
+    return await run_prediction(request, file, "MRI", priority, fields)
+
+@app.post("/predict-ct")
+async def predict_ct(request: Request, file: UploadFile = File(...), priority: str = Form(DEFAULT_PRIORITY),
+                     fields: str = None):
+    return await run_prediction(request, file, "CT", priority, fields)
+
+def parse_priority(priority):
     try:
-        result = orchestrator.run_inference(file, "Knee X-ray")
-        image_url = await save_upload_file(file)
-        return format_response(result, image_url)
+        return normalize_priority(priority)
+    except UnknownPriority as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def check_rate_limit(request):
+    """Identifies the calling client and consumes one of its rate-limit tokens."""
+    tenant = rate_limiter.identify(request.headers, request.client.host if request.client else None)
+    try:
+        rate_limiter.check(tenant)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return tenant
+
+async def run_prediction(request, file, scan_type, priority, fields=None):
+    """Admits the request to its expert's queue and runs inference off the event loop.
+    `fields` ("compact" or a comma list) trims the payload."""
+    selected = parse_response_fields(fields)
+    lane = parse_priority(priority)
+    tenant = check_rate_limit(request)
+    deadline = deadline_from_headers(request.headers)
+    gate = admission[orchestrator.route(scan_type)]
+    try:
+        gate.admit(deadline)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason,
+                            headers={"Retry-After": str(e.retry_after)})
+    try:
+        result = await gate.run(deadline, lane, tracing.propagate(orchestrator.run_inference), file, scan_type,
+                                tenant=tenant.name, weight=tenant.weight)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    image_url = await save_upload_file(file, expert=orchestrator.route(scan_type))
+    return Response(prediction_renderer.render(result, image_url, selected), media_type="application/json",
+                    headers={"X-Terminology-Version": str(terminology.version)})
 
-@app.post("/predict-mri")
-async def predict_mri(file: UploadFile = File(...)):
-    result = orchestrator.run_inference(file, "MRI")
-    image_url = await save_upload_file(file)
-    return format_response(result, image_url)
+def parse_response_fields(fields):
+    try:
+        return parse_fields(fields)
+    except UnknownFields as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-@app.post("/predict-ct")
-async def predict_ct(file: UploadFile = File(...)):
-    result = orchestrator.run_inference(file, "CT")
-    image_url = await save_upload_file(file)
-    return format_response(result, image_url)
+@app.get("/admission")
+async def admission_status():
+    """Per-expert queue depth, estimated wait and shed counters."""
+    return admission.snapshot()
+
+@app.get("/scheduler")
+async def scheduler_status():
+    """Per-expert bulkhead saturation plus per-lane queue depth, latency
+    percentiles and turnaround-target hit rate."""
+    return bulkheads.snapshot()
+
+@app.get("/clients")
+async def client_status():
+    """Per-client served and throttled request counters."""
+    return rate_limiter.snapshot()
+
+@app.get("/traces")
+async def list_traces(limit: int = 50):
+    """Most recent finished request traces, newest first."""
+    return tracing.recent(limit)
+
+@app.get("/traces/viewer")
+async def trace_viewer():
+    """Waterfall viewer for /traces and trace files."""
+    return FileResponse(TRACE_VIEWER)
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    trace = tracing.find(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found or rotated out of memory")
+    return trace
+
+# --- ADMIN: ON-DEMAND PROFILING ---
+
+ADMIN_TOKEN = os.getenv("CCRAS_ADMIN_TOKEN")
+ADMIN_HEADER = "X-Admin-Token"
+profile_sessions = {}
+
+def require_admin(request):
+    """Admin endpoints stay disabled unless CCRAS_ADMIN_TOKEN is set."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set CCRAS_ADMIN_TOKEN")
+    if request.headers.get(ADMIN_HEADER) != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail=f"Missing or invalid {ADMIN_HEADER}")
+
+def get_expert(expert):
+    if expert not in models:
+        raise HTTPException(status_code=404, detail=f"Unknown expert '{expert}'")
+    return models[expert]
+
+@app.post("/admin/profile/{expert}")
+async def arm_profiler(expert: str, request: Request, requests: int = 1, memory: bool = True, shapes: bool = True):
+    """Profiles the next `requests` inferences on one expert with torch.profiler."""
+    require_admin(request)
+    model = get_expert(expert)
+    try:
+        session = ProfileSession(expert, requests, memory=memory, shapes=shapes)
+    except ProfilerUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    profile_sessions[expert] = session
+    model.profile_session = session
+    return session.snapshot()
+
+@app.get("/admin/profile/{expert}")
+async def profiler_status(expert: str, request: Request):
+    require_admin(request)
+    get_expert(expert)
+    session = profile_sessions.get(expert)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No profiling session for '{expert}'")
+    return session.snapshot()
+
+@app.delete("/admin/profile/{expert}")
+async def disarm_profiler(expert: str, request: Request):
+    require_admin(request)
+    get_expert(expert).profile_session = None
+    session = profile_sessions.get(expert)
+    return session.snapshot() if session else {"expert": expert, "remaining": 0, "artifacts": []}
+
+@app.get("/admin/profile/{expert}/artifacts/{name}")
+async def profiler_artifact(expert: str, name: str, request: Request):
+    """Downloads a Chrome trace (.trace.json) or operator summary (.summary.txt)."""
+    require_admin(request)
+    path = artifact_path(name)
+    if path is None or not name.startswith(f"{expert}-"):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return FileResponse(path)
+
+@app.get("/catalog")
+async def catalog_status():
+    """Which clinical terminology backend and catalog version is serving lookups."""
+    return terminology.info()
+
+@app.get("/coding")
+async def coding_status():
+    """Per-expert class coding tables resolved at load, with any classes the
+    catalog could not code."""
+    return {key: expert.coding_report() for key, expert in models.items()}
 
-def format_response(result, image_url):
-    """Standardizes the inference result for the CCRAS UI."""
+@app.get("/terminology/search")
+def search_terminology(q: str, limit: int = DEFAULT_LIMIT, fields: str = None):
+    """Ranked autocomplete over English names, Devanagari, Tamil, Arabic terms
+    and code prefixes. `fields` restricts matching, e.g. `name,icd10`. Plain
+    `def` so a first call that waits on the index build runs in the threadpool."""
+    selected = None
+    if fields:
+        selected = {f for f in fields.split(",") if f}
+        unknown = selected - set(SEARCH_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown search fields: {', '.join(sorted(unknown))}")
+    return terminology_search.search(q, max(1, min(limit, 50)), selected)
+
+@app.get("/terminology/snapshot")
+async def terminology_snapshot(request: Request, since: str = None):
+    """The whole clinical catalog for client-side caching, gzipped, with a
+    strong ETag. `since=<version>` returns only the records changed since
+    that version when it is still known, else the full snapshot."""
+    snapshot = await asyncio.to_thread(snapshots.get, since)
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    headers = snapshot.headers(gzipped)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body(gzipped), media_type="application/json", headers=headers)
+
+@app.post("/terminology/map")
+async def map_terminology(request: Request, index: str = "auto"):
+    """Bulk mapping of labels or codes to ICD-10/ICD-11/Ayurveda/Siddha/Unani.
+    The body is streamed one label/code (or NDJSON object) per line and the
+    mappings are streamed back as NDJSON in the same order."""
+    if index != "auto" and index not in TERMINOLOGY_INDEXES:
+        raise HTTPException(status_code=422, detail=f"Unknown index '{index}'")
+    return DuplexStreamingResponse(terminology_mapper.stream(request.stream(), asyncio.to_thread, index))
+
+@app.get("/crosswalk/icd10")
+async def crosswalk_icd10_range(start: str = None, end: str = None, block: str = None, chapter: str = None,
+                                to: str = None, limit: int = MAX_RANGE_CODES):
+    """ICD-10 codes in a chapter (`chapter=XIII`), block (`block=M15-M19`) or
+    start/end range, with their mappings into the `to` systems."""
+    try:
+        targets = parse_systems(to)
+    except UnknownCodeSystem as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return await asyncio.to_thread(crosswalk.icd10_range, targets, start, end, block, chapter, limit)
+
+@app.get("/crosswalk/{system}/{code:path}")
+async def crosswalk_code(system: str, code: str, to: str = None):
+    """Any code system to any other: icd10, icd11, institutional, ayurveda,
+    siddha, unani. One-to-many mappings list every target code."""
+    try:
+        targets = parse_systems(to)
+    except UnknownCodeSystem as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        result = crosswalk.translate(system, code, targets)
+    except UnknownCodeSystem as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not result["matches"]:
+        raise HTTPException(status_code=404, detail=f"No {system} entry for '{code}'")
+    return result
+
+class SuggestRequest(BaseModel):
+    reports: List[str] = Field(..., max_length=5000)
+    k: int = Field(DEFAULT_TOP_K, ge=1, le=MAX_TOP_K)
+
+@app.post("/terminology/suggest")
+async def suggest_codes(body: SuggestRequest):
+    """Top-k ICD/AYUSH code suggestions per free-text report, scored offline
+    against the catalog descriptions."""
+    return await asyncio.to_thread(code_suggester.suggest, body.reports, body.k)
+
+@app.post("/consult")
+async def consult(request: Request, file: UploadFile = File(...), scan_type: str = Form(...), prompts: str = Form(None)):
+    """LLM second opinions (the Gemini and MedGemma prompts) on one scan,
+    proxied and cached server-side so the API key never reaches the browser."""
+    check_rate_limit(request)
+    try:
+        names = parse_prompts(prompts)
+        image = await file.read()
+        result = await consultations.consult(image, scan_type, names, file.content_type or "image/jpeg")
+    except UnknownConsultation as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if all("error" in c for c in result["consultations"].values()):
+        raise HTTPException(status_code=502, detail=next(iter(result["consultations"].values()))["error"])
+    return result
+
+@app.get("/consult")
+async def consult_status():
+    return consultations.info()
+
+@app.get("/memory")
+async def memory_status(tracemalloc_limit: int = memory_diag.TRACEMALLOC_TOP):
+    """Process RSS/USS, allocator stats, per-expert parameter and buffer bytes,
+    measured activation peaks and, if enabled, tracemalloc top allocation sites."""
+    return memory_diag.report(expert_memory, tracemalloc_limit)
+
+@app.post("/admin/memory/{expert}/activations")
+async def measure_activations(expert: str, request: Request, batch_sizes: str = "1,2,4,8"):
+    """Measures peak activation memory per batch size on the expert's own bulkhead."""
+    require_admin(request)
+    get_expert(expert)
+    try:
+        sizes = memory_diag.parse_batch_sizes(batch_sizes)
+    except memory_diag.InvalidBatchSizes as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    future = bulkheads.submit(expert, "stat", None, expert_memory[expert].measure_activations, sizes)
+    await asyncio.wrap_future(future)
+    return expert_memory[expert].snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of request, stage, queue and memory metrics."""
+    return PlainTextResponse(REGISTRY.exposition(), media_type="text/plain; version=0.0.4")
+
+# --- ASYNCHRONOUS JOB API ---
+
+SCAN_TYPES = {
+    "chest": "Chest X-ray",
+    "knee": "Knee X-ray",
+    "mri": "MRI",
+    "ct": "CT",
+}
+
+def process_job(scan_type, upload):
+    """Runs one queued job on a worker thread."""
+    with tracing.traced(f"job {scan_type}", scanType=scan_type):
+        result = orchestrator.run_inference(upload, scan_type)
+        image_url = store_upload_file(upload, expert=orchestrator.route(scan_type))
+        return format_response(result, image_url)
+
+job_queue = JobQueue(
+    handler=process_job,
+    dispatch=lambda job, fn: bulkheads.submit(
+        orchestrator.route(job["scan_type"]), job.get("priority"), job.get("deadline"), fn,
+        tenant=job.get("tenant"), weight=job.get("weight", 1.0)),
+)
+
+def queue_metrics():
+    """Scrape-time view of the scheduler and admission state."""
+    depth, busy, admitted = [], [], []
+    for name, snap in bulkheads.snapshot().items():
+        busy.append(({"expert": name}, snap["busy"]))
+        for lane, stats in snap["lanes"].items():
+            depth.append(({"expert": name, "lane": lane}, stats["queued"]))
+    for name, snap in admission.snapshot().items():
+        for outcome in ("admitted", "rejected_queue_full", "rejected_slo", "expired", "completed"):
+            admitted.append(({"expert": name, "outcome": outcome}, snap.get(outcome, 0)))
+    yield ("ccras_queue_depth", "gauge", "Requests waiting per expert and priority lane.", depth)
+    yield ("ccras_busy_workers", "gauge", "Inference workers currently running per expert.", busy)
+    yield ("ccras_admission_total", "counter", "Admission decisions per expert.", admitted)
+    yield ("ccras_jobs_queued", "gauge", "Async jobs waiting for a worker.", [({}, job_queue.depth())])
+
+REGISTRY.add_collector(queue_metrics)
+
+@app.on_event("startup")
+async def start_workers():
+    memory_diag.log_startup(expert_memory, log)
+    terminology_search.warm()
+    crosswalk.warm()
+    code_suggester.warm()
+    snapshots.warm()
+    bulkheads.start()
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_workers():
+    job_queue.stop()
+    bulkheads.stop()
+    tracing.shutdown()
+    await consultations.close()
+
+@app.post("/jobs/{modality}", status_code=202)
+async def submit_job(modality: str, request: Request, file: UploadFile = File(...),
+                     priority: str = Form(DEFAULT_PRIORITY)):
+    """Accepts a scan for background inference and returns a job ID immediately.
+    Jobs have no deadline unless the client sends X-Request-Timeout."""
+    if modality not in SCAN_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown modality '{modality}'")
+    lane = parse_priority(priority)
+    tenant = check_rate_limit(request)
+    deadline = None
+    if DEADLINE_HEADER in request.headers:
+        deadline = deadline_from_headers(request.headers)
+    if not bulkheads[orchestrator.route(SCAN_TYPES[modality])].has_capacity():
+        raise HTTPException(status_code=503, detail=f"{modality} expert queue is full",
+                            headers={"Retry-After": "5"})
+    data = await file.read()
+    try:
+        job = job_queue.submit(SCAN_TYPES[modality], file.filename, data, lane, deadline=deadline,
+                               tenant=tenant.name, weight=tenant.weight)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     return {
-        "id": f"CCRAS-L-{random.randint(10000, 99999)}",
-        "prediction": result["prediction"],
-        "confidence": result["confidence"],
-        "icdCode": result["icd"],
-        "radiologicalObservation": (
-            f"Routing: {result['stage1_router']} -> Expert: {result['architecture']}. "
-            f"Anatomy: {result['detected_anatomy']}. "
-            f"Observations suggest features consistent with {result['prediction']}."
-        ),
-        "modelArchitecture": result["architecture"],
-        "detectedAnatomy": result["detected_anatomy"],
-        "original_url": image_url,
-        "all_results": [
-            {"label": result["prediction"], "confidence": result["confidence"]},
-            {"label": "Healthy/Normal", "confidence": round(1.0 - result["confidence"], 4)}
-        ],
-        "info": {
-            "AYURVEDA CLASSIFICATION": {
-                "type": "table",
-                "columns": ["Sr No.", "Code", "Clinical Term", "Research Mapping"],
-                "rows": [["1", "AY-INT-01", result["ayur"], f"Hierarchical classification via {result['architecture']}."]]
-            },
-            "INSTITUTIONAL LOG": {
-                "type": "text",
-                "content": f"Inference complete on CCRAS Local Node. Weights loaded: {result['weights']}."
-            }
-        }
+        **job,
+        "statusUrl": f"/jobs/{job['jobId']}",
+        "resultUrl": f"/jobs/{job['jobId']}/result",
     }
 
-async def save_upload_file(file: UploadFile) -> str:
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    try:
+        return job_queue.get(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, fields: str = None):
+    selected = parse_response_fields(fields)
+    try:
+        job, result = job_queue.result(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job["status"] == COMPLETED:
+        return select_fields(result, selected)
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] == CANCELLED:
+        raise HTTPException(status_code=410, detail="Job was cancelled")
+    return JSONResponse(status_code=202, content=job, headers={"Retry-After": "1"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    try:
+        return job_queue.cancel(job_id)
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+async def save_upload_file(file: UploadFile, expert="unknown") -> str:
     """Save uploaded file to static directory and return URL."""
+    return store_upload_file(file, expert)
+
+def store_upload_file(file, expert="unknown") -> str:
+    """Synchronous variant of save_upload_file for worker threads."""
+    started = time.perf_counter()
     file_ext = os.path.splitext(file.filename)[1]
     unique_filename = f"{random.randint(100000, 999999)}{file_ext}"
-    file_path = os.path.join("static", unique_filename)
+    file_path = os.path.join(STATIC_DIR, unique_filename)
     
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
+    finished = time.perf_counter()
+    STAGE_SECONDS.labels(expert, "storage").observe(finished - started)
+    tracing.record("save_upload_file", started, finished)
     return f"/static/{unique_filename}"
 
 @app.get("/health")
@@ -0,0 +1,208 @@
+import ctypes
+import ctypes.util
+import os
+import time
+import tracemalloc
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+try:
+    import torch
+    from torch.profiler import profile, ProfilerActivity
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+from profiling import PROFILER_LOCK
+
+# Memory diagnostics: per-expert parameter/buffer footprint, peak activation
+# memory per batch size, process RSS/USS, allocator statistics and, when
+# CCRAS_TRACEMALLOC is set, the top Python allocation sites.
+TRACEMALLOC_FRAMES = int(os.getenv("CCRAS_TRACEMALLOC", "0"))
+TRACEMALLOC_TOP = int(os.getenv("CCRAS_TRACEMALLOC_TOP", "20"))
+ACTIVATION_BATCH_SIZES = [1, 2, 4, 8]
+MAX_ACTIVATION_BATCH = 64   # each size is a profiled forward pass; larger ones can exhaust the node
+MAX_ACTIVATION_SIZES = 8
+STARTUP_ACTIVATIONS = os.getenv("CCRAS_MEMORY_STARTUP_ACTIVATIONS", "0").lower() in ("1", "true", "on")
+
+if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+class InvalidBatchSizes(ValueError):
+    pass
+
+
+def parse_batch_sizes(value):
+    """Batch sizes from a comma list, each between 1 and MAX_ACTIVATION_BATCH."""
+    try:
+        sizes = [int(n) for n in value.split(",") if n.strip()]
+    except ValueError:
+        raise InvalidBatchSizes("batch_sizes must be a comma-separated list of integers")
+    if not sizes:
+        return [1]
+    if len(sizes) > MAX_ACTIVATION_SIZES:
+        raise InvalidBatchSizes(f"At most {MAX_ACTIVATION_SIZES} batch sizes per measurement")
+    out_of_range = [n for n in sizes if not 1 <= n <= MAX_ACTIVATION_BATCH]
+    if out_of_range:
+        raise InvalidBatchSizes(f"Batch sizes must be between 1 and {MAX_ACTIVATION_BATCH}: "
+                                f"{', '.join(map(str, out_of_range))}")
+    return sizes
+
+
+def model_footprint(model):
+    """Bytes held by parameters and buffers, broken down by dtype."""
+    if model is None:
+        return None
+    by_dtype = {}
+    params = buffers = param_count = 0
+    for p in model.parameters():
+        size = p.numel() * p.element_size()
+        dtype = str(p.dtype).replace("torch.", "")
+        params += size
+        param_count += p.numel()
+        by_dtype[dtype] = by_dtype.get(dtype, 0) + size
+    for b in model.buffers():
+        buffers += b.numel() * b.element_size()
+    return {"parameters": param_count, "parameterBytes": params, "bufferBytes": buffers,
+            "bytesByDtype": by_dtype}
+
+
+def profiled_peak(fn):
+    """Peak tensor bytes allocated while fn() runs, from the profiler's
+    per-op allocation events replayed in time order."""
+    with PROFILER_LOCK, profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    live = peak = 0
+    for event in sorted(prof.events(), key=lambda e: e.time_range.start):
+        live += event.cpu_memory_usage if event.name == "[memory]" else event.self_cpu_memory_usage
+        peak = max(peak, live)
+    return peak
+
+
+def activation_peak(model, input_size, batch_size):
+    """Peak bytes allocated during one no-grad forward pass."""
+    batch = torch.zeros(batch_size, 3, input_size, input_size, dtype=next(model.parameters()).dtype)
+    with torch.no_grad():
+        return profiled_peak(lambda: model(batch))
+
+
+def process_memory():
+    """RSS, USS and peak RSS of this process."""
+    if HAS_PSUTIL:
+        info = psutil.Process().memory_full_info()
+        return {"rssBytes": info.rss, "ussBytes": getattr(info, "uss", None), "vmsBytes": info.vms}
+    stats = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM", "VmSize"):
+                    stats[key] = int(value.split()[0]) * 1024
+        with open("/proc/self/smaps_rollup", "r") as f:
+            uss = 0
+            for line in f:
+                if line.startswith(("Private_Clean", "Private_Dirty")):
+                    uss += int(line.split()[1]) * 1024
+            stats["USS"] = uss
+    except OSError:
+        pass
+    return {"rssBytes": stats.get("VmRSS"), "ussBytes": stats.get("USS"),
+            "peakRssBytes": stats.get("VmHWM"), "vmsBytes": stats.get("VmSize")}
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in
+                ("arena", "ordblks", "smblks", "hblks", "hblkhd", "usmblks", "fsmblks", "uordblks", "fordblks",
+                 "keepcost")]
+
+
+def allocator_stats():
+    """glibc malloc arena usage (where torch CPU tensors live) and CUDA
+    caching-allocator stats when a GPU is present."""
+    stats = {}
+    libc_name = ctypes.util.find_library("c")
+    if libc_name:
+        try:
+            libc = ctypes.CDLL(libc_name)
+            libc.mallinfo2.restype = _MallInfo2
+            info = libc.mallinfo2()
+            stats["malloc"] = {"arenaBytes": info.arena, "mmapBytes": info.hblkhd,
+                               "inUseBytes": info.uordblks, "freeBytes": info.fordblks}
+        except (OSError, AttributeError):
+            pass
+    if TORCH_AVAILABLE and torch.cuda.is_available():
+        cuda = torch.cuda.memory_stats()
+        stats["cuda"] = {"allocatedBytes": cuda.get("allocated_bytes.all.current"),
+                         "peakAllocatedBytes": cuda.get("allocated_bytes.all.peak"),
+                         "reservedBytes": cuda.get("reserved_bytes.all.current")}
+    return stats
+
+
+def tracemalloc_top(limit=TRACEMALLOC_TOP):
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    top = snapshot.statistics("lineno")[:limit]
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracedBytes": current,
+        "peakTracedBytes": peak,
+        "top": [{"site": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count} for stat in top],
+    }
+
+
+class ExpertMemory:
+    """Per-expert memory report; activation peaks are measured on demand and
+    cached because they cost a profiled forward pass per batch size."""
+
+    def __init__(self, expert):
+        self.expert = expert
+        self.footprint = model_footprint(expert.model) if TORCH_AVAILABLE else None
+        self.activations = {}
+        self.measured_at = None
+
+    def measure_activations(self, batch_sizes=ACTIVATION_BATCH_SIZES):
+        model = self.expert.model
+        if not TORCH_AVAILABLE or model is None:
+            return self.activations
+        if any(not 1 <= n <= MAX_ACTIVATION_BATCH for n in batch_sizes):
+            raise InvalidBatchSizes(f"Batch sizes must be between 1 and {MAX_ACTIVATION_BATCH}")
+        size = self.expert.input_size
+        for n in batch_sizes:
+            self.activations[str(n)] = activation_peak(model, size, n)
+        self.measured_at = time.time()
+        return self.activations
+
+    def snapshot(self):
+        return {
+            "architecture": self.expert.architecture,
+            "backend": ("synthetic" if self.expert.synthetic else
+                        "torch" if self.expert.model is not None else "mock"),
+            **(self.footprint or {}),
+            "peakActivationBytes": dict(self.activations),
+            "activationsMeasuredAt": self.measured_at,
+        }
+
+
+def log_startup(experts, log):
+    """One line per expert with its footprint (and activation peaks when
+    CCRAS_MEMORY_STARTUP_ACTIVATIONS is set), plus the process totals."""
+    for key, memory in experts.items():
+        if STARTUP_ACTIVATIONS:
+            memory.measure_activations()
+        log.info("Expert memory", extra={"expert": key, **memory.snapshot()})
+    log.info("Process memory", extra=process_memory())
+
+
+def report(experts, tracemalloc_limit=TRACEMALLOC_TOP):
+    return {
+        "process": process_memory(),
+        "allocator": allocator_stats(),
+        "experts": {key: memory.snapshot() for key, memory in experts.items()},
+        "tracemalloc": tracemalloc_top(tracemalloc_limit),
+    }
@@ -0,0 +1,240 @@
+import bisect
+import os
+import threading
+import time
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+# Minimal Prometheus-style metrics registry. Recording is a dict lookup plus a
+# locked increment (about a microsecond), so it is safe on the inference hot
+# path; hot callers should resolve `.labels(...)` once and keep the child.
+# Values that already live elsewhere (queue depths, admission counters, memory)
+# are read by collector callbacks at scrape time and cost nothing in between.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield from child.samples(self.name, self.labelnames, values)
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, values):
+        yield f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"
+
+
+class Counter(_Metric):
+    """Counter families are named with their `_total` suffix, so HELP, TYPE
+    and samples all carry the same name."""
+    kind = "counter"
+    _new_child = staticmethod(_CounterChild)
+
+    def __init__(self, name, documentation, labelnames=()):
+        if not name.endswith("_total"):
+            raise ValueError(f"Counter name must end in _total: {name}")
+        super().__init__(name, documentation, labelnames)
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = (("le", _format_value(float(bound))),)
+            yield f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}"
+        yield f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}"
+        yield f"{name}_count{_format_labels(labelnames, values)} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, fn):
+        """fn() -> iterable of (name, kind, documentation, [(labels dict, value)])
+        evaluated at scrape time. Counter names end in `_total` here too."""
+        self._collectors.append(fn)
+
+    def exposition(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "ccras_http_requests_total", "HTTP requests by handler and status code.", ("handler", "status"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "ccras_http_request_seconds", "HTTP request latency by handler.", ("handler",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "ccras_stage_seconds", "Time per inference stage (decode, preprocess, forward, coding, storage).",
+    ("expert", "stage"))
+BATCH_SIZE = REGISTRY.histogram(
+    "ccras_batch_size", "Images per forward pass.", ("expert",), buckets=BATCH_BUCKETS)
+MOCK_FALLBACKS = REGISTRY.counter(
+    "ccras_mock_fallback_total", "Predictions served by the mock backend instead of a real model.", ("expert",))
+CACHE_REQUESTS = REGISTRY.counter(
+    "ccras_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result"))
+TERMINOLOGY_MAPPINGS = REGISTRY.counter(
+    "ccras_terminology_mappings_total", "Bulk mapping inputs by result (matched/unmatched/invalid).", ("result",))
+LLM_CONSULTATIONS = REGISTRY.counter(
+    "ccras_llm_consultations_total", "LLM consultations by prompt and result (hit/shared/upstream/retry/error).",
+    ("prompt", "result"))
+
+
+def process_memory():
+    samples = []
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        samples.append(({"kind": "rss"}, resident_pages * os.sysconf("SC_PAGE_SIZE")))
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        samples.append(({"kind": "peak_rss"}, peak * (1 if os.uname().sysname == "Darwin" else 1024)))
+    yield ("ccras_process_memory_bytes", "gauge", "Process resident memory.", samples)
+    yield ("ccras_process_uptime_seconds", "gauge", "Seconds since the metrics module was imported.",
+           [({}, round(time.time() - _STARTED, 3))])
+
+
+_STARTED = time.time()
+REGISTRY.add_collector(process_memory)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting requests per handler and status. Labels
+    use the matched endpoint's name, so path parameters (job IDs) do not
+    multiply series."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            REQUEST_SECONDS.labels(handler).observe(time.perf_counter() - started)
+            REQUESTS.labels(handler, str(status["code"])).inc()
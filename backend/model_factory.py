@@ -1,8 +1,8 @@
 
-import random
 import time
 import os
 import io
+import threading
 
 try:
     from PIL import Image
@@ -13,69 +13,206 @@ except ImportError:
 try:
     import torch
     import torch.nn as nn
-    from torchvision import models, transforms
+    from torchvision import models as tv_models, transforms
     TORCH_AVAILABLE = True
 except ImportError:
     TORCH_AVAILABLE = False
 
-from gemini_service import get_icd_codes_from_gemini, get_ayurveda_mapping_from_gemini
+from gemini_service import terminology, get_clinical_entry
+from synthetic_backend import SyntheticBackend, synthetic_profile, MOCK_FALLBACK_PROFILE
+from metrics import STAGE_SECONDS, BATCH_SIZE, MOCK_FALLBACKS
+import tracing
+from log_config import get_logger
+
+log = get_logger("model_factory")
+
+# Refuse to start when a class cannot be fully coded, instead of logging it.
+# Needs a published catalog with an entry for every class: the built-in
+# six-entry list covers only the knee expert and chest Normal/Tuberculosis.
+STRICT_CODING = os.getenv("CCRAS_STRICT_CODING", "0").lower() in ("1", "true", "on")
+
+# Square input resolution each backbone is preprocessed to
+INPUT_SIZES = {
+    "EfficientNet-B3": 300,
+    "DenseNet-121": 224,
+    "ResNet-50-MRI": 224,
+    "Swin-Transformer-CT": 224,
+}
+
+def build_architecture(architecture, num_classes, pretrained=True):
+    """Instantiates a supported backbone with a num_classes output head."""
+    if architecture == "EfficientNet-B3":
+        model = tv_models.efficientnet_b3(weights=tv_models.EfficientNet_B3_Weights.DEFAULT if pretrained else None)
+        model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_classes)
+    
+    elif architecture == "DenseNet-121":
+        model = tv_models.densenet121(weights=tv_models.DenseNet121_Weights.DEFAULT if pretrained else None)
+        model.classifier = nn.Linear(model.classifier.in_features, num_classes)
+    
+    elif architecture == "ResNet-50-MRI":
+        model = tv_models.resnet50(weights=tv_models.ResNet50_Weights.DEFAULT if pretrained else None)
+        model.fc = nn.Linear(model.fc.in_features, num_classes)
+    
+    elif architecture == "Swin-Transformer-CT":
+        model = tv_models.swin_b(weights=tv_models.Swin_B_Weights.DEFAULT if pretrained else None)
+        model.head = nn.Linear(model.head.in_features, num_classes)
+    
+    else:
+        return None
+    return model
 
 class ExpertModel:
-    def __init__(self, name, architecture, typical_classes, icd_map, ayur_map, weight_path, use_gemini=True):
+    def __init__(self, name, architecture, typical_classes, icd_map, ayur_map, weight_path, use_gemini=True,
+                 synthetic=None, key=None):
         self.name = name
+        self.key = key or name  # registry key, used as the metrics label
         self.architecture = architecture
+        self.input_size = INPUT_SIZES.get(architecture, 224)
         self.typical_classes = typical_classes # THESE MUST MATCH YOUR MODEL'S OUTPUT CLASSES
         self.icd_map = icd_map
         self.ayur_map = ayur_map
         self.weight_path = os.path.join("weights", weight_path)
         self.use_gemini = use_gemini  # Toggle to use Gemini API for ICD/Ayurveda codes
+        # synthetic: latency profile dict to run this expert on the synthetic backend
+        self.synthetic = None
+        if synthetic is not None:
+            self.synthetic = SyntheticBackend.from_profile(name, len(typical_classes), synthetic)
+        self.mock = SyntheticBackend.from_profile(name, len(typical_classes), MOCK_FALLBACK_PROFILE)
+        # Metric children resolved once so the hot path only observes
+        self._stage_timers = {stage: STAGE_SECONDS.labels(self.key, stage)
+                              for stage in ("decode", "preprocess", "forward", "coding")}
+        self._batch_sizes = BATCH_SIZE.labels(self.key)
+        self._mock_fallbacks = MOCK_FALLBACKS.labels(self.key)
+        self.profile_session = None  # armed by POST /admin/profile/{expert}
+        self.coding = ()         # per-class result fragment, indexed by prediction_index
+        self.coding_issues = []
+        self.coding_version = None
+        self.coding_table_version = None  # version self.coding was built from
+        self._coding_lock = threading.Lock()
+        self.resolve_coding()
         self.model = self._load_model_weights()
 
+    def resolve_coding(self):
+        """Resolves the ICD and AYUSH codes of every class once, so a
+        prediction is coded by indexing self.coding. Classes the catalog does
+        not know fall back to the expert's own icd_map/ayur_map and are
+        reported in coding_issues rather than coded as R50.9. Strict mode
+        refuses to load an expert with open issues."""
+        version, coding, issues = self._resolve_table()
+        if issues and STRICT_CODING:
+            raise ValueError(f"{self.name}: {len(issues)} classes cannot be coded "
+                             f"({', '.join(sorted({i['label'] for i in issues}))}) and CCRAS_STRICT_CODING is set; "
+                             f"publish a catalog covering them (catalog.py build) or unset it")
+        self.coding = coding
+        self.coding_table_version = version
+        self.coding_issues = issues
+        self.coding_version = version
+
+    def _refresh_coding(self):
+        """Re-resolves after a catalog swap, once across all workers. Under
+        strict mode a swap that leaves classes uncodable keeps the previous
+        table (its issues are still reported) rather than failing every
+        prediction from then on."""
+        with self._coding_lock:
+            if terminology.version == self.coding_version:
+                return
+            version, coding, issues = self._resolve_table()
+            if issues and STRICT_CODING and self.coding:
+                log.error("Catalog version %s leaves %d classes uncodable; keeping the coding of version %s",
+                          version, len(issues), self.coding_version, extra={"expert": self.key})
+            else:
+                self.coding = coding
+                self.coding_table_version = version
+            self.coding_issues = issues
+            self.coding_version = version
+
+    def _resolve_table(self):
+        """(catalog version, per-class coding, issues) for the current catalog."""
+        version = terminology.version if self.use_gemini else None
+        coding, issues = [], []
+        for label in self.typical_classes:
+            icd_code, ayur_code = self.icd_map.get(label), self.ayur_map.get(label)
+            source = "expert-map"
+            if self.use_gemini:
+                try:
+                    entry = get_clinical_entry(label)
+                except Exception as e:
+                    entry = None
+                    issues.append({"label": label, "problem": f"catalog lookup failed: {e}"})
+                else:
+                    if entry is None:
+                        issues.append({"label": label, "problem": "no catalog entry"})
+                if entry is not None:
+                    catalog_icd = terminology.icd_codes(entry)["icd_code"]
+                    if icd_code is not None and icd_code != catalog_icd:
+                        issues.append({"label": label,
+                                       "problem": f"icd_map has {icd_code}, catalog has {catalog_icd}"})
+                    icd_code = catalog_icd
+                    ayur_code = terminology.ayurveda_mapping(entry)["ayurveda_code"]
+                    source = "catalog"
+            if icd_code is None:
+                issues.append({"label": label, "problem": "no ICD-10 code"})
+                icd_code = "Z00.0"
+            if ayur_code is None:
+                issues.append({"label": label, "problem": "no Ayurveda code"})
+                ayur_code = "Swastha"
+            coding.append({"prediction": label, "icd": icd_code, "ayur": ayur_code, "source": source})
+
+        for issue in issues:
+            log.warning("Coding for class '%s': %s", issue["label"], issue["problem"],
+                        extra={"expert": self.key, "catalogVersion": version})
+        return version, tuple(coding), issues
+
     def _load_model_weights(self):
         """Load real PyTorch models or fallback to mock."""
-        print(f"[*] Initializing {self.name} node with {self.architecture} weights from {self.weight_path}")
+        if self.synthetic is not None:
+            log.info("Initializing %s node on the synthetic backend (median %.0fms)",
+                     self.name, self.synthetic.median * 1000, extra={"expert": self.key, "backend": "synthetic"})
+            return None
+
+        log.info("Initializing %s node with %s weights from %s", self.name, self.architecture, self.weight_path,
+                 extra={"expert": self.key})
         
         if not TORCH_AVAILABLE:
-            print(f"    [!] PyTorch not available. Using mock inference.")
+            log.warning("PyTorch not available. Using mock inference.", extra={"expert": self.key})
             return None
         
         try:
             num_classes = len(self.typical_classes)
+            state_dict = None
             
-            # Load architecture
-            if self.architecture == "EfficientNet-B3":
-                model = models.efficientnet_b3(weights=models.EfficientNet_B3_Weights.DEFAULT)
-                model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_classes)
-            
-            elif self.architecture == "DenseNet-121":
-                model = models.densenet121(weights=models.DenseNet121_Weights.DEFAULT)
-                model.classifier = nn.Linear(model.classifier.in_features, num_classes)
-            
-            elif self.architecture == "ResNet-50-MRI":
-                model = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
-                model.fc = nn.Linear(model.fc.in_features, num_classes)
-            
-            elif self.architecture == "Swin-Transformer-CT":
-                model = models.swin_b(weights=models.Swin_B_Weights.DEFAULT)
-                model.head = nn.Linear(model.head.in_features, num_classes)
-            
-            else:
-                return None
-            
-            # Load weights if they exist
+            # A complete checkpoint needs no pretrained download
             if os.path.exists(self.weight_path):
                 try:
                     state_dict = torch.load(self.weight_path, map_location='cpu')
-                    model.load_state_dict(state_dict, strict=False)
-                    print(f"    [+] Loaded weights from {self.weight_path}")
+                    model = build_architecture(self.architecture, num_classes, pretrained=False)
+                    if model is None:
+                        return None
+                    missing, _ = model.load_state_dict(state_dict, strict=False)
+                    if not missing:
+                        log.info("Loaded weights from %s", self.weight_path, extra={"expert": self.key})
+                        model.eval()
+                        return model
+                    log.warning("Checkpoint is missing %d tensors. Filling in from pretrained weights.",
+                                len(missing), extra={"expert": self.key})
                 except Exception as e:
-                    print(f"    [!] Could not load weights: {e}. Using pretrained only.")
+                    state_dict = None
+                    log.warning("Could not load weights: %s. Using pretrained only.", e, extra={"expert": self.key})
+            
+            # Load architecture
+            model = build_architecture(self.architecture, num_classes, pretrained=True)
+            if model is None:
+                return None
+            
+            if state_dict is not None:
+                model.load_state_dict(state_dict, strict=False)
+                log.info("Loaded partial weights from %s", self.weight_path, extra={"expert": self.key})
             
             model.eval()
             return model
         
         except Exception as e:
-            print(f"    [!] Failed to load model: {e}")
+            log.error("Failed to load model: %s", e, extra={"expert": self.key})
             return None
 
     def _preprocess_image(self, image_file):
@@ -85,10 +222,14 @@ class ExpertModel:
         
         try:
             # Read image from upload
+            started = time.perf_counter()
             image_data = image_file.file.read()
             image_file.file.seek(0)  # Reset file pointer
             
             img = Image.open(io.BytesIO(image_data)).convert('RGB')
+            decoded = time.perf_counter()
+            self._stage_timers["decode"].observe(decoded - started)
+            tracing.record("decode", started, decoded)
             
             # Get appropriate transforms based on architecture
             if self.architecture == "EfficientNet-B3":
@@ -120,78 +261,118 @@ class ExpertModel:
                 return None
             
             tensor = transform(img)
+            finished = time.perf_counter()
+            self._stage_timers["preprocess"].observe(finished - decoded)
+            tracing.record("preprocess", decoded, finished)
             return tensor.unsqueeze(0)  # Add batch dimension
         
         except Exception as e:
-            print(f"    [!] Image preprocessing failed: {e}")
+            log.warning("Image preprocessing failed: %s", e, extra={"expert": self.key, "per_request": True})
             return None
 
+    @staticmethod
+    def _read_bytes(image_file):
+        data = image_file.file.read()
+        image_file.file.seek(0)
+        return data
+
     def forward(self, image_file):
         """Performs the actual inference."""
-        
+        return self.forward_batch([image_file])[0]
+
+    def forward_batch(self, image_files):
+        """Runs a single forward pass over several uploads for this expert."""
+        session = self.profile_session
+        if session is None:
+            return self._forward_batch(image_files)
+        try:
+            return session.run(self._forward_batch, image_files)
+        finally:
+            if session.done and self.profile_session is session:
+                self.profile_session = None
+
+    def _forward_batch(self, image_files):
+        outputs = [None] * len(image_files)
+        self._batch_sizes.observe(len(image_files))
+        forward_timer = self._stage_timers["forward"]
+
+        if self.synthetic is not None:
+            started = time.perf_counter()
+            outputs = self.synthetic.predict([self._read_bytes(f) for f in image_files])
+            finished = time.perf_counter()
+            forward_timer.observe(finished - started)
+            tracing.record("forward", started, finished, backend="synthetic", batch=len(image_files))
+
         # Try real inference if PyTorch is available and model loaded
-        if TORCH_AVAILABLE and self.model is not None:
+        elif TORCH_AVAILABLE and self.model is not None:
             try:
-                tensor = self._preprocess_image(image_file)
-                if tensor is not None:
+                tensors = [self._preprocess_image(f) for f in image_files]
+                ready = [i for i, t in enumerate(tensors) if t is not None]
+                if ready:
+                    started = time.perf_counter()
                     with torch.no_grad():
-                        output = self.model(tensor)
+                        output = self.model(torch.cat([tensors[i] for i in ready]))
                         probabilities = torch.softmax(output, dim=1)
                         confidence, prediction_index = torch.max(probabilities, dim=1)
-                        label = self.typical_classes[prediction_index.item()]
-                        confidence = round(confidence.item(), 4)
-                        
-                        print(f"    [✓] Real inference: {label} ({confidence*100:.1f}%)")
-                        
-                        # Determine ICD code and Ayurveda mapping
-                        if self.use_gemini:
-                            icd_data = get_icd_codes_from_gemini(label, self.name)
-                            ayur_data = get_ayurveda_mapping_from_gemini(label, icd_data.get("icd_code", "R50.9"))
-                            icd_code = icd_data.get("icd_code", self.icd_map.get(label, "Z00.0"))
-                            ayur_code = ayur_data.get("ayurveda_code", self.ayur_map.get(label, "Swastha"))
-                        else:
-                            icd_code = self.icd_map.get(label, "Z00.0")
-                            ayur_code = self.ayur_map.get(label, "Swastha")
-                        
-                        return {
-                            "prediction": label,
-                            "confidence": confidence,
-                            "architecture": self.architecture,
-                            "icd": icd_code,
-                            "ayur": ayur_code,
-                            "weights": self.weight_path
-                        }
+                    finished = time.perf_counter()
+                    forward_timer.observe(finished - started)
+                    tracing.record("forward", started, finished, backend="torch", batch=len(ready))
+                    for i, index, conf in zip(ready, prediction_index.tolist(), confidence.tolist()):
+                        outputs[i] = (index, conf)
+                        log.info("Real inference", extra={"expert": self.key, "label": self.typical_classes[index],
+                                                          "confidence": round(conf, 4), "per_request": True})
             except Exception as e:
-                print(f"    [!] Real inference failed: {e}. Falling back to mock.")
-        
+                log.error("Real inference failed: %s. Falling back to mock.", e, extra={"expert": self.key})
+
         # Fallback: Mock inference
-        print(f"    [~] Using mock inference (simulated)")
-        time.sleep(0.8)
-        label = random.choice(self.typical_classes)
-        confidence = round(random.uniform(0.92, 0.99), 4)
-        
-        if self.use_gemini:
-            try:
-                icd_data = get_icd_codes_from_gemini(label, self.name)
-                ayur_data = get_ayurveda_mapping_from_gemini(label, icd_data.get("icd_code", "R50.9"))
-                icd_code = icd_data.get("icd_code", self.icd_map.get(label, "Z00.0"))
-                ayur_code = ayur_data.get("ayurveda_code", self.ayur_map.get(label, "Swastha"))
-            except:
-                icd_code = self.icd_map.get(label, "Z00.0")
-                ayur_code = self.ayur_map.get(label, "Swastha")
-        else:
-            icd_code = self.icd_map.get(label, "Z00.0")
-            ayur_code = self.ayur_map.get(label, "Swastha")
+        missing = [i for i, out in enumerate(outputs) if out is None]
+        if missing:
+            log.info("Using mock inference (simulated)",
+                     extra={"expert": self.key, "batch": len(missing), "per_request": True})
+            self._mock_fallbacks.inc(len(missing))
+            started = time.perf_counter()
+            mocked = self.mock.predict([self._read_bytes(image_files[i]) for i in missing])
+            finished = time.perf_counter()
+            forward_timer.observe(finished - started)
+            tracing.record("forward", started, finished, backend="mock", batch=len(missing))
+            for i, out in zip(missing, mocked):
+                outputs[i] = out
 
+        coding_timer = self._stage_timers["coding"]
+        results = []
+        coding_started = time.perf_counter()
+        for index, conf in outputs:
+            started = time.perf_counter()
+            results.append(self._build_result(index, conf))
+            coding_timer.observe(time.perf_counter() - started)
+        # ICD/AYUSH coding of the batch; coding.resolve nests inside it after a catalog swap
+        tracing.record("coding", coding_started, time.perf_counter(), batch=len(results),
+                       catalogVersion=self.coding_version)
+        return results
+
+    def _build_result(self, prediction_index, confidence):
+        # Re-resolve only when a new catalog version has been published
+        if self.use_gemini and terminology.version != self.coding_version:
+            with tracing.span("coding.resolve"):
+                self._refresh_coding()
+        coding = self.coding[prediction_index]
         return {
-            "prediction": label,
-            "confidence": confidence,
+            "prediction": coding["prediction"],
+            "confidence": round(confidence, 4),
             "architecture": self.architecture,
-            "icd": icd_code,
-            "ayur": ayur_code,
+            "icd": coding["icd"],
+            "ayur": coding["ayur"],
             "weights": self.weight_path
         }
 
+    def coding_report(self):
+        return {
+            "catalogVersion": self.coding_version,
+            "tableVersion": self.coding_table_version,
+            "classes": [dict(c) for c in self.coding],
+            "issues": list(self.coding_issues),
+        }
+
 # --- CONFIGURATION: UPDATE THESE TO MATCH YOUR TRAINED MODELS ---
 
 def load_knee_expert():
@@ -202,15 +383,17 @@ def load_knee_expert():
         typical_classes=["Normal", "Mild Osteoarthritis", "Severe Osteoarthritis"],
         icd_map={
             "Normal": "Z00.0", 
-            "Mild Osteoarthritis": "M17.1", 
-            "Severe Osteoarthritis": "M17.0"
+            "Mild Osteoarthritis": "M17.11",
+            "Severe Osteoarthritis": "M17.13"
         },
         ayur_map={
             "Normal": "Swastha",
-            "Mild Osteoarthritis": "Sandhigata Vata (Grade 1)",
-            "Severe Osteoarthritis": "Sandhigata Vata (Avastha)"
+            "Mild Osteoarthritis": "Saum Sandhigata Vata",
+            "Severe Osteoarthritis": "Gambhir Sandhigata Vata"
         },
-        weight_path="knee_model.pth" # Ensure this file is in backend/weights/
+        weight_path="knee_model.pth", # Ensure this file is in backend/weights/
+        synthetic=synthetic_profile("knee", "EfficientNet-B3"),
+        key="knee"
     )
 
 def load_chest_expert():
@@ -235,7 +418,9 @@ def load_chest_expert():
             "Cardiomegaly": "Hridroga",
             "Others": "Roga (Unspecified)"
         },
-        weight_path="xray_model.pth"
+        weight_path="xray_model.pth",
+        synthetic=synthetic_profile("chest", "DenseNet-121"),
+        key="chest"
     )
 
 def load_mri_expert():
@@ -245,7 +430,9 @@ def load_mri_expert():
         typical_classes=["T2 Hyperintensity", "Glioma Pattern", "Normal MRI", "Degenerative Disc"],
         icd_map={"T2 Hyperintensity": "G35", "Glioma Pattern": "C71.9", "Normal MRI": "Z00.0", "Degenerative Disc": "M51.1"},
         ayur_map={"T2 Hyperintensity": "Vata-Vyadhi", "Glioma Pattern": "Arbuda", "Normal MRI": "Swastha", "Degenerative Disc": "Gridhrasi"},
-        weight_path="mri_model.pth"
+        weight_path="mri_model.pth",
+        synthetic=synthetic_profile("mri", "ResNet-50-MRI"),
+        key="mri"
     )
 
 def load_ct_expert():
@@ -255,7 +442,9 @@ def load_ct_expert():
         typical_classes=["Hemorrhage", "Ischemic Stroke", "Normal CT", "Fracture"],
         icd_map={"Hemorrhage": "I61.9", "Ischemic Stroke": "I63.9", "Normal CT": "Z00.0", "Fracture": "S02.0"},
         ayur_map={"Hemorrhage": "Raktapitta", "Ischemic Stroke": "Pakshaghata", "Normal CT": "Swastha", "Fracture": "Asthi-Bhanga"},
-        weight_path="ct_model.pth"
+        weight_path="ct_model.pth",
+        synthetic=synthetic_profile("ct", "Swin-Transformer-CT"),
+        key="ct"
     )
 
 # --- REGISTRY & ORCHESTRATOR ---
@@ -268,18 +457,24 @@ models = {
 }
 
 class DiagnosticFactory:
-    def run_inference(self, image_file, scan_type_str):
-        """Orchestrates the two-stage inference process."""
-        # STAGE 1: ROUTING (Determines which expert to use)
+    def route(self, scan_type_str):
+        """STAGE 1: ROUTING (Determines which expert to use)"""
         anatomy = "chest"
         if "Knee" in scan_type_str: anatomy = "knee"
         elif "MRI" in scan_type_str: anatomy = "mri"
         elif "CT" in scan_type_str: anatomy = "ct"
+        return anatomy
+
+    def run_inference(self, image_file, scan_type_str):
+        """Orchestrates the two-stage inference process."""
+        # STAGE 1: ROUTING (Determines which expert to use)
+        anatomy = self.route(scan_type_str)
         
         expert = models.get(anatomy, models["chest"])
         
         # STAGE 2: EXPERT INFERENCE
-        result = expert.forward(image_file)
+        with tracing.span("run_inference", expert=anatomy):
+            result = expert.forward(image_file)
         
         return {
             **result,
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+
+from log_config import get_logger
+
+try:
+    import torch
+    from torch.profiler import profile, record_function, ProfilerActivity
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+# On-demand torch.profiler capture. An admin arms a ProfileSession on one
+# expert for its next N requests; ExpertModel.forward_batch checks a single
+# attribute, so nothing is paid while no session is armed. Each captured
+# request leaves a Chrome trace (open in chrome://tracing or Perfetto) and an
+# operator summary table under PROFILE_DIR.
+PROFILE_DIR = os.getenv("CCRAS_PROFILE_DIR", "profiles")
+MAX_PROFILED_REQUESTS = int(os.getenv("CCRAS_PROFILE_MAX_REQUESTS", "50"))
+SUMMARY_ROWS = 30
+
+log = get_logger("profiling")
+
+# torch.profiler is process-wide: two captures at once (two experts, or an
+# activation measurement in memory_diag) corrupt each other's kineto events.
+# Every capture in the node takes this lock.
+PROFILER_LOCK = threading.Lock()
+
+
+class ProfilerUnavailable(Exception):
+    pass
+
+
+class ProfileSession:
+    def __init__(self, expert_key, requests, memory=True, shapes=True):
+        if not TORCH_AVAILABLE:
+            raise ProfilerUnavailable("PyTorch is not installed on this node")
+        self.expert_key = expert_key
+        self.requested = max(1, min(requests, MAX_PROFILED_REQUESTS))
+        self.remaining = self.requested
+        self.memory = memory
+        self.shapes = shapes
+        self.armed_at = time.time()
+        self.artifacts = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.remaining <= 0
+
+    def _claim(self):
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            if not PROFILER_LOCK.acquire(blocking=False):
+                return False  # another capture is running; run this one unprofiled
+            self.remaining -= 1
+            return True
+
+    def run(self, fn, *args):
+        """Runs fn under the profiler if a capture slot is left."""
+        if not self._claim():
+            return fn(*args)
+        try:
+            with profile(activities=[ProfilerActivity.CPU], profile_memory=self.memory,
+                         record_shapes=self.shapes) as prof:
+                with record_function(f"{self.expert_key}.forward_batch"):
+                    result = fn(*args)
+        finally:
+            PROFILER_LOCK.release()
+        try:
+            self._export(prof)
+        except Exception as e:
+            # The inference succeeded; a failed write only loses the artifact
+            log.error("Failed to export profile: %s", e, exc_info=True, extra={"expert": self.expert_key})
+        return result
+
+    def _export(self, prof):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stem = f"{self.expert_key}-{time.strftime('%Y%m%d-%H%M%S')}-{len(self.artifacts) + 1}"
+        trace_path = os.path.join(PROFILE_DIR, stem + ".trace.json")
+        summary_path = os.path.join(PROFILE_DIR, stem + ".summary.txt")
+        prof.export_chrome_trace(trace_path)
+        averages = prof.key_averages(group_by_input_shape=self.shapes)
+        table = averages.table(sort_by="self_cpu_time_total", row_limit=SUMMARY_ROWS)
+        if self.memory:
+            table += "\n\n" + averages.table(sort_by="self_cpu_memory_usage", row_limit=SUMMARY_ROWS)
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(table)
+        with self._lock:
+            self.artifacts.append({
+                "capturedAt": time.time(),
+                "chromeTrace": os.path.basename(trace_path),
+                "summary": os.path.basename(summary_path),
+            })
+        log.info("Profiled request written to %s", trace_path, extra={"expert": self.expert_key})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "expert": self.expert_key,
+                "requested": self.requested,
+                "remaining": self.remaining,
+                "profileMemory": self.memory,
+                "recordShapes": self.shapes,
+                "armedAt": self.armed_at,
+                "artifacts": list(self.artifacts),
+            }
+
+
+def artifact_path(name):
+    """Resolves an artifact file name inside PROFILE_DIR, rejecting paths."""
+    if os.path.basename(name) != name or not name.endswith((".trace.json", ".summary.txt")):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.exists(path) else None
@@ -0,0 +1,126 @@
+import json
+import math
+import os
+import threading
+import time
+
+from log_config import get_logger
+
+# Per-client token-bucket rate limiting. Clients are identified by X-API-Key
+# when it is a key configured in CCRAS_TENANTS, otherwise by remote address
+# (an unrecognised key must not buy a fresh bucket). Each known API key maps
+# to a named tenant with its own rate, burst and fair-queuing weight, e.g.
+#   '{"<api key>": {"name": "radiology", "rate": 10, "burst": 20, "weight": 3}}'
+RATE_LIMIT_PER_SECOND = float(os.environ.get("CCRAS_RATE_LIMIT", "5"))
+RATE_LIMIT_BURST = float(os.environ.get("CCRAS_RATE_BURST", "10"))
+API_KEY_HEADER = "X-API-Key"
+MAX_TRACKED_CLIENTS = 4096
+
+log = get_logger("rate_limit")
+
+
+class RateLimited(Exception):
+    def __init__(self, tenant, retry_after):
+        super().__init__(f"Rate limit exceeded for client '{tenant}'")
+        self.tenant = tenant
+        self.retry_after = retry_after
+
+
+class Tenant:
+    __slots__ = ("name", "rate", "burst", "weight")
+
+    def __init__(self, name, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, weight=1.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.weight = weight
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now):
+        """Take one token. Returns 0 on success, else seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+def load_tenants():
+    raw = os.environ.get("CCRAS_TENANTS")
+    if not raw:
+        return {}
+    try:
+        return {key: Tenant(cfg.get("name", key),
+                            float(cfg.get("rate", RATE_LIMIT_PER_SECOND)),
+                            float(cfg.get("burst", RATE_LIMIT_BURST)),
+                            float(cfg.get("weight", 1.0)))
+                for key, cfg in json.loads(raw).items()}
+    except (ValueError, AttributeError) as e:
+        log.warning("Ignoring invalid CCRAS_TENANTS: %s", e)
+        return {}
+
+
+class RateLimiter:
+    def __init__(self, tenants=None):
+        self.tenants = load_tenants() if tenants is None else tenants
+        self._buckets = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def identify(self, headers, client_host):
+        api_key = headers.get(API_KEY_HEADER)
+        if api_key:
+            tenant = self.tenants.get(api_key)
+            if tenant is not None:
+                return tenant
+        return Tenant(f"ip:{client_host or 'unknown'}")
+
+    def check(self, tenant):
+        """Consume a token for the tenant or raise RateLimited."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(tenant.name)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                    self._evict_idle(now)
+                bucket = self._buckets[tenant.name] = TokenBucket(tenant.rate, tenant.burst)
+            counters = self._counters.get(tenant.name)
+            if counters is None:
+                if len(self._counters) >= MAX_TRACKED_CLIENTS:
+                    self._evict_counters()
+                counters = self._counters[tenant.name] = {"served": 0, "throttled": 0}
+            wait = bucket.try_acquire(now)
+            if wait > 0:
+                counters["throttled"] += 1
+                raise RateLimited(tenant.name, max(1, math.ceil(wait)))
+            counters["served"] += 1
+
+    def _evict_idle(self, now):
+        """Drops buckets that have refilled completely; they hold no state.
+        If every bucket is still draining, the oldest go instead."""
+        for name, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[name]
+        while len(self._buckets) >= MAX_TRACKED_CLIENTS:
+            del self._buckets[next(iter(self._buckets))]
+
+    def _evict_counters(self):
+        """Drops the counters of clients without a live bucket, then the oldest."""
+        for name in [name for name in self._counters if name not in self._buckets]:
+            del self._counters[name]
+        while len(self._counters) >= MAX_TRACKED_CLIENTS:
+            del self._counters[next(iter(self._counters))]
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._counters.items()}
@@ -0,0 +1,138 @@
+import json
+import random
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+    HAS_ORJSON = True
+except ImportError:
+    FastJSONResponse = JSONResponse
+    HAS_ORJSON = False
+
+# Prediction payloads. Apart from the ID, the confidence and the image URL,
+# a response is fixed by the expert and label, so those parts are serialised
+# once per (expert, label, coding) and the few per-request values are spliced
+# in. The result is byte-for-byte what serialising format_response() gives.
+PREDICTION_FIELDS = ("id", "prediction", "confidence", "icdCode", "radiologicalObservation",
+                     "modelArchitecture", "detectedAnatomy", "original_url", "all_results", "info")
+COMPACT_FIELDS = ("prediction", "confidence", "icdCode")
+FRAGMENT_CACHE_SIZE = 1024
+
+
+class UnknownFields(ValueError):
+    pass
+
+
+def dumps(value):
+    if HAS_ORJSON:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def parse_fields(value):
+    """None for the full payload, else the requested field names in payload
+    order; 'compact' is prediction, confidence and icdCode."""
+    if not value:
+        return None
+    if value == "compact":
+        return COMPACT_FIELDS
+    requested = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = requested - set(PREDICTION_FIELDS)
+    if unknown:
+        raise UnknownFields(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(f for f in PREDICTION_FIELDS if f in requested)
+
+
+def prediction_id():
+    return f"CCRAS-L-{random.randint(10000, 99999)}"
+
+
+def _observation(result):
+    return (
+        f"Routing: {result['stage1_router']} -> Expert: {result['architecture']}. "
+        f"Anatomy: {result['detected_anatomy']}. "
+        f"Observations suggest features consistent with {result['prediction']}."
+    )
+
+
+def _info(result):
+    return {
+        "AYURVEDA CLASSIFICATION": {
+            "type": "table",
+            "columns": ["Sr No.", "Code", "Clinical Term", "Research Mapping"],
+            "rows": [["1", "AY-INT-01", result["ayur"], f"Hierarchical classification via {result['architecture']}."]]
+        },
+        "INSTITUTIONAL LOG": {
+            "type": "text",
+            "content": f"Inference complete on CCRAS Local Node. Weights loaded: {result['weights']}."
+        }
+    }
+
+
+def format_response(result, image_url, response_id=None):
+    """Standardizes the inference result for the CCRAS UI."""
+    return {
+        "id": response_id or prediction_id(),
+        "prediction": result["prediction"],
+        "confidence": result["confidence"],
+        "icdCode": result["icd"],
+        "radiologicalObservation": _observation(result),
+        "modelArchitecture": result["architecture"],
+        "detectedAnatomy": result["detected_anatomy"],
+        "original_url": image_url,
+        "all_results": [
+            {"label": result["prediction"], "confidence": result["confidence"]},
+            {"label": "Healthy/Normal", "confidence": round(1.0 - result["confidence"], 4)}
+        ],
+        "info": _info(result),
+    }
+
+
+def select_fields(payload, fields):
+    if fields is None:
+        return payload
+    return {f: payload[f] for f in fields if f in payload}
+
+
+class PredictionRenderer:
+    def __init__(self):
+        self._fragments = {}
+
+    def _static(self, result):
+        key = (result["prediction"], result["icd"], result["ayur"], result["architecture"],
+               result["detected_anatomy"], result["stage1_router"], result["weights"])
+        fragments = self._fragments.get(key)
+        if fragments is None:
+            label = dumps(result["prediction"])
+            head = b"".join([
+                b',"icdCode":', dumps(result["icd"]),
+                b',"radiologicalObservation":', dumps(_observation(result)),
+                b',"modelArchitecture":', dumps(result["architecture"]),
+                b',"detectedAnatomy":', dumps(result["detected_anatomy"]),
+            ])
+            tail = b',"info":' + dumps(_info(result)) + b"}"
+            fragments = (label, head, tail)
+            if len(self._fragments) >= FRAGMENT_CACHE_SIZE:
+                self._fragments.clear()
+            self._fragments[key] = fragments
+        return fragments
+
+    def render(self, result, image_url, fields=None):
+        """JSON bytes of format_response(result, image_url), restricted to
+        `fields` when given."""
+        confidence = result["confidence"]
+        if fields == COMPACT_FIELDS:
+            return dumps({"prediction": result["prediction"], "confidence": confidence, "icdCode": result["icd"]})
+        if fields is not None:
+            return dumps(select_fields(format_response(result, image_url), fields))
+        label, head, tail = self._static(result)
+        score = dumps(confidence)
+        return b"".join([
+            b'{"id":', dumps(prediction_id()), b',"prediction":', label, b',"confidence":', score, head,
+            b',"original_url":', dumps(image_url),
+            b',"all_results":[{"label":', label, b',"confidence":', score,
+            b'},{"label":"Healthy/Normal","confidence":', dumps(round(1.0 - confidence, 4)), b"}]",
+            tail,
+        ])
@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Priority-lane inference scheduler. Workers always take the lane head with the
+# best effective rank; a request's rank improves by one lane for every
+# PRIORITY_AGING_SECONDS it has waited, so routine work is delayed by STAT
+# traffic but never starved. Within a lane, tenants are served by weighted
+# fair queuing so one batch-importing client cannot monopolise an expert.
+# An aging period of 0 disables aging (strict lane priority).
+PRIORITY_LANES = ["stat", "urgent", "routine"]  # served in this order
+DEFAULT_PRIORITY = "routine"
+PRIORITY_AGING_SECONDS = float(os.environ.get("CCRAS_PRIORITY_AGING", "10"))
+INFERENCE_WORKERS = int(os.environ.get("CCRAS_INFERENCE_WORKERS", "2"))
+
+# Turnaround targets used to report how often each lane meets its SLO.
+LANE_TARGET_SECONDS = {
+    "stat": float(os.environ.get("CCRAS_STAT_TARGET", "5")),
+    "urgent": float(os.environ.get("CCRAS_URGENT_TARGET", "10")),
+    "routine": float(os.environ.get("CCRAS_ROUTINE_TARGET", "30")),
+}
+LATENCY_WINDOW = 2048
+DEFAULT_TENANT = "anonymous"
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class UnknownPriority(ValueError):
+    pass
+
+
+def normalize_priority(priority):
+    lane = (priority or DEFAULT_PRIORITY).strip().lower()
+    if lane not in PRIORITY_LANES:
+        raise UnknownPriority(f"Unknown priority '{priority}'. Expected one of {PRIORITY_LANES}")
+    return lane
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[idx], 4)
+
+
+class WorkItem:
+    __slots__ = ("lane", "deadline", "fn", "args", "future", "enqueued_at", "tenant", "weight", "start_tag")
+
+    def __init__(self, lane, deadline, fn, args, tenant=DEFAULT_TENANT, weight=1.0):
+        self.lane = lane
+        self.deadline = deadline
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.tenant = tenant
+        self.weight = weight
+        self.start_tag = 0.0
+
+
+class FairLane:
+    """Start-time fair queuing over per-tenant FIFOs. Each item is tagged with
+    max(virtual time, tenant's last finish tag) and costs 1/weight, so over any
+    busy period tenants are served in proportion to their weights."""
+
+    def __init__(self):
+        self._queues = {}
+        self._finish = {}
+        self._virtual_time = 0.0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, item):
+        item.start_tag = max(self._virtual_time, self._finish.get(item.tenant, 0.0))
+        self._finish[item.tenant] = item.start_tag + 1.0 / max(item.weight, 1e-6)
+        self._queues.setdefault(item.tenant, deque()).append(item)
+        self._size += 1
+
+    def peek(self):
+        head = None
+        for queue in self._queues.values():
+            if head is None or queue[0].start_tag < head.start_tag:
+                head = queue[0]
+        return head
+
+    def popleft(self):
+        item = self.peek()
+        queue = self._queues[item.tenant]
+        queue.popleft()
+        self._size -= 1
+        self._virtual_time = item.start_tag
+        if not queue:
+            del self._queues[item.tenant]
+            if self._finish[item.tenant] <= self._virtual_time:
+                del self._finish[item.tenant]
+        if len(self._finish) > 4 * len(self._queues) + 64:
+            # Idle tenants whose tags the virtual clock has passed carry no state.
+            self._finish = {t: f for t, f in self._finish.items()
+                            if t in self._queues or f > self._virtual_time}
+        return item
+
+
+class LaneStats:
+    def __init__(self, lane):
+        self.lane = lane
+        self.target = LANE_TARGET_SECONDS.get(lane)
+        self.served = 0
+        self.failed = 0
+        self.expired = 0
+        self.cancelled = 0
+        self.within_target = 0
+        self.waits = deque(maxlen=LATENCY_WINDOW)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, wait, latency, ok):
+        self.served += 1
+        if not ok:
+            self.failed += 1
+        if self.target is not None and latency <= self.target:
+            self.within_target += 1
+        self.waits.append(wait)
+        self.latencies.append(latency)
+
+    def snapshot(self, depth):
+        waits = sorted(self.waits)
+        latencies = sorted(self.latencies)
+        return {
+            "queued": depth,
+            "served": self.served,
+            "failed": self.failed,
+            "expired": self.expired,
+            "cancelled": self.cancelled,
+            "targetSeconds": self.target,
+            "withinTarget": round(self.within_target / self.served, 4) if self.served else None,
+            "queueWaitSeconds": {q: percentile(waits, v) for q, v in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+            "latencySeconds": {q: percentile(latencies, v) for q, v in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        }
+
+
+class PriorityScheduler:
+    def __init__(self, workers=INFERENCE_WORKERS, aging=PRIORITY_AGING_SECONDS, name="inference",
+                 max_queue=None, on_worker_start=None):
+        if aging < 0:
+            raise ValueError(f"Priority aging must be >= 0 seconds, got {aging}")
+        self.workers = workers
+        self.aging = aging
+        self.name = name
+        self.max_queue = max_queue  # advisory; enforced by admission and job submission
+        self.on_worker_start = on_worker_start
+        self.busy = 0
+        self._lanes = {lane: FairLane() for lane in PRIORITY_LANES}
+        self._stats = {lane: LaneStats(lane) for lane in PRIORITY_LANES}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"ccras-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def submit(self, priority, deadline, fn, *args, tenant=DEFAULT_TENANT, weight=1.0):
+        """Queue fn(*args) in the given lane and return a concurrent Future.
+        deadline is an epoch timestamp (or None); items still queued past it
+        fail with DeadlineExceeded instead of running."""
+        item = WorkItem(normalize_priority(priority), deadline, fn, args, tenant or DEFAULT_TENANT, weight)
+        with self._cond:
+            self._lanes[item.lane].append(item)
+            self._cond.notify()
+        return item.future
+
+    def depth(self):
+        with self._cond:
+            return sum(len(q) for q in self._lanes.values())
+
+    def has_capacity(self):
+        return self.max_queue is None or self.depth() < self.max_queue
+
+    def snapshot(self):
+        with self._cond:
+            depth = sum(len(q) for q in self._lanes.values())
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "queued": depth,
+                "maxQueue": self.max_queue,
+                "saturated": self.busy >= self.workers and depth > 0,
+                "lanes": {lane: self._stats[lane].snapshot(len(self._lanes[lane])) for lane in PRIORITY_LANES},
+            }
+
+    def _take(self):
+        """Pops the lane head with the lowest aged rank. Caller holds the lock."""
+        now = time.monotonic()
+        best, best_rank = None, None
+        for rank, lane in enumerate(PRIORITY_LANES):
+            queue = self._lanes[lane]
+            if not queue:
+                continue
+            effective = rank - (now - queue.peek().enqueued_at) / self.aging if self.aging > 0 else rank
+            if best is None or effective < best_rank:
+                best, best_rank = queue, effective
+        return best.popleft() if best is not None else None
+
+    def _worker(self):
+        if self.on_worker_start is not None:
+            self.on_worker_start()
+        while True:
+            with self._cond:
+                item = self._take()
+                while item is None and self._running:
+                    self._cond.wait()
+                    item = self._take()
+                if item is None:
+                    return
+                stats = self._stats[item.lane]
+                if not item.future.set_running_or_notify_cancel():
+                    stats.cancelled += 1
+                    continue
+                if item.deadline is not None and time.time() >= item.deadline:
+                    stats.expired += 1
+                    item.future.set_exception(DeadlineExceeded("Deadline passed while queued"))
+                    continue
+                self.busy += 1
+
+            started = time.monotonic()
+            ok = True
+            try:
+                item.future.set_result(item.fn(*item.args))
+            except BaseException as e:
+                ok = False
+                item.future.set_exception(e)
+            finished = time.monotonic()
+
+            with self._cond:
+                self.busy -= 1
+                stats.record(started - item.enqueued_at, finished - item.enqueued_at, ok)
@@ -1,5 +1,7 @@
 
 import os
+import json
+import argparse
 
 try:
     from PIL import Image, ImageDraw
@@ -7,6 +9,41 @@ try:
 except ImportError:
     HAS_PIL = False
 
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    import torch
+    HAS_TORCH = True
+except ImportError:
+    HAS_TORCH = False
+
+PLACEHOLDER_WEIGHTS = b"MOCK_WEIGHT_DATA_PLACEHOLDER"
+
+# Synthetic workload corpus: per modality, the resolutions, bit depths and
+# formats the node typically receives. "slices" makes a multi-slice series.
+CORPUS_SPECS = {
+    "chest": [
+        {"size": (2048, 2048), "bits": 8, "format": "JPEG"},
+        {"size": (2048, 2048), "bits": 16, "format": "PNG"},
+    ],
+    "knee": [
+        {"size": (1536, 1792), "bits": 8, "format": "JPEG"},
+        {"size": (1536, 1792), "bits": 16, "format": "PNG"},
+    ],
+    "mri": [
+        {"size": (256, 256), "bits": 8, "format": "JPEG"},
+        {"size": (512, 512), "bits": 16, "format": "PNG", "slices": 24},
+    ],
+    "ct": [
+        {"size": (512, 512), "bits": 8, "format": "JPEG"},
+        {"size": (512, 512), "bits": 16, "format": "PNG", "slices": 32},
+    ],
+}
+
 def setup():
     print("--- CCRAS Backend Initializer ---")
     
@@ -24,7 +61,7 @@ def setup():
         path = os.path.join("weights", w)
         if not os.path.exists(path):
             with open(path, "wb") as f:
-                f.write(b"MOCK_WEIGHT_DATA_PLACEHOLDER")
+                f.write(PLACEHOLDER_WEIGHTS)
             print(f"[!] Warning: Created mock weights for {w}. Replace this with your real .pth file.")
         else:
             print(f"[OK] Real weights detected for {w}. Skipping initialization.")
@@ -48,5 +85,139 @@ def setup():
     print("2. Update 'backend/model_factory.py' typical_classes to match your labels.")
     print("3. Run 'uvicorn main:app --reload'")
 
+def _is_placeholder(path):
+    if not os.path.exists(path):
+        return True
+    with open(path, "rb") as f:
+        return f.read(len(PLACEHOLDER_WEIGHTS) + 1) == PLACEHOLDER_WEIGHTS
+
+def generate_checkpoints(seed=0, half=True, force=False):
+    """Replaces placeholder .pth files with structurally valid checkpoints for
+    every configured expert (architecture and class count from model_factory),
+    initialised from `seed`. Real trained weights are never overwritten unless
+    force=True. Floating-point tensors are stored as float16 to halve the file
+    size; load_state_dict upcasts them to the model's float32 parameters."""
+    if not HAS_TORCH:
+        print("[!] PyTorch is required to generate checkpoints.")
+        return []
+
+    # Importing the registry with every expert on the synthetic backend reads
+    # the configuration without loading (or downloading) any weights.
+    os.environ["CCRAS_SYNTHETIC_EXPERTS"] = "all"
+    from model_factory import models, build_architecture
+
+    written = []
+    for idx, (key, expert) in enumerate(models.items()):
+        if not force and not _is_placeholder(expert.weight_path):
+            print(f"[OK] Real weights detected for {expert.weight_path}. Skipping checkpoint.")
+            continue
+        torch.manual_seed(seed + idx)
+        model = build_architecture(expert.architecture, len(expert.typical_classes), pretrained=False)
+        if model is None:
+            print(f"[!] Unknown architecture {expert.architecture} for {key}. Skipping.")
+            continue
+        state_dict = {name: (t.half() if half and t.is_floating_point() else t)
+                      for name, t in model.state_dict().items()}
+        os.makedirs(os.path.dirname(expert.weight_path) or ".", exist_ok=True)
+        torch.save(state_dict, expert.weight_path)
+        params = sum(p.numel() for p in model.parameters())
+        print(f"[+] Wrote seeded {expert.architecture} checkpoint ({len(expert.typical_classes)} classes, "
+              f"{params / 1e6:.1f}M params) to {expert.weight_path}")
+        written.append(expert.weight_path)
+    return written
+
+def _synthetic_scan(rng, width, height, bits, depth=0.0):
+    """Grayscale radiograph-like frame: exposure gradient, a body outline, a few
+    soft-tissue blobs that drift with slice depth, and detector noise."""
+    y, x = np.mgrid[-1.0:1.0:complex(0, height), -1.0:1.0:complex(0, width)]
+    img = 0.12 + 0.08 * y
+    img += 0.35 * (((x / 0.8) ** 2 + (y / 0.9) ** 2) < 1.0)
+    for _ in range(4):
+        cx, cy = rng.uniform(-0.5, 0.5, size=2) + 0.2 * depth
+        radius = rng.uniform(0.05, 0.25)
+        img += rng.uniform(-0.2, 0.25) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * radius ** 2))
+    img += rng.normal(0.0, 0.03, size=img.shape)
+    peak = (1 << bits) - 1
+    return (np.clip(img, 0.0, 1.0) * peak).astype(np.uint16 if bits > 8 else np.uint8)
+
+def _save_frame(pixels, path, fmt, quality):
+    img = Image.fromarray(pixels)
+    if fmt == "JPEG":
+        img.save(path, format="JPEG", quality=quality)
+    else:
+        img.save(path, format=fmt)
+
+def generate_corpus(out_dir="corpus", count=2, seed=0, scale=1.0, quality=90, modalities=None):
+    """Writes a reproducible synthetic corpus to out_dir/<modality>/ and a
+    manifest.json describing every file. `scale` multiplies each resolution and
+    `quality` sets JPEG quality, so file sizes and decode cost are tunable."""
+    if not (HAS_PIL and HAS_NUMPY):
+        print("[!] Pillow and numpy are required to generate the corpus.")
+        return None
+
+    manifest = {"seed": seed, "scale": scale, "quality": quality, "files": []}
+    for modality, specs in CORPUS_SPECS.items():
+        if modalities and modality not in modalities:
+            continue
+        os.makedirs(os.path.join(out_dir, modality), exist_ok=True)
+        for spec_idx, spec in enumerate(specs):
+            width, height = (max(16, int(d * scale)) for d in spec["size"])
+            ext = "jpg" if spec["format"] == "JPEG" else spec["format"].lower()
+            for study in range(count):
+                rng = np.random.default_rng([seed, spec_idx, study, sum(map(ord, modality))])
+                name = f"{modality}_{width}x{height}_{spec['bits']}bit_{study:03d}"
+                slices = spec.get("slices")
+                if slices:
+                    series_dir = os.path.join(out_dir, modality, name)
+                    os.makedirs(series_dir, exist_ok=True)
+                    state = rng.bit_generator.state
+                    paths = []
+                    for z in range(slices):
+                        rng.bit_generator.state = state  # same anatomy, shifted by depth
+                        pixels = _synthetic_scan(rng, width, height, spec["bits"], depth=z / slices - 0.5)
+                        paths.append(os.path.join(series_dir, f"slice_{z:03d}.{ext}"))
+                        _save_frame(pixels, paths[-1], spec["format"], quality)
+                else:
+                    pixels = _synthetic_scan(rng, width, height, spec["bits"])
+                    paths = [os.path.join(out_dir, modality, f"{name}.{ext}")]
+                    _save_frame(pixels, paths[0], spec["format"], quality)
+
+                for path in paths:
+                    manifest["files"].append({
+                        "path": os.path.relpath(path, out_dir).replace(os.sep, "/"),
+                        "modality": modality,
+                        "format": spec["format"],
+                        "bits": spec["bits"],
+                        "width": width,
+                        "height": height,
+                        "series": name if slices else None,
+                        "bytes": os.path.getsize(path),
+                    })
+
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    total = sum(entry["bytes"] for entry in manifest["files"])
+    print(f"[+] Generated {len(manifest['files'])} corpus images ({total / 1e6:.1f} MB) in {out_dir}/")
+    return manifest
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CCRAS backend initializer")
+    parser.add_argument("--corpus", action="store_true", help="also generate the synthetic workload corpus")
+    parser.add_argument("--corpus-dir", default="corpus")
+    parser.add_argument("--corpus-count", type=int, default=2, help="studies per modality and format")
+    parser.add_argument("--corpus-scale", type=float, default=1.0, help="resolution multiplier")
+    parser.add_argument("--corpus-quality", type=int, default=90, help="JPEG quality")
+    parser.add_argument("--corpus-modalities", help="comma-separated subset, e.g. chest,ct")
+    parser.add_argument("--checkpoints", action="store_true",
+                        help="replace placeholder weights with seeded, loadable checkpoints")
+    parser.add_argument("--force-checkpoints", action="store_true",
+                        help="overwrite existing weights too (destroys trained models!)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
     setup()
+    if args.checkpoints or args.force_checkpoints:
+        generate_checkpoints(args.seed, force=args.force_checkpoints)
+    if args.corpus:
+        generate_corpus(args.corpus_dir, args.corpus_count, args.seed, args.corpus_scale, args.corpus_quality,
+                        args.corpus_modalities.split(",") if args.corpus_modalities else None)
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from log_config import get_logger
+
+# Synthetic inference backend for load testing on machines without real
+# weights. Latency is drawn from a log-normal distribution per architecture and
+# grows sub-linearly with batch size; outputs are a deterministic function of
+# the seed, the expert and the image bytes, so repeated runs are comparable.
+#
+# Select experts with CCRAS_SYNTHETIC_EXPERTS ("all" or e.g. "ct,knee") and
+# override profiles with CCRAS_SYNTHETIC_PROFILE, e.g.
+#   '{"ct": {"median_ms": 400, "sigma": 0.3, "batch_scaling": 0.5}}'
+SYNTHETIC_SEED = int(os.environ.get("CCRAS_SYNTHETIC_SEED", "0"))
+
+SYNTHETIC_PROFILES = {
+    "EfficientNet-B3": {"median_ms": 45.0, "sigma": 0.25, "batch_scaling": 0.6},
+    "DenseNet-121": {"median_ms": 35.0, "sigma": 0.25, "batch_scaling": 0.6},
+    "ResNet-50-MRI": {"median_ms": 50.0, "sigma": 0.25, "batch_scaling": 0.6},
+    "Swin-Transformer-CT": {"median_ms": 180.0, "sigma": 0.3, "batch_scaling": 0.75},
+}
+DEFAULT_PROFILE = {"median_ms": 50.0, "sigma": 0.25, "batch_scaling": 0.6}
+
+# Used when a real model fails to load or run; matches the old fixed 0.8s mock.
+MOCK_FALLBACK_PROFILE = {"median_ms": 800.0, "sigma": 0.0, "batch_scaling": 1.0}
+
+log = get_logger("synthetic_backend")
+
+
+def synthetic_profile(key, architecture):
+    """Latency profile for expert `key`, or None when it should run for real."""
+    selected = {k.strip() for k in os.environ.get("CCRAS_SYNTHETIC_EXPERTS", "").split(",") if k.strip()}
+    if not ({"all", "*", key} & selected):
+        return None
+
+    profile = dict(SYNTHETIC_PROFILES.get(architecture, DEFAULT_PROFILE))
+    raw = os.environ.get("CCRAS_SYNTHETIC_PROFILE")
+    if raw:
+        try:
+            profile.update(json.loads(raw).get(key, {}))
+        except (ValueError, AttributeError) as e:
+            log.warning("Ignoring invalid CCRAS_SYNTHETIC_PROFILE: %s", e, extra={"expert": key})
+    return profile
+
+
+class SyntheticBackend:
+    def __init__(self, name, num_classes, median_ms, sigma, batch_scaling, seed=SYNTHETIC_SEED):
+        self.name = name
+        self.num_classes = num_classes
+        self.median = median_ms / 1000.0
+        self.sigma = sigma
+        self.batch_scaling = batch_scaling
+        self.seed = seed
+        self._rng = random.Random(f"{seed}:{name}")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_profile(cls, name, num_classes, profile):
+        return cls(name, num_classes, profile["median_ms"], profile["sigma"], profile["batch_scaling"])
+
+    def latency(self, batch_size):
+        with self._lock:
+            sample = self.median * math.exp(self.sigma * self._rng.gauss(0.0, 1.0))
+        return sample * (1.0 + self.batch_scaling * (batch_size - 1))
+
+    def predict(self, payloads):
+        """Returns (class_index, confidence) per payload after the simulated
+        batch latency. Runs on a bulkhead worker thread, never the event loop."""
+        delay = self.latency(len(payloads))
+        if delay > 0:
+            time.sleep(delay)
+        return [self._output(data) for data in payloads]
+
+    def _output(self, data):
+        digest = hashlib.sha256(f"{self.seed}:{self.name}:".encode() + data).digest()
+        rng = random.Random(digest)
+        logits = [rng.gauss(0.0, 1.0) for _ in range(self.num_classes)]
+        logits[rng.randrange(self.num_classes)] += 4.0
+        peak = max(logits)
+        weights = [math.exp(l - peak) for l in logits]
+        index = logits.index(peak)
+        return index, weights[index] / sum(weights)
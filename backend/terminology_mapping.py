@@ -0,0 +1,164 @@
+import json
+import threading
+
+from starlette.responses import StreamingResponse
+
+from catalog import TERMINOLOGY_INDEXES, field
+from metrics import TERMINOLOGY_MAPPINGS
+
+# Bulk label/code -> ICD-10/ICD-11/AYUSH mapping for EMR back-loads.
+#
+# Input is newline-delimited: either a bare label or code per line, or a JSON
+# object {"id": ..., "value": ..., "index": ...} per line. Output is one
+# NDJSON line per input, in input order. Historic diagnoses repeat heavily,
+# so the encoded answer for each (index, value) is cached for the catalog
+# version being served; a repeat costs one dict probe and a concatenation.
+AUTO_ORDER = ("name", "icd10", "icd11", "institutional", "ayurveda", "siddha", "unani")
+MAPPING_CACHE_SIZE = 200000
+MAX_LINE_BYTES = 4096
+UNMATCHED = '"matchedIndex":null,"mappings":[]'
+
+MAPPING_FIELDS = {
+    "srNo": ("srNo",),
+    "nameEnglish": ("nameEnglish",),
+    "icd10": ("who_icd10", "code"),
+    "icd11": ("who_icd11", "code"),
+    "institutionalCode": ("institutionalEntry", "code"),
+    "ayurveda": ("ayurveda", "term"),
+    "siddha": ("siddha", "term"),
+    "siddhaCode": ("siddha", "code"),
+    "unani": ("unani", "word"),
+    "unaniCode": ("unani", "code"),
+}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def mapping(record):
+    return {name: field(record, path) for name, path in MAPPING_FIELDS.items()}
+
+
+class TerminologyMapper:
+    def __init__(self, terminology):
+        self.terminology = terminology
+        self._cache = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self._counters = {result: TERMINOLOGY_MAPPINGS.labels(result)
+                          for result in ("matched", "unmatched", "invalid")}
+
+    def _resolve(self, pairs, cache):
+        """Fills `cache` for uncached (index, value) pairs. Lookups are
+        batched per index, so a chunk costs one catalog query per index
+        rather than one per value."""
+        by_index = {}
+        for index, value in pairs:
+            by_index.setdefault(index, []).append(value)
+        for index, values in by_index.items():
+            pending = list(dict.fromkeys(values))
+            for name in (AUTO_ORDER if index == "auto" else (index,)):
+                if not pending:
+                    break
+                found = self.terminology.lookup_many(name, pending)
+                for value, records in found.items():
+                    cache[(index, value)] = (f'"matchedIndex":{_dumps(name)},'
+                                             f'"mappings":{_dumps([mapping(r) for r in records])}')
+                pending = [value for value in pending if value not in found]
+            for value in pending:
+                cache[(index, value)] = UNMATCHED
+
+    def _parse(self, raw, default_index):
+        """(prefix, index, value) for a line, a ready error line, or None if blank."""
+        text = raw.decode("utf-8", "replace").strip()
+        if not text:
+            return None
+        prefix = ""
+        value, index = text, default_index
+        if text.startswith("{"):
+            try:
+                item = json.loads(text)
+                value = item["value"]
+                index = item.get("index", default_index)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return '{"error":"expected {\\"value\\": ...} or a bare label per line"}'
+            if "id" in item:
+                prefix = f'"id":{_dumps(item["id"])},'
+            if not isinstance(index, str) or (index != "auto" and index not in TERMINOLOGY_INDEXES):
+                return f'{{{prefix}"input":{_dumps(value)},"error":{_dumps(f"unknown index {index}")}}}'
+        if len(raw) > MAX_LINE_BYTES or not isinstance(value, str):
+            return f'{{{prefix}"error":"value must be a string of at most {MAX_LINE_BYTES} bytes"}}'
+        return prefix, index, value
+
+    def map_lines(self, lines, index="auto"):
+        """Maps a batch of raw input lines to NDJSON bytes."""
+        version = self.terminology.version
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._cache = {}
+                    self._version = version
+        parsed = [item for item in (self._parse(raw, index) for raw in lines) if item is not None]
+        # Other requests may replace self._cache (overflow, new version) at any
+        # point; this batch resolves into and reads from the one dict it took
+        cache = self._cache
+        missing = {(item[1], item[2]) for item in parsed
+                   if not isinstance(item, str) and (item[1], item[2]) not in cache}
+        if missing:
+            if len(cache) + len(missing) > MAPPING_CACHE_SIZE:
+                cache = self._cache = {}
+                missing = {(item[1], item[2]) for item in parsed if not isinstance(item, str)}
+            self._resolve(missing, cache)
+
+        out = []
+        matched = unmatched = invalid = 0
+        for item in parsed:
+            if isinstance(item, str):
+                out.append(item)
+                invalid += 1
+                continue
+            prefix, item_index, value = item
+            fragment = cache[(item_index, value)]
+            if fragment is UNMATCHED:
+                unmatched += 1
+            else:
+                matched += 1
+            out.append(f'{{{prefix}"input":{_dumps(value)},{fragment}}}')
+        for result, count in (("matched", matched), ("unmatched", unmatched), ("invalid", invalid)):
+            if count:
+                self._counters[result].inc(count)
+        return ("\n".join(out) + "\n").encode("utf-8") if out else b""
+
+    async def stream(self, chunks, run, index="auto"):
+        """Turns an async iterator of body chunks into NDJSON output chunks.
+        `run(fn, *args)` executes a batch off the event loop."""
+        pending = b""
+        async for chunk in chunks:
+            pending += chunk
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            if len(pending) > MAX_LINE_BYTES:
+                lines.append(pending)  # reported as an oversized value
+                pending = b""
+            if lines:
+                out = await run(self.map_lines, lines, index)
+                if out:
+                    yield out
+        if pending.strip():
+            out = await run(self.map_lines, [pending], index)
+            if out:
+                yield out
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """Streams output while the request body is still being read.
+    StreamingResponse watches receive() for a disconnect, which would swallow
+    the body chunks; here a disconnect surfaces from request.stream()."""
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
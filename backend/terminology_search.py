@@ -0,0 +1,256 @@
+import bisect
+import collections
+import itertools
+import re
+import time
+import unicodedata
+from array import array
+
+from catalog import VersionedBuild, field
+from log_config import get_logger
+
+# Autocomplete / fuzzy search over the clinical terminology.
+#
+# Every searchable value (English name, Devanagari, Tamil, Arabic, codes) is
+# one entry. Entries are found three ways:
+#   * prefix of the whole value (codes, names typed from the start),
+#   * prefix of any word in the value (multi-word queries match word-wise),
+#   * trigram overlap, for typos and partial matches mid-word.
+# The prefix indexes are flattened tries: sorted key arrays searched with
+# bisect, giving the same O(log n + k) prefix range as a node-per-character
+# trie at a fraction of the memory for tens of thousands of records.
+SEARCH_FIELDS = {
+    "name": ("nameEnglish",),
+    "devanagari": ("institutionalEntry", "nameDevnagari"),
+    "tamil": ("siddha", "word"),
+    "arabic": ("unani", "arabicTerm"),
+    "ayurveda": ("ayurveda", "term"),
+    "siddha": ("siddha", "term"),
+    "unani": ("unani", "word"),
+    "icd10": ("who_icd10", "code"),
+    "icd11": ("who_icd11", "code"),
+    "institutional": ("institutionalEntry", "code"),
+    "siddhaCode": ("siddha", "code"),
+    "unaniCode": ("unani", "code"),
+}
+CODE_FIELDS = {"icd10", "icd11", "institutional", "siddhaCode", "unaniCode"}
+MAX_PREFIX_POSTINGS = 2000   # cap on entries gathered from one short prefix
+TRIGRAM_BUDGET = 20000       # postings read for fuzzy matching, rarest trigrams first
+TRIGRAM_CANDIDATES = 200     # entries re-scored with exact trigram similarity
+PARTIAL_CANDIDATES = 200     # entries scored for a partial multi-word match
+DEFAULT_LIMIT = 10
+
+log = get_logger("terminology_search")
+
+# Arabic: drop tashkeel and tatweel, unify alef/yeh/teh marbuta variants
+ARABIC_FOLD = {**{c: None for c in range(0x064B, 0x0653)}, 0x0640: None,
+               ord("أ"): "ا", ord("إ"): "ا", ord("آ"): "ا", ord("ى"): "ي", ord("ة"): "ه"}
+_SPLIT = re.compile(r"[\s,;:()\[\]/\\\-–—.'\"]+")
+
+
+def fold(text):
+    """NFKC + case folding, Latin diacritics stripped (so 'Sehat' matches
+    'Séhat'), Arabic variants unified. Indic vowel signs are kept because
+    they are part of the word."""
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    if text.isascii():
+        return " ".join(text.split())
+    text = text.translate(ARABIC_FOLD)
+    out = []
+    latin_base = False
+    for ch in unicodedata.normalize("NFD", text):
+        if unicodedata.combining(ch):
+            if latin_base:
+                continue
+        else:
+            latin_base = ch < "ɐ"
+        out.append(ch)
+    return " ".join(unicodedata.normalize("NFC", "".join(out)).split())
+
+
+def tokens(folded):
+    return [t for t in _SPLIT.split(folded) if t]
+
+
+def trigrams(folded):
+    padded = f" {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PrefixIndex:
+    """Sorted keys with parallel posting arrays; prefix() walks one bisect range."""
+
+    def __init__(self, postings):
+        self.keys = sorted(postings)
+        self.postings = [postings[k] for k in self.keys]
+
+    def prefix(self, value, cap=MAX_PREFIX_POSTINGS):
+        start = bisect.bisect_left(self.keys, value)
+        end = bisect.bisect_left(self.keys, value + "\U0010ffff", start)
+        gathered = 0
+        for i in range(start, end):
+            yield self.keys[i], self.postings[i]
+            gathered += len(self.postings[i])
+            if gathered >= cap:
+                return
+
+
+class SearchIndex:
+    def __init__(self, records, version=None):
+        started = time.perf_counter()
+        self.version = version
+        self.records = []            # compact summaries returned with results
+        self.entry_record = array("I")
+        self.entry_field = []
+        self.entry_text = []
+        self.entry_folded = []
+        self.entry_trigrams = array("H")
+        full, words, grams = {}, collections.defaultdict(list), collections.defaultdict(lambda: array("I"))
+
+        for record in records:
+            record_id = len(self.records)
+            self.records.append(summarize(record))
+            for name, path in SEARCH_FIELDS.items():
+                value = field(record, path)
+                if value in (None, ""):
+                    continue
+                text = str(value)
+                folded = fold(text)
+                entry = len(self.entry_text)
+                self.entry_record.append(record_id)
+                self.entry_field.append(name)
+                self.entry_text.append(text)
+                self.entry_folded.append(folded)
+                full.setdefault(folded, []).append(entry)
+                if name in CODE_FIELDS:
+                    self.entry_trigrams.append(0)
+                    continue
+                for word in set(tokens(folded)):
+                    words[word].append(entry)
+                entry_grams = trigrams(folded)
+                self.entry_trigrams.append(min(len(entry_grams), 65535))
+                for gram in entry_grams:
+                    grams[gram].append(entry)
+
+        self.full = PrefixIndex({k: array("I", v) for k, v in full.items()})
+        self.words = PrefixIndex({k: array("I", v) for k, v in words.items()})
+        self.trigrams = dict(grams)
+        self.build_seconds = time.perf_counter() - started
+
+    def search(self, query, limit=DEFAULT_LIMIT, fields=None):
+        """Scores fall in tiers: whole-value prefix (0.9-1.0) > every query
+        word prefixes a word (0.8) > some words do (<0.8) > trigram
+        similarity (<=0.7). A tier that already fills `limit` records ends
+        the search, because later tiers cannot outrank it."""
+        folded = fold(query)
+        if not folded:
+            return []
+        best = {}  # record_id -> (score, entry)
+
+        entry_record, entry_field = self.entry_record, self.entry_field
+
+        def offer(entries, score):
+            for entry in entries:
+                if fields and entry_field[entry] not in fields:
+                    continue
+                record_id = entry_record[entry]
+                current = best.get(record_id)
+                if current is None or score > current[0]:
+                    best[record_id] = (score, entry)
+
+        # tier 1: whole-value prefix, exact match 1.0, longer values slightly lower
+        for key, postings in self.full.prefix(folded):
+            offer(postings, 0.9 + 0.1 * len(folded) / len(key))
+
+        # tier 2: word-wise prefix. Entries matching every query word come
+        # from a set intersection; partial matches are scored on a bounded
+        # sample drawn from the rarest word.
+        query_words = list(dict.fromkeys(tokens(folded)))
+        if len(best) < limit and query_words:
+            matched = []
+            for word in query_words:
+                entries = set()
+                for _, postings in self.words.prefix(word):
+                    entries.update(postings[:MAX_PREFIX_POSTINGS - len(entries)])
+                matched.append(entries)
+            matched.sort(key=len)
+            everywhere = set.intersection(*matched)
+            offer(everywhere, 0.8)
+            if len(best) < limit and len(query_words) > 1:
+                for entry in itertools.islice(matched[0] - everywhere, PARTIAL_CANDIDATES):
+                    entry_words = tokens(self.entry_folded[entry])
+                    hits = sum(1 for word in query_words if any(w.startswith(word) for w in entry_words))
+                    offer((entry,), 0.8 * hits / len(query_words))
+
+        # tier 3: trigram similarity (Jaccard) for typos and infix matches.
+        # Candidates come from the rarest trigrams within a fixed budget of
+        # postings, then the best of them are scored exactly.
+        if len(best) < limit and len(folded) >= 3:
+            query_grams = trigrams(folded)
+            overlap = collections.Counter()
+            budget = TRIGRAM_BUDGET
+            for postings in sorted((self.trigrams[g] for g in query_grams if g in self.trigrams), key=len):
+                if budget <= 0:
+                    break
+                overlap.update(postings[:budget])
+                budget -= len(postings)
+            for entry, _ in overlap.most_common(TRIGRAM_CANDIDATES):
+                shared = len(query_grams & trigrams(self.entry_folded[entry]))
+                jaccard = shared / (len(query_grams) + self.entry_trigrams[entry] - shared)
+                if jaccard >= 0.2:
+                    offer((entry,), 0.7 * jaccard)
+
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1][0], len(self.entry_text[kv[1][1]]), kv[0]))
+        return [{
+            "score": round(score, 4),
+            "matchedField": self.entry_field[entry],
+            "matchedText": self.entry_text[entry],
+            **self.records[record_id],
+        } for record_id, (score, entry) in ranked[:limit]]
+
+
+def summarize(record):
+    return {
+        "srNo": record.get("srNo"),
+        "nameEnglish": record.get("nameEnglish"),
+        "nameDevnagari": field(record, ("institutionalEntry", "nameDevnagari")),
+        "institutionalCode": field(record, ("institutionalEntry", "code")),
+        "ayurveda": field(record, ("ayurveda", "term")),
+        "siddha": field(record, ("siddha", "word")),
+        "unani": field(record, ("unani", "arabicTerm")),
+        "icd10": field(record, ("who_icd10", "code")),
+        "icd11": field(record, ("who_icd11", "code")),
+    }
+
+
+class TerminologySearch:
+    """Holds the search index for the terminology version currently served,
+    rebuilding it in the background when a new catalog version is published."""
+
+    def __init__(self, terminology):
+        self.terminology = terminology
+        self._index = VersionedBuild(terminology, self._build, "ccras-search-index")
+
+    def _build(self, version):
+        index = SearchIndex(self.terminology.iter_records(), version)
+        log.info("Terminology search index built", extra={
+            "version": version, "records": len(index.records), "entries": len(index.entry_text),
+            "buildSeconds": round(index.build_seconds, 3)})
+        return index
+
+    def index(self):
+        return self._index.get()
+
+    def warm(self):
+        self._index.warm()
+
+    def search(self, query, limit=DEFAULT_LIMIT, fields=None):
+        started = time.perf_counter()
+        index = self.index()
+        results = index.search(query, limit, fields)
+        return {
+            "query": query,
+            "version": index.version,
+            "tookMs": round((time.perf_counter() - started) * 1000, 3),
+            "results": results,
+        }
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from catalog import VersionedBuild
+from log_config import get_logger
+
+# Whole-catalog snapshots for client-side caching. A snapshot is serialised
+# and gzipped once per catalog version and served with a strong ETag, so a
+# client revalidates with If-None-Match for the cost of a 304. A client that
+# holds an older version asks for ?since=<version> and receives only the
+# records added or changed since then plus the srNos that were removed.
+# Deltas are built against any version whose record hashes are still known:
+# versions served earlier by this process, or versions the catalog keeps on
+# disk. Anything older gets the full snapshot.
+COMPRESS_LEVEL = 6
+RETAINED_VERSIONS = 8    # record-hash tables kept for delta bases
+RETAINED_DELTAS = 16
+
+log = get_logger("terminology_snapshot")
+
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _record_key(record, data):
+    key = record.get("srNo")
+    return key if key is not None else _digest(data)
+
+
+class Representation:
+    """One gzipped body with its strong ETags (the identity and gzip
+    encodings are different bytes, so they carry different tags)."""
+
+    def __init__(self, body, version, kind, since=None):
+        self.version = version
+        self.kind = kind
+        self.since = since
+        self.size = len(body)
+        self.compressed = gzip.compress(body, COMPRESS_LEVEL, mtime=0)
+        tag = _digest(body)
+        self.etag = f'"{tag}"'
+        self.gzip_etag = f'"{tag}-gzip"'
+
+    def headers(self, gzipped):
+        headers = {
+            "ETag": self.gzip_etag if gzipped else self.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+            "X-Terminology-Version": str(self.version),
+            "X-Snapshot-Kind": self.kind,
+        }
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        return headers
+
+    def body(self, gzipped):
+        return self.compressed if gzipped else gzip.decompress(self.compressed)
+
+
+def _hashes(records):
+    return {_record_key(record, data): _digest(data) for record, data in ((r, _encode(r)) for r in records)}
+
+
+class SnapshotService:
+    def __init__(self, terminology):
+        self.terminology = terminology
+        self._full = VersionedBuild(terminology, self._build, "ccras-snapshot")
+        self._hashes = {}   # version -> {record key: content hash}
+        self._deltas = {}   # (since, version) -> Representation
+        self._lock = threading.Lock()
+
+    def _build(self, version):
+        started = time.perf_counter()
+        parts, hashes = [], {}
+        for record in self.terminology.iter_records():
+            data = _encode(record)
+            parts.append(data)
+            hashes[_record_key(record, data)] = _digest(data)
+        body = b'{"version":' + json.dumps(version).encode() + b',"records":[' + b",".join(parts) + b"]}"
+        full = Representation(body, version, "full")
+        with self._lock:
+            # Stored before the snapshot is served, since deltas to it read them
+            self._hashes[version] = hashes
+            while len(self._hashes) > RETAINED_VERSIONS:
+                self._hashes.pop(next(iter(self._hashes)))
+        log.info("Terminology snapshot built", extra={
+            "version": version, "records": len(parts), "bytes": len(body),
+            "gzipBytes": len(full.compressed), "buildSeconds": round(time.perf_counter() - started, 3)})
+        return full
+
+    def _snapshot(self):
+        return self._full.get()
+
+    def _base_hashes(self, since):
+        hashes = self._hashes.get(since)
+        if hashes is None:
+            records = self.terminology.version_records(since)
+            if records is not None:
+                hashes = _hashes(records)
+                with self._lock:
+                    self._hashes.setdefault(since, hashes)
+        return hashes
+
+    def _delta(self, since, full):
+        key = (since, full.version)
+        delta = self._deltas.get(key)
+        if delta is not None:
+            return delta
+        base = self._base_hashes(since)
+        if base is None:
+            return None
+        current = self._hashes[full.version]
+        changed = {k for k, h in current.items() if base.get(k) != h}
+        deleted = [k for k in base if k not in current]
+        upserts = []
+        if changed:
+            for record in self.terminology.iter_records():
+                data = _encode(record)
+                if _record_key(record, data) in changed:
+                    upserts.append(data)
+        body = (b'{"version":' + json.dumps(full.version).encode() + b',"since":' + json.dumps(since).encode()
+                + b',"upserts":[' + b",".join(upserts) + b'],"deletes":' + json.dumps(deleted).encode() + b"}")
+        delta = Representation(body, full.version, "delta", since)
+        with self._lock:
+            if len(self._deltas) >= RETAINED_DELTAS:
+                self._deltas.pop(next(iter(self._deltas)))
+            self._deltas[key] = delta
+        return delta
+
+    def get(self, since=None):
+        """The representation to serve: a delta from `since` when one can be
+        built, else the full snapshot."""
+        full = self._snapshot()
+        if since:
+            delta = self._delta(since, full)
+            if delta is not None:
+                return delta
+        return full
+
+    def warm(self):
+        self._full.warm()
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of If-None-Match against a strong ETag (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (t.strip() for t in if_none_match.split(","))
+    return any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
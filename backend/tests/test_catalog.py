@@ -0,0 +1,83 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import catalog
+from catalog import ClinicalCatalog, FrozenDict, VersionedBuild
+
+
+class Terminology:
+    def __init__(self, version):
+        self.version = version
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_versioned_build_serves_previous_build_while_rebuilding():
+    terminology = Terminology("v1")
+    release = threading.Event()
+    builds = []
+
+    def build(version):
+        builds.append(version)
+        if version != "v1":
+            release.wait(5)
+        return SimpleNamespace(version=version)
+
+    versioned = VersionedBuild(terminology, build, "test-build")
+    assert versioned.get().version == "v1"
+
+    terminology.version = "v2"
+    started = time.perf_counter()
+    for _ in range(20):
+        assert versioned.get().version == "v1"
+    assert time.perf_counter() - started < 1.0
+    release.set()
+    wait_for(lambda: versioned.get().version == "v2")
+    assert builds == ["v1", "v2"]
+
+
+def test_versioned_build_keeps_serving_when_a_rebuild_fails():
+    terminology = Terminology("v1")
+
+    def build(version):
+        if version == "broken":
+            raise RuntimeError("bad catalog")
+        return SimpleNamespace(version=version)
+
+    versioned = VersionedBuild(terminology, build, "test-build")
+    versioned.get()
+    terminology.version = "broken"
+    assert versioned.get().version == "v1"
+    wait_for(lambda: not versioned._rebuilding)
+    assert versioned.get().version == "v1"
+    terminology.version = "v3"
+    versioned.get()
+    wait_for(lambda: versioned.get().version == "v3")
+
+
+def test_build_refuses_to_rewrite_an_existing_version(tmp_path):
+    catalog.build_catalog(catalog.synthetic_entries(20), "2026.10", tmp_path)
+    with pytest.raises(FileExistsError):
+        catalog.build_catalog(catalog.synthetic_entries(20, seed=1), "2026.10", tmp_path)
+    first = catalog.build_catalog(catalog.synthetic_entries(20), None, tmp_path)
+    second = catalog.build_catalog(catalog.synthetic_entries(20), None, tmp_path)
+    assert first != second
+    assert catalog.current_catalog(tmp_path) == second
+
+
+def test_lookup_many_returns_frozen_records_like_lookup(tmp_path):
+    catalog.build_catalog(catalog.synthetic_entries(20), "v1", tmp_path)
+    clinical = ClinicalCatalog(tmp_path)
+    one = clinical.lookup("icd10", "B00.1")
+    many = clinical.lookup_many("icd10", ["B00.1", "Z99.9"])
+    assert list(many) == ["B00.1"]
+    assert many["B00.1"] == one
+    assert all(isinstance(record, FrozenDict) for record in many["B00.1"])
@@ -0,0 +1,226 @@
+import asyncio
+
+import httpx
+import pytest
+
+import consultation
+import llm_stub_server
+from consultation import ConsultationService
+
+IMAGE = b"\xff\xd8 synthetic scan \xff\xd9"
+ENDPOINT = "http://llm-stub/v1beta"
+
+
+@pytest.fixture(autouse=True)
+def stub():
+    llm_stub_server.reset()
+    yield llm_stub_server
+    llm_stub_server.reset()
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Records backoff sleeps instead of waiting them out. asyncio is one
+    module, so the stub's own zero-latency sleeps pass through here too and
+    are left out."""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds):
+        if seconds > 0:
+            recorded.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(consultation.asyncio, "sleep", sleep)
+    return recorded
+
+
+def service(transport=None, **kwargs):
+    return ConsultationService(endpoint=ENDPOINT, api_key="test-key",
+                               transport=transport or httpx.ASGITransport(app=llm_stub_server.app), **kwargs)
+
+
+async def consult(svc, image=IMAGE, scan_type="knee-xray", prompts=None):
+    try:
+        return await svc.consult(image, scan_type, prompts)
+    finally:
+        await svc.close()
+
+
+class FlakyTransport(httpx.AsyncBaseTransport):
+    """Raises `error` for the first `failures` requests, then reaches the stub."""
+
+    def __init__(self, failures, error=httpx.ConnectError):
+        self.failures = failures
+        self.error = error
+        self.inner = httpx.ASGITransport(app=llm_stub_server.app)
+
+    async def handle_async_request(self, request):
+        if self.failures > 0:
+            self.failures -= 1
+            raise self.error("stub failure", request=request)
+        return await self.inner.handle_async_request(request)
+
+
+def test_consults_every_prompt(stub):
+    result = asyncio.run(consult(service()))
+    assert set(result["consultations"]) == set(consultation.PROMPTS)
+    gemini = result["consultations"]["gemini"]
+    assert gemini["cached"] is False
+    assert gemini["answer"]["icdCode"] == "Z00.0"
+    assert "icdCode" not in result["consultations"]["medgemma"]["answer"]
+    assert stub.stats["calls"] == 2
+
+
+def test_cache_hit_then_ttl_expiry(stub, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(consultation.time, "monotonic", lambda: now[0])
+    svc = service(cache_ttl=60)
+
+    async def run():
+        first = await svc.consult(IMAGE, "knee-xray", ["gemini"])
+        second = await svc.consult(IMAGE, "knee-xray", ["gemini"])
+        now[0] += 61
+        third = await svc.consult(IMAGE, "knee-xray", ["gemini"])
+        await svc.close()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first["consultations"]["gemini"]["cached"] is False
+    assert second["consultations"]["gemini"] == {"answer": first["consultations"]["gemini"]["answer"],
+                                                 "cached": True}
+    assert third["consultations"]["gemini"]["cached"] is False
+    assert stub.stats["calls"] == 2
+
+
+def test_cache_key_includes_image_and_scan_type(stub):
+    svc = service()
+
+    async def run():
+        await svc.consult(IMAGE, "knee-xray", ["gemini"])
+        await svc.consult(IMAGE + b"x", "knee-xray", ["gemini"])
+        await svc.consult(IMAGE, "ct-scan", ["gemini"])
+        await svc.close()
+
+    asyncio.run(run())
+    assert stub.stats["calls"] == 3
+
+
+def test_concurrent_identical_calls_share_one_upstream_request(stub):
+    stub.config["latency"] = 0.05
+    svc = service()
+
+    async def run():
+        results = await asyncio.gather(*(svc.consult(IMAGE, "chest-xray", ["medgemma"]) for _ in range(10)))
+        await svc.close()
+        return results
+
+    results = asyncio.run(run())
+    assert stub.stats["calls"] == 1
+    shared = [r["consultations"]["medgemma"]["shared"] for r in results]
+    assert shared.count(False) == 1 and shared.count(True) == 9
+    assert len({r["consultations"]["medgemma"]["answer"]["reasoning"] for r in results}) == 1
+
+
+def test_concurrency_cap(stub):
+    stub.config["latency"] = 0.05
+    svc = service(concurrency=2)
+
+    async def run():
+        await asyncio.gather(*(svc.consult(bytes([i]) * 16, "ct-scan", ["medgemma"]) for i in range(8)))
+        await svc.close()
+
+    asyncio.run(run())
+    assert stub.stats["calls"] == 8
+    assert stub.stats["maxInflight"] == 2
+
+
+def test_retries_429_and_503_with_backoff(stub, delays):
+    stub.scripted.extend([429, 503, 503])
+    result = asyncio.run(consult(service(retries=3), prompts=["gemini"]))
+    assert "answer" in result["consultations"]["gemini"]
+    assert stub.stats["calls"] == 4
+    # Retry-After from the 429, then jittered exponential backoff by attempt
+    base = consultation.LLM_BACKOFF_SECONDS
+    assert delays[0] == pytest.approx(0.1)
+    assert base * 2 * 0.5 <= delays[1] <= base * 2 * 1.5
+    assert base * 4 * 0.5 <= delays[2] <= base * 4 * 1.5
+
+
+def test_gives_up_after_retries(stub, delays):
+    stub.scripted.extend([503] * 5)
+    result = asyncio.run(consult(service(retries=2), prompts=["gemini"]))
+    assert result["consultations"]["gemini"] == {"error": "LLM endpoint returned 503"}
+    assert stub.stats["calls"] == 3
+    assert len(delays) == 2
+
+
+def test_client_errors_are_not_retried(stub, delays):
+    stub.scripted.append(400)
+    result = asyncio.run(consult(service(), prompts=["gemini"]))
+    assert "error" in result["consultations"]["gemini"]
+    assert stub.stats["calls"] == 1
+    assert delays == []
+
+
+def test_retries_transport_errors(stub, delays):
+    result = asyncio.run(consult(service(FlakyTransport(2), retries=3), prompts=["gemini"]))
+    assert "answer" in result["consultations"]["gemini"]
+    assert stub.stats["calls"] == 1
+    assert len(delays) == 2
+
+
+def test_other_http_errors_fail_cleanly(stub, delays):
+    svc = service(FlakyTransport(1, error=httpx.DecodingError))
+
+    async def run():
+        results = await asyncio.gather(*(svc.consult(IMAGE, "knee-xray", ["gemini"]) for _ in range(3)))
+        await svc.close()
+        return results
+
+    for result in asyncio.run(run()):
+        assert result["consultations"]["gemini"]["error"].startswith("LLM request failed: DecodingError")
+    assert delays == []
+
+
+def test_failures_are_not_cached(stub, delays):
+    stub.scripted.append(400)
+    svc = service()
+
+    async def run():
+        first = await svc.consult(IMAGE, "knee-xray", ["gemini"])
+        second = await svc.consult(IMAGE, "knee-xray", ["gemini"])
+        await svc.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert "error" in first["consultations"]["gemini"]
+    assert second["consultations"]["gemini"]["cached"] is False
+
+
+def test_rejects_unknown_scan_type_and_prompt():
+    with pytest.raises(consultation.UnknownConsultation):
+        asyncio.run(consult(service(), scan_type="foot"))
+    with pytest.raises(consultation.UnknownConsultation):
+        consultation.parse_prompts("gemini,gpt")
+    assert consultation.parse_prompts(" medgemma ,medgemma") == ["medgemma"]
+
+
+def test_consult_endpoint_returns_502_when_every_prompt_fails(stub, delays, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "consultations", service(retries=0))
+    stub.scripted.extend([503, 503])
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://ccras") as client:
+            return await client.post("/consult", files={"file": ("scan.jpg", IMAGE, "image/jpeg")},
+                                     data={"scan_type": "knee-xray"})
+
+    response = asyncio.run(post())
+    assert response.status_code == 502
+    assert response.json()["detail"] == "LLM endpoint returned 503"
+
+    stub.scripted.append(503)  # one prompt fails, the other answers
+    response = asyncio.run(post())
+    assert response.status_code == 200
+    assert sum("error" in c for c in response.json()["consultations"].values()) == 1
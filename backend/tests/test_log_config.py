@@ -0,0 +1,26 @@
+import json
+import logging
+import queue
+
+from log_config import JsonFormatter, StructuredQueueHandler
+
+
+def test_exception_reaches_the_listener_as_its_own_field():
+    records = queue.SimpleQueue()
+    handler = StructuredQueueHandler(records)
+    logger = logging.getLogger("tests.log_config")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.error("Failed %s", "badly", exc_info=True)
+    finally:
+        logger.removeHandler(handler)
+
+    record = records.get_nowait()
+    record.trace_id = record.request = None
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["msg"] == "Failed badly"
+    assert entry["exc"].startswith("Traceback") and "ZeroDivisionError" in entry["exc"]
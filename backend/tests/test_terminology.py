@@ -0,0 +1,21 @@
+from catalog import ClinicalCatalog, build_catalog
+from gemini_service import CatalogTerminology, TerminologyStore
+
+ENTRY = {"srNo": 1, "nameEnglish": "Sandhi Shotha", "ayurveda": {"term": "Sandhi Shotha"},
+         "who_icd10": {"code": "M25.4"}}
+
+
+def test_icd_description_falls_back_to_the_query():
+    store = TerminologyStore([ENTRY])
+    entry = store.first("name", "sandhi  SHOTHA")
+    assert store.icd_codes(entry, "sandhi  SHOTHA")["description"] == "sandhi  SHOTHA"
+    assert store.icd_codes(entry, "Sandhi Shotha")["description"] == "Sandhi Shotha"
+    assert store.icd_codes(entry, "x")["icd_code"] == "M25.4"
+
+
+def test_catalog_terminology_shares_the_store_interface(tmp_path):
+    build_catalog([ENTRY], "v1", tmp_path)
+    store = CatalogTerminology(ClinicalCatalog(tmp_path))
+    assert store.records == ()
+    found = store.lookup_many("icd10", ["m25.4"])
+    assert store.icd_codes(found["m25.4"][0], "m25.4")["description"] == "m25.4"
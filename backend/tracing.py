@@ -0,0 +1,245 @@
+import collections
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+# Per-request tracing. A Trace lives in a context variable for the lifetime of
+# one request (or async job) and collects flat spans with offsets from the
+# request start. Work handed to bulkhead threads carries the context with it
+# via propagate(). Finished traces go to an in-memory ring buffer for
+# GET /traces and, through a queue listener thread, to a rotating JSONL file.
+TRACING_ENABLED = os.getenv("CCRAS_TRACING", "1").lower() not in ("0", "false", "off")
+TRACE_FILE = os.getenv("CCRAS_TRACE_FILE", os.path.join("traces", "traces.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("CCRAS_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("CCRAS_TRACE_BACKUPS", "5"))
+TRACE_BUFFER = int(os.getenv("CCRAS_TRACE_BUFFER", "200"))
+TRACE_HEADER = "X-Trace-Id"
+UNTRACED_PREFIXES = ("/static", "/metrics", "/traces")
+
+_TRACE_ID = re.compile(r"^[0-9a-fA-F-]{8,64}$")
+_current = contextvars.ContextVar("ccras_trace", default=None)
+_recent = collections.deque(maxlen=TRACE_BUFFER)
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "started_at", "_origin", "spans", "attrs", "duration")
+
+    def __init__(self, name, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+        self.duration = None
+
+    def record(self, name, start, end, **attrs):
+        """Adds a span from two perf_counter() readings."""
+        self.spans.append((name, start - self._origin, end - start, threading.current_thread().name, attrs))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._origin
+        _recent.append(self)
+        _writer.write(self.to_dict())
+
+    def server_timing(self):
+        """Server-Timing header value, summing repeated span names."""
+        totals = {}
+        for name, _, duration, _, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        entries = [f"{name};dur={duration * 1000:.2f}" for name, duration in totals.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self._origin) * 1000:.2f}")
+        return ", ".join(entries)
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "name": self.name,
+            "startedAt": self.started_at,
+            "durationMs": round((self.duration or 0.0) * 1000, 3),
+            **self.attrs,
+            "spans": [
+                {"name": name, "startMs": round(offset * 1000, 3), "durationMs": round(duration * 1000, 3),
+                 "thread": thread, **attrs}
+                for name, offset, duration, thread, attrs in sorted(self.spans, key=lambda s: s[1])
+            ],
+        }
+
+
+def current():
+    return _current.get()
+
+
+def record(name, start, end, **attrs):
+    """Records a span on the current trace; a no-op outside a traced request."""
+    trace = _current.get()
+    if trace is not None:
+        trace.record(name, start, end, **attrs)
+
+
+class span:
+    """Times a block as a span on the current trace."""
+    __slots__ = ("name", "attrs", "_trace", "_start")
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self._trace = _current.get()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._trace is not None:
+            self._trace.record(self.name, self._start, time.perf_counter(), **self.attrs)
+        return False
+
+
+def propagate(fn):
+    """Binds fn to the caller's context so spans recorded on a worker thread
+    land on the submitting request's trace. The time until the worker picks
+    it up is recorded as a `queue` span."""
+    trace = _current.get()
+    if trace is None:
+        return fn
+    ctx = contextvars.copy_context()
+    enqueued = time.perf_counter()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        trace.record("queue", enqueued, time.perf_counter())
+        return ctx.run(fn, *args, **kwargs)
+    return run
+
+
+class traced:
+    """Starts a trace for work outside an HTTP request, e.g. an async job."""
+
+    def __init__(self, name, trace_id=None, **attrs):
+        self.trace = Trace(name, trace_id) if TRACING_ENABLED else None
+        if self.trace is not None:
+            self.trace.attrs.update(attrs)
+
+    def __enter__(self):
+        if self.trace is not None:
+            self._token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            _current.reset(self._token)
+            self.trace.finish()
+        return False
+
+
+def recent(limit=50):
+    return [t.to_dict() for t in list(_recent)[-limit:]][::-1]
+
+
+def find(trace_id):
+    for trace in reversed(list(_recent)):
+        if trace.trace_id == trace_id:
+            return trace.to_dict()
+    return None
+
+
+def incoming_trace_id(headers):
+    """Accepts X-Trace-Id or the trace-id field of a W3C traceparent header."""
+    value = headers.get(TRACE_HEADER.lower().encode())
+    if value is None:
+        parent = headers.get(b"traceparent", b"").decode("latin-1").split("-")
+        value = parent[1].encode() if len(parent) == 4 else None
+    if value is not None:
+        value = value.decode("latin-1")
+        if _TRACE_ID.match(value):
+            return value
+    return None
+
+
+class TraceWriter:
+    """Hands finished traces to a QueueListener that appends them to a
+    rotating file, so the request never waits on disk."""
+
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.SimpleQueue()
+        self._listener = None
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("ccras.traces")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+    def _start(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._listener = logging.handlers.QueueListener(self._queue, handler)
+            self._listener.start()
+            self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+
+    def write(self, record):
+        if self._listener is None:
+            self._start()
+        self._logger.info(json.dumps(record, default=str))
+
+    def stop(self):
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+                self._logger.handlers.clear()
+
+
+_writer = TraceWriter(TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUPS)
+
+
+def shutdown():
+    _writer.stop()
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: opens a trace per request, adds Server-Timing
+    and X-Trace-Id to the response and records the finished trace."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (not TRACING_ENABLED or scope["type"] != "http"
+                or scope["path"].startswith(UNTRACED_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}", incoming_trace_id(dict(scope["headers"])))
+        trace.attrs.update({"method": scope["method"], "path": scope["path"]})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.attrs["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode()))
+                headers.append((TRACE_HEADER.lower().encode(), trace.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.finish()
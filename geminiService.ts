@@ -1,7 +1,6 @@
 
-import { GoogleGenAI, Type } from "@google/genai";
 import { ScanType, DiagnosisResult, ModelComparison, InfoTabContent } from "./types";
-import { getLocalPrediction } from "./services/apiService";
+import { getLocalPrediction, getConsultations } from "./services/apiService";
 
 /**
  * Multi-Model Diagnostic Engine
@@ -11,52 +10,18 @@ export const runAIDiagnosis = async (
   image: string,
   scanType: ScanType
 ): Promise<DiagnosisResult> => {
-  const base64Data = image.split(',')[1];
-  
   // 1. Kick off Local Prediction
   const localPromise = getLocalPrediction(image, scanType);
 
-  // 2. Prepare Gemini & MedGemma (via separate prompts for specialization)
-  const ai = new GoogleGenAI({ apiKey: process.env.API_KEY });
-  const modelName = "gemini-3-pro-preview";
-  
-  const visionPart = {
-    inlineData: { data: base64Data, mimeType: "image/jpeg" },
-  };
-
-  // MEDGEMMA PROMPT (Focuses on evidence-based medicine and clinical guidelines)
-  const medGemmaPrompt = `
-    Analyze as MedGemma Expert (Medical-Gemma fine-tuned model).
-    Scan Type: ${scanType}.
-    Focus: Clinical signs, differential diagnosis, and medical necessity.
-    Structure: JSON with { prediction, confidence, reasoning }.
-  `;
-
-  // GEMINI PROMPT (Focuses on Institutional standards and AYUSH integration)
-  const geminiPrompt = `
-    Analyze as CCRAS Institutional Consultant.
-    Scan Type: ${scanType}.
-    Focus: Radiological findings, ICD-10 codes, and AYUSH (Ayurveda) mapping.
-    Structure: JSON with { prediction, confidence, icdCode, ayurCode, reasoning, clinical_info }.
-  `;
+  // 2. Gemini & MedGemma consultations, run by the backend proxy
+  // (cached per image and prompt, API key kept server-side)
+  const consultPromise = getConsultations(image, scanType);
 
   try {
-    const [localData, geminiRes, medGemmaRes] = await Promise.all([
-      localPromise,
-      ai.models.generateContent({
-        model: modelName,
-        contents: { parts: [visionPart, { text: geminiPrompt }] },
-        config: { responseMimeType: "application/json" },
-      }),
-      ai.models.generateContent({
-        model: modelName,
-        contents: { parts: [visionPart, { text: medGemmaPrompt }] },
-        config: { responseMimeType: "application/json" },
-      })
-    ]);
+    const [localData, consult] = await Promise.all([localPromise, consultPromise]);
 
-    const geminiParsed = JSON.parse(geminiRes.text || '{}');
-    const medGemmaParsed = JSON.parse(medGemmaRes.text || '{}');
+    const geminiParsed: any = consult.consultations.gemini?.answer || {};
+    const medGemmaParsed: any = consult.consultations.medgemma?.answer || {};
 
     // Consolidate Comparisons
     const comparisons: ModelComparison[] = [
@@ -92,3 +92,38 @@ export const getLocalPrediction = async (
     return null;
   }
 };
+
+export interface ConsultationResult {
+  answer?: Record<string, any>;
+  error?: string;
+  cached?: boolean;
+  shared?: boolean;
+}
+
+export interface ConsultationResponse {
+  model: string;
+  imageSha256: string;
+  scanType: ScanType;
+  consultations: Record<string, ConsultationResult>;
+}
+
+// LLM second opinions, proxied and cached by the backend (POST /consult)
+export const getConsultations = async (
+  base64Image: string,
+  scanType: ScanType
+): Promise<ConsultationResponse> => {
+  const blob = await (await fetch(base64Image)).blob();
+  const formData = new FormData();
+  formData.append('file', blob, 'scan.jpg');
+  formData.append('scan_type', scanType);
+
+  const response = await fetch(`${LOCAL_API_URL}/consult`, {
+    method: 'POST',
+    body: formData,
+    signal: AbortSignal.timeout(120000)
+  });
+  if (!response.ok) {
+    throw new Error(`Consultation failed (${response.status})`);
+  }
+  return response.json();
+};